@@ -1 +1,93 @@
-API_FUNC_FILE_NAME = 'api_func_set'
\ No newline at end of file
+API_FUNC_FILE_NAME = 'api_func_set'
+ROUTE_MANIFEST_PATH = '.route_manifest.json'  # 路由清单的缓存文件，api 函数文件没有修改时按清单启动，None 表示每次启动都完整扫描
+API_IMPORT_MODE = 'eager'  # 'eager': 启动时在主进程中引入所有 api 模块；'lazy': 启动时只用 ast 静态扫描路由，api 模块在第一次被请求时才引入
+
+# HTTP 长连接（keep-alive）配置
+KEEP_ALIVE_TIMEOUT = 5  # 长连接空闲超时时间（秒），超过该时间没有新请求则关闭连接
+KEEP_ALIVE_MAX_REQUESTS = 100  # 单个连接最多处理的请求数量，达到后关闭连接，防止单连接长期占用
+
+# HTTP 请求解析配置
+MAX_HEADER_SIZE = 64 * 1024  # 请求行 + 请求头的最大字节数，超过后返回 431
+PIPELINE_MAX_REQUESTS = 16  # 单个连接上已解析、等待处理的流水线请求数量上限，达到后暂停读取，利用 TCP 背压限制客户端
+
+# api 函数执行配置
+HANDLER_THREAD_POOL_SIZE = 8  # 每个 HTTP 进程中用于执行 executor="thread" 的 api 函数的线程数量
+PROCESS_POOL_SIZE = None  # 共享进程池的进程数量，用于执行 executor="process" 的 api 函数，None 表示使用为特殊任务保留的 CPU 核心数量
+PROCESS_POOL_QUEUE_DEPTH = 256  # 共享进程池中排队等待执行的任务数量上限，队列已满时直接返回 503
+PROCESS_POOL_TASK_TIMEOUT = 60  # executor="process" 的 api 函数从提交到返回结果的时限（秒），超时返回 504，正在执行的进程池进程会被强制结束并重启
+
+# 响应压缩配置
+COMPRESSION_MIN_SIZE = 1024  # 最小压缩长度（字节），小于该长度的响应体不压缩
+COMPRESSION_LEVEL = 6  # 压缩级别 1-9，级别越高压缩率越高、越耗 CPU
+COMPRESSION_THREAD_THRESHOLD = 256 * 1024  # 响应体超过该长度（字节）时放到线程池中压缩，避免阻塞事件循环
+COMPRESSION_CACHE_SIZE = 256  # 每个 HTTP 进程中压缩结果 LRU 缓存的最大条目数
+COMPRESSION_CACHE_MAX_BYTES = 16 * 1024 * 1024  # 每个 HTTP 进程中压缩结果缓存占用的最大字节数（压缩后的大小之和）
+COMPRESSION_CACHE_MAX_BODY_SIZE = 1024 * 1024  # 响应体超过该长度（字节）时不缓存压缩结果，避免少数大响应挤掉其他缓存
+
+# 连接准入控制和慢速客户端防护配置（每个 HTTP 进程）
+LISTEN_BACKLOG = 1024  # 监听队列长度，已完成握手、等待 accept 的连接数量上限
+MAX_CONNECTIONS = 1024  # 同时处理的连接数量上限，超过后直接返回 503 并关闭连接
+HEADER_READ_TIMEOUT = 10  # 从收到请求的第一个字节开始，读取完整请求头的时限（秒），超时返回 408；新连接等待第一个请求也使用该时限
+BODY_READ_TIMEOUT = 30  # 读取完整请求体的时限（秒），超时返回 408
+MAX_BODY_SIZE = 10 * 1024 * 1024  # 请求体的最大字节数，超过后返回 413
+
+# 多进程监听策略
+LISTENER_MODE = "reuseport"  # "reuseport": 每个 HTTP 进程各自绑定端口，由内核均衡分配连接；"inherit": 主进程绑定一次，HTTP 进程继承监听套接字
+
+# HTTP 进程监控配置
+WORKER_HEARTBEAT_INTERVAL = 1  # HTTP 进程发送心跳、主进程检查进程状态的间隔（秒）
+WORKER_HEARTBEAT_TIMEOUT = 10  # 超过该时间（秒）没有心跳的 HTTP 进程判定为卡死，强制结束后重启
+WORKER_RESTART_BACKOFF_BASE = 0.5  # 第一次重启前的等待时间（秒），连续崩溃时按指数翻倍
+WORKER_RESTART_BACKOFF_MAX = 30  # 重启前的最长等待时间（秒）
+WORKER_CRASH_LOOP_WINDOW = 60  # 统计连续崩溃次数的时间窗口（秒）
+WORKER_CRASH_LOOP_THRESHOLD = 5  # 时间窗口内崩溃次数达到该值时判定为崩溃循环
+
+# 滚动重启和优雅退出配置
+DRAIN_TIMEOUT = 30  # HTTP 进程停止接受新连接后，等待已有连接处理完毕的时限（秒）
+DRAIN_IDLE_GRACE = 0.5  # HTTP 进程开始排空后，等待多久关闭空闲的长连接（秒），正在使用的长连接会在下一个响应中收到 Connection: close
+SHUTDOWN_TIMEOUT = 35  # 主进程等待 HTTP 进程排空后退出的时限（秒），应大于 DRAIN_TIMEOUT，超时后使用 SIGKILL 强制结束
+WORKER_READY_TIMEOUT = 30  # 滚动重启时等待新的 HTTP 进程开始接受连接的时限（秒），超时则放弃本次滚动重启
+
+# CPU 规划配置，None 表示根据 cgroup 配额和 CPU 拓扑自动规划
+HTTP_WORKERS = None  # HTTP 进程数量
+BACKGROUND_WORKERS = None  # 为后台任务保留的进程数量
+WORKER_CPUS = None  # 可以使用的 CPU 编号列表，例如 [0, 2, 4, 6]，默认为 sched_getaffinity 允许的所有 CPU
+PIN_WORKERS = True  # 是否把每个进程绑定到单独的 CPU
+
+# 后台任务队列配置
+JOB_QUEUE_DEPTH = 10000  # 排队等待执行的后台任务数量上限，队列已满时 enqueue_job 抛出 JobQueueFull
+JOB_BATCH_SIZE = 64  # HTTP 进程一次写入任务管道的最大任务数量，短时间内提交的多个任务合并为一批发送
+JOB_RESULT_CACHE_SIZE = 10000  # 每个 HTTP 进程中保存的任务状态和结果的最大条目数，超过后淘汰最早的记录
+
+# HTTP 进程自动扩缩容配置，AUTOSCALE_MIN_WORKERS 为 None 时不自动扩缩容，进程数量固定为 CPU 规划的结果
+AUTOSCALE_MIN_WORKERS = None  # HTTP 进程数量下限，启动时先启动这么多进程
+AUTOSCALE_MAX_WORKERS = None  # HTTP 进程数量上限，None 表示 CPU 规划的 HTTP 进程数量
+AUTOSCALE_INTERVAL = 5  # 负载采样间隔（秒）
+AUTOSCALE_UP_CONNECTIONS = 256  # 每个 HTTP 进程的平均连接数量达到该值时判定为过载
+AUTOSCALE_DOWN_CONNECTIONS = 32  # 平均连接数量不超过该值（并且其他信号也低于缩容阈值）时判定为空闲
+AUTOSCALE_UP_LOOP_LAG = 0.1  # 任意 HTTP 进程的事件循环延迟达到该值（秒）时判定为过载
+AUTOSCALE_DOWN_LOOP_LAG = 0.01  # 事件循环延迟不超过该值（秒）时可以判定为空闲
+AUTOSCALE_UP_CPU = 75  # HTTP 进程的平均 CPU 使用率（%）达到该值时判定为过载
+AUTOSCALE_DOWN_CPU = 25  # 平均 CPU 使用率（%）不超过该值时可以判定为空闲
+AUTOSCALE_UP_SAMPLES = 2  # 连续多少次采样判定为过载后扩容
+AUTOSCALE_DOWN_SAMPLES = 12  # 连续多少次采样判定为空闲后缩容，缩容比扩容更谨慎
+AUTOSCALE_COOLDOWN = 30  # 扩容或缩容后的冷却时间（秒），期间不再扩缩容
+
+# HTTP 进程回收配置，进程超过任意一项限制后，先启动新进程，再让旧进程排空后退出
+WORKER_MAX_REQUESTS = None  # 每个 HTTP 进程累计处理的请求数量上限，None 表示不限制
+WORKER_MAX_REQUESTS_JITTER = 1000  # 每个进程的请求数量上限额外加上 0 到该值之间的随机数，避免所有进程同时回收
+WORKER_MAX_RSS = None  # 每个 HTTP 进程的常驻内存上限（MB），None 表示不限制
+
+# api 函数响应缓存配置（get_func_dict 指定了 cache_ttl 的 GET 路由）
+RESPONSE_CACHE_SIZE = 1024  # 每个 HTTP 进程中 LRU 缓存的最大条目数
+RESPONSE_CACHE_SHARED_SIZE = 16 * 1024 * 1024  # 跨进程缓存使用的共享内存大小（字节），None 表示只使用每个进程自己的缓存
+RESPONSE_CACHE_SHARED_SLOT_SIZE = 64 * 1024  # 共享内存中每个槽位的大小（字节），超过该大小的响应只缓存在各个 HTTP 进程中
+RESPONSE_CACHE_GENERATIONS = 1024  # 路由版本号的数量，用于使路由的缓存失效，多个路由可能共用一个版本号
+
+# api 函数限流配置（get_func_dict 指定了 rate_limit 或 route_rate_limit 的路由）
+RATE_LIMIT_TABLE_SIZE = 65536  # 共享令牌桶的数量，同时被限流的 (路由, 用户或客户端 IP) 组合超过该数量时，部分请求不受限流
+RATE_LIMIT_PROBES = 8  # 查找令牌桶时最多探测的位置数量
+RATE_LIMIT_LOCK_TIMEOUT = 0.01  # 等待令牌桶锁的最长时间（秒），超时后放行请求
+
+# 中间件配置
+MIDDLEWARE_TIMING = False  # 是否记录所有路由每个中间件阶段和 api 函数阶段的耗时，通过 Server-Timing 响应头返回；False 时只记录 timing=True 的中间件
@@ -6,8 +6,12 @@
 """
 import os
 import inspect
+import asyncio
 from pathlib import Path
 from typing import Literal
+
+from http_frame.router import parse_route_pattern
+from http_frame.rate_limiter import parse_rate_limit, RATE_LIMIT_BY
 # 存储所有路由的处理器
 route_handlers = {}
 
@@ -15,15 +19,48 @@ def get_func_dict(
         path: str,
         method:Literal["get", "post", "put", "delete", "GET", "POST", "PUT", "DELETE"]='GET',
         token_required: bool=True,
-        role_required: bool=False
+        role_required: bool=False,
+        response_headers: dict=None,
+        constant_response: bool=False,
+        executor: Literal["inline", "thread", "process"]="inline",
+        compress: bool=True,
+        compression_cache: bool=False,
+        cache_ttl: float=None,
+        cache_key: list=(),
+        cache_per_user: bool=False,
+        coalesce: bool=False,
+        rate_limit: str=None,
+        rate_limit_by: Literal["auto", "user", "ip"]="auto",
+        route_rate_limit: str=None,
+        middleware: list=()
 ):
     """
     路由装饰器，支持开启鉴权。
 
-    :param path: 路由路径
+    :param path: 路由路径，可以包含路径参数 {参数名} 或 {参数名:类型}，类型为 str（默认）、int、float、uuid、path，
+                 例如 /user/{user_id:int}；匹配到的参数按类型转换后放在 api 函数的 ctx["path_params"] 中
     :param method: 请求方法，默认为 'GET'
     :param token_required: 是否需要 Token 鉴权，默认 True
     :param role_required: 是否需要角色鉴权，默认 False
+    :param response_headers: 该路由固定返回的响应头，默认只有 Content-Type: application/json，服务启动时会预先编码
+    :param constant_response: api 函数的返回值是否固定不变，为 True 时只执行一次 api 函数，之后直接返回缓存的序列化结果
+    :param executor: 同步 api 函数的执行方式，'inline' 在事件循环中直接执行，'thread' 放到当前进程的线程池中执行（适用于文件读写、阻塞的客户端库等），
+                     'process' 交给 ServerManager 持有的共享进程池执行（适用于报表聚合、图片处理等 CPU 密集型任务）；
+                     async def 定义的 api 函数总是在事件循环中直接 await
+    :param compress: 是否允许根据 Accept-Encoding 压缩响应体，默认 True
+    :param compression_cache: 是否缓存压缩后的响应体，适用于经常返回相同内容的路由（constant_response 和 cache_ttl 的路由总是会缓存）
+    :param cache_ttl: 响应缓存的有效期（秒），只能用于 GET 路由，有效期内相同的请求直接返回缓存的响应，不再执行 api 函数；
+                      只缓存状态码为 200 的非流式响应。默认 None 不缓存
+    :param cache_key: 缓存 key 中包含的查询参数名称，其他查询参数不影响缓存；请求路径（包括路径参数）总是包含在 key 中
+    :param cache_per_user: 是否按 token 中的用户分别缓存，需要 token_required=True
+    :param coalesce: 是否合并相同的并发请求，只能用于 GET 路由。路由、请求路径、查询参数和 token 中的用户信息都相同的请求
+                     同时到达时，只有第一个请求执行 api 函数，其他请求等待并直接使用它编码后的响应；适用于缓存过期时的大量并发请求
+    :param rate_limit: 每个用户或客户端 IP 的限流规则，格式为 "次数/周期"，例如 "100/minute"、"5/10s"，
+                       允许短时间内突发周期内的全部次数；超过限制的请求返回 429 和 Retry-After。默认 None 不限流
+    :param rate_limit_by: rate_limit 的限流维度，'user' 按 token 中的用户（需要 token_required=True），'ip' 按客户端 IP，
+                          'auto' 在需要 token 鉴权时按用户，否则按 IP
+    :param route_rate_limit: 整个路由的限流规则，所有客户端共用，格式与 rate_limit 相同。所有 HTTP 进程共用同一组令牌桶
+    :param middleware: 该路由使用的中间件名称（@middleware 注册的名称），在 apply_to_all=True 的中间件之后按顺序执行
     :return: 装饰后的函数
     """
 
@@ -31,42 +68,125 @@ def get_func_dict(
     get_func_dict.__is_decorator__ = True
 
     def decorator(func):
-        # 获取被装饰函数的文件路径
-        file_path = inspect.getfile(func)
-        # 获取文件的绝对路径
-        abs_file_path = os.path.abspath(file_path)
-
-        # 查找基准目录 'api_func_set' 在路径中的位置
-        base_dir_index = abs_file_path.find("api_func_set")
-
-        relative_path = None
-        # 如果找到了 'api_func_set'，则截取路径
-        if base_dir_index != -1:
-            # 保留 'api_func_set' 及其后的路径部分
-            relative_path = abs_file_path[base_dir_index:]
-
-        # 如果相对路径存在，去掉文件扩展名并构建模块路径
-        if relative_path:
-            file_without_extension = os.path.splitext(relative_path)[0]
-            # 使用 pathlib 将路径分割为模块路径
-            module_path = str(Path(file_without_extension).with_suffix('')).replace(os.sep, '.')
+        # 通过 import_all_functions_in_folder 引入的模块，模块名称就是模块路径，无需再根据文件路径计算
+        if func.__module__.startswith("api_func_set."):
+            module_path = func.__module__
         else:
-            # 如果路径无法匹配 api_func_set，给出错误提示或处理
-            raise ValueError(f"'{func.__name__}' 函数不在 'api_func_set' 文件夹下。")
-
-        # 初始化 route_handlers[path] 为字典（如果尚未初始化）
-        if path not in route_handlers:
-            route_handlers[path] = {}
+            module_path = get_module_path_from_file(func)
 
-        # 将当前路由的处理信息存储到 route_handlers 中
-        route_handlers[path][method.upper()] = {
-            "token_required": token_required,
-            "role_required": role_required,
-            "module_path": module_path,
-            "func_name": func.__name__  # 新增函数名
-        }
+        register_route(path, method, func.__name__, module_path, asyncio.iscoroutinefunction(func), token_required,
+                       role_required, response_headers, constant_response, executor, compress, compression_cache,
+                       cache_ttl, cache_key, cache_per_user, coalesce, rate_limit, rate_limit_by, route_rate_limit,
+                       middleware)
 
         # 返回原函数
         return func
 
     return decorator
+
+
+def get_module_path_from_file(func):
+    """
+    根据被装饰函数所在的文件路径计算模块路径（模块不是以 api_func_set 包的形式引入时使用）
+    """
+    # 获取被装饰函数的文件路径
+    file_path = inspect.getfile(func)
+    # 获取文件的绝对路径
+    abs_file_path = os.path.abspath(file_path)
+
+    # 查找基准目录 'api_func_set' 在路径中的位置
+    base_dir_index = abs_file_path.find("api_func_set")
+
+    relative_path = None
+    # 如果找到了 'api_func_set'，则截取路径
+    if base_dir_index != -1:
+        # 保留 'api_func_set' 及其后的路径部分
+        relative_path = abs_file_path[base_dir_index:]
+
+    # 如果相对路径存在，去掉文件扩展名并构建模块路径
+    if relative_path:
+        file_without_extension = os.path.splitext(relative_path)[0]
+        # 使用 pathlib 将路径分割为模块路径
+        return str(Path(file_without_extension).with_suffix('')).replace(os.sep, '.')
+    # 如果路径无法匹配 api_func_set，给出错误提示或处理
+    raise ValueError(f"'{func.__name__}' 函数不在 'api_func_set' 文件夹下。")
+
+
+def handler_name(module_path, func_name):
+    """
+    api 函数和后台任务函数的模块限定名称，例如 api_func_set.sub_test.handle_hello，
+    api 函数字典、路由清单、进程池和后台任务都按这个名称查找函数，不同模块中可以定义同名函数
+    """
+    return f"{module_path}.{func_name}"
+
+
+def register_route(path, method, func_name, module_path, is_coroutine, token_required=True, role_required=False,
+                   response_headers=None, constant_response=False, executor="inline", compress=True,
+                   compression_cache=False, cache_ttl=None, cache_key=(), cache_per_user=False, coalesce=False,
+                   rate_limit=None, rate_limit_by="auto", route_rate_limit=None, middleware=()):
+    """
+    把路由的处理信息存储到 route_handlers 中，路由装饰器和懒加载模式下的静态扫描（script/lazy_import.py）共用
+    参数含义与 get_func_dict 相同，is_coroutine 表示 api 函数是否为 async def 定义的协程函数
+    """
+    # 在注册时确定 api 函数的执行方式，处理请求时无需再判断：
+    #   async -- 协程函数，直接 await
+    #   inline -- 同步函数，在事件循环中直接执行
+    #   thread -- 同步函数，放到线程池中执行，避免阻塞事件循环
+    #   process -- 同步函数，放到共享进程池中执行，不受 GIL 限制
+    parse_route_pattern(path)  # 路由路径不合法时在启动时报错，而不是在工作进程编译路由表时
+    if executor not in ("inline", "thread", "process"):
+        raise ValueError(f"'{func_name}' 函数的 executor 参数不支持 '{executor}'")
+    if is_coroutine:
+        if executor != "inline":
+            raise ValueError(f"'{func_name}' 是协程函数，会直接在事件循环中执行，不能指定 executor='{executor}'")
+        execution_mode = "async"
+    else:
+        execution_mode = executor
+
+    if cache_ttl is not None:
+        if method.upper() != "GET":
+            raise ValueError(f"'{func_name}' 函数的 cache_ttl 只能用于 GET 路由")
+        if cache_ttl <= 0:
+            raise ValueError(f"'{func_name}' 函数的 cache_ttl 必须大于 0")
+        if cache_per_user and not token_required:
+            raise ValueError(f"'{func_name}' 函数的 cache_per_user=True 需要 token_required=True")
+    if coalesce and method.upper() != "GET":
+        raise ValueError(f"'{func_name}' 函数的 coalesce 只能用于 GET 路由，合并有副作用的请求会导致只执行一次")
+    if rate_limit_by not in RATE_LIMIT_BY:
+        raise ValueError(f"'{func_name}' 函数的 rate_limit_by 参数不支持 '{rate_limit_by}'")
+    if rate_limit_by == "auto":
+        rate_limit_by = "user" if token_required else "ip"
+    elif rate_limit_by == "user" and rate_limit is not None and not token_required:
+        raise ValueError(f"'{func_name}' 函数的 rate_limit_by='user' 需要 token_required=True")
+    for rule in (rate_limit, route_rate_limit):
+        if rule is not None:
+            try:
+                parse_rate_limit(rule)  # 限流规则不合法时在启动时报错
+            except ValueError as e:
+                raise ValueError(f"'{func_name}' 函数的{e}")
+
+    # 初始化 route_handlers[path] 为字典（如果尚未初始化）
+    if path not in route_handlers:
+        route_handlers[path] = {}
+
+    # 将当前路由的处理信息存储到 route_handlers 中
+    route_handlers[path][method.upper()] = {
+        "token_required": token_required,
+        "role_required": role_required,
+        "response_headers": response_headers,
+        "constant_response": constant_response,
+        "execution_mode": execution_mode,
+        "compress": compress,
+        "compression_cache": compression_cache or constant_response or cache_ttl is not None,
+        "module_path": module_path,
+        "func_name": func_name,  # 新增函数名
+        "handler": handler_name(module_path, func_name),  # 模块限定名称，api 函数字典中的 key
+        "cache_ttl": cache_ttl,
+        "cache_key": list(cache_key),  # 路由清单为 JSON 格式，统一使用列表
+        "cache_per_user": cache_per_user,
+        "coalesce": coalesce,
+        "rate_limit": rate_limit,  # 限流规则保存为原始字符串，生成分发表时解析
+        "rate_limit_by": rate_limit_by,  # 已经把 auto 确定为 user 或 ip
+        "route_rate_limit": route_rate_limit,
+        "middleware": list(middleware),  # 中间件可能在路由之后注册，生成分发表时才检查名称是否存在
+    }
@@ -0,0 +1,72 @@
+"""
+文件描述: 后台任务函数的装饰器，用于在项目启动时收集所有后台任务函数的基本信息，存放在 job_handlers 字典中
+            后台任务函数和 api 函数一样放在 api_func_set 文件夹下，由为后台任务保留的进程执行，
+            api 函数中通过 project_frame.background_jobs.enqueue_job 提交任务
+
+创建者: 汐琳
+创建时间: 2025-01-24 11:06:25
+"""
+import inspect
+from typing import Literal
+
+from decoratorFunc.getFuncDict import handler_name
+
+# 存储所有后台任务函数的信息，key 为函数名称（提交任务时使用的名称）
+job_handlers = {}
+
+JOB_PRIORITIES = ("high", "normal", "low")  # 任务优先级，按从高到低排列
+
+
+def background_job(
+        priority: Literal["high", "normal", "low"] = "normal",
+        max_retries: int = 0,
+        retry_delay: float = 1
+):
+    """
+    后台任务装饰器，被装饰的函数接收一个参数 data（提交任务时传入的数据），返回值可以通过 job_id 获取；
+    后台任务进程中没有事件循环，被装饰的函数必须是普通函数，不能是 async def 定义的协程函数
+
+    :param priority: 默认的任务优先级，提交任务时可以覆盖
+    :param max_retries: 任务抛出异常后的最大重试次数，默认不重试
+    :param retry_delay: 第一次重试前的等待时间（秒），之后每次重试翻倍
+    :return: 装饰后的函数
+    """
+    check_priority(priority)
+
+    def decorator(func):
+        register_job(func.__name__, func.__module__, inspect.iscoroutinefunction(func), priority, max_retries, retry_delay)
+        return func
+
+    return decorator
+
+
+def check_priority(priority):
+    if priority not in JOB_PRIORITIES:
+        raise ValueError(f"后台任务的 priority 只能是 {JOB_PRIORITIES} 之一，当前为 {priority!r}")
+
+
+def register_job(func_name, module_path, is_coroutine=False, priority="normal", max_retries=0, retry_delay=1):
+    """
+    把后台任务函数的信息存储到 job_handlers 中，后台任务装饰器和懒加载模式下的静态扫描共用
+    :param is_coroutine: 后台任务函数是否为 async def 定义的协程函数
+    """
+    if is_coroutine:
+        # 后台任务进程直接调用函数，协程函数只会返回一个从未执行的协程对象，任务却被记录为成功
+        raise ValueError(f"后台任务 '{func_name}' 是协程函数，后台任务进程中没有事件循环，请使用普通函数定义")
+    check_priority(priority)
+    # api 函数可以在不同模块中同名，后台任务按函数名称提交，名称仍然必须唯一
+    registered = job_handlers.get(func_name)
+    if registered is not None and registered["module_path"] != module_path:
+        raise ValueError(f"后台任务 '{func_name}' 已经在 {registered['module_path']} 中定义，请修改函数名称")
+    job_handlers[func_name] = {
+        "priority": priority,
+        "max_retries": max_retries,
+        "retry_delay": retry_delay,
+        "module_path": module_path,
+        "func_name": func_name,
+        "handler": handler_name(module_path, func_name),  # 模块限定名称，api 函数字典中的 key
+    }
+
+
+# 引入所有 api 函数时排除装饰器本身
+background_job.__is_decorator__ = True
@@ -0,0 +1,65 @@
+"""
+文件描述: 中间件的装饰器，用于在项目启动时收集所有中间件，存放在 middleware_handlers 字典中
+            中间件和 api 函数一样放在 api_func_set 文件夹下，apply_to_all=True 的中间件作用于所有路由，
+            其他中间件由路由通过 get_func_dict(middleware=[中间件名称, ...]) 指定；每个路由的中间件在生成分发表时组合为一个调用链
+
+创建者: 汐琳
+创建时间: 2025-01-31 15:08:37
+"""
+import asyncio
+from typing import Literal
+
+# 存储所有中间件的信息，key 为中间件名称，按注册顺序排列（apply_to_all=True 的中间件按该顺序执行）
+middleware_handlers = {}
+
+MIDDLEWARE_STAGES = ("before", "after", "around")
+
+
+def middleware(
+        stage: Literal["before", "after", "around"],
+        name: str = None,
+        apply_to_all: bool = False,
+        timing: bool = False
+):
+    """
+    中间件装饰器，被装饰的函数可以是普通函数或协程函数，在事件循环中执行：
+        before -- func(request)，在鉴权和 api 函数之前执行，返回 None 继续处理，返回与 api 函数相同格式的字典时直接作为响应
+        after -- func(request, response)，在得到响应之后执行，可以修改 response.headers，返回字典时替换原来的响应
+        around -- func(request, call_next)，await call_next(request) 执行后续的中间件和 api 函数，返回 Response 或字典
+    request.response_headers 中设置的响应头会添加到最终的响应中，request.state 中的数据可以在 api 函数中通过 ctx["state"] 读取
+
+    :param stage: 中间件的执行阶段
+    :param name: 中间件名称，路由通过该名称指定中间件，默认为函数名称
+    :param apply_to_all: 是否作用于所有路由，默认 False
+    :param timing: 是否记录该中间件的耗时，通过 Server-Timing 响应头返回（config.MIDDLEWARE_TIMING 为 True 时记录所有阶段）
+    :return: 装饰后的函数
+    """
+    def decorator(func):
+        register_middleware(name or func.__name__, func, stage, apply_to_all, timing)
+        return func
+
+    return decorator
+
+
+def register_middleware(name, func, stage, apply_to_all=False, timing=False):
+    """
+    把中间件的信息存储到 middleware_handlers 中
+    """
+    if stage not in MIDDLEWARE_STAGES:
+        raise ValueError(f"中间件 '{name}' 的 stage 只能是 {MIDDLEWARE_STAGES} 之一，当前为 {stage!r}")
+    if stage == "around" and not asyncio.iscoroutinefunction(func):
+        raise ValueError(f"中间件 '{name}' 需要 await call_next(request)，around 中间件必须是 async def 定义的协程函数")
+    registered = middleware_handlers.get(name)
+    if registered is not None and registered["func"].__module__ != func.__module__:
+        raise ValueError(f"中间件 '{name}' 已经在 {registered['func'].__module__} 中定义，请修改中间件名称")
+    middleware_handlers[name] = {
+        "func": func,
+        "stage": stage,
+        "apply_to_all": apply_to_all,
+        "timing": timing,
+        "is_coroutine": asyncio.iscoroutinefunction(func),
+    }
+
+
+# 引入所有 api 函数时排除装饰器本身
+middleware.__is_decorator__ = True
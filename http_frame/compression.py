@@ -0,0 +1,134 @@
+"""
+文件描述: 响应压缩
+            1. 根据请求头 Accept-Encoding 协商压缩方式（gzip / deflate）
+            2. 响应体小于最小压缩长度时不压缩，压缩收益太小
+            3. 响应体较大时放到线程池中压缩（zlib 压缩时会释放 GIL），避免阻塞事件循环
+            4. 可缓存的路由使用 LRU 缓存压缩结果，相同的响应体在每个进程中只压缩一次；
+               缓存以响应体的摘要为键，不保留原始响应体，并按压缩结果的总字节数限制内存占用
+
+创建者: 汐琳
+创建时间: 2025-01-15 10:36:17
+"""
+import asyncio
+import hashlib
+import zlib
+from collections import OrderedDict
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate")  # 按优先级排列，q 值相同时优先使用 gzip
+ACCEPT_ENCODING_CACHE_SIZE = 256  # Accept-Encoding 协商结果缓存的最大条目数
+
+VARY_BLOCK = b"Vary: Accept-Encoding\r\n"
+CONTENT_ENCODING_BLOCKS = {
+    encoding: f"Content-Encoding: {encoding}\r\nVary: Accept-Encoding\r\n".encode()
+    for encoding in SUPPORTED_ENCODINGS
+}
+
+accept_encoding_cache = {}  # Accept-Encoding 请求头 -> 协商出的压缩方式，客户端的请求头种类很少，只需要解析一次
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    根据 Accept-Encoding 请求头选择压缩方式，例如 "gzip, deflate;q=0.5, *;q=0"
+    :param accept_encoding: Accept-Encoding 请求头
+    :return: "gzip" / "deflate"，客户端不支持压缩时返回 None
+    """
+    if not accept_encoding:
+        return None
+
+    if accept_encoding in accept_encoding_cache:
+        return accept_encoding_cache[accept_encoding]
+
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding] = quality
+
+    wildcard_quality = qualities.get("*", 0.0)
+    best_encoding, best_quality = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = qualities.get(encoding, wildcard_quality)
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+
+    if len(accept_encoding_cache) < ACCEPT_ENCODING_CACHE_SIZE:
+        accept_encoding_cache[accept_encoding] = best_encoding
+    return best_encoding
+
+
+def compress_bytes(body_bytes, encoding, level):
+    """
+    压缩响应体
+    :param body_bytes: 响应体 bytes
+    :param encoding: "gzip" / "deflate"（HTTP 中的 deflate 指 zlib 格式）
+    :param level: 压缩级别 1-9
+    :return: 压缩后的 bytes
+    """
+    if encoding == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 表示生成 gzip 格式
+        return compressor.compress(body_bytes) + compressor.flush()
+    return zlib.compress(body_bytes, level)
+
+
+class ResponseCompressor:
+    def __init__(self, min_size, level, thread_threshold, cache_size, cache_max_bytes, cache_max_body_size):
+        """
+        每个 HTTP 进程一个的响应压缩器
+        :param min_size: 最小压缩长度（字节），小于该长度的响应体不压缩
+        :param level: 压缩级别 1-9
+        :param thread_threshold: 响应体超过该长度（字节）时放到线程池中压缩
+        :param cache_size: 压缩结果 LRU 缓存的最大条目数
+        :param cache_max_bytes: 压缩结果 LRU 缓存中压缩结果的总字节数上限
+        :param cache_max_body_size: 响应体超过该长度（字节）时不缓存压缩结果
+        """
+        self.min_size = min_size
+        self.level = level
+        self.thread_threshold = thread_threshold
+        self.cache_size = cache_size
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_max_body_size = cache_max_body_size
+        self.cache = OrderedDict()  # (压缩方式, 响应体摘要) -> 压缩后的响应体
+        self.cache_bytes = 0  # 缓存中压缩结果的总字节数
+
+    async def compress(self, body_bytes, encoding, cacheable=False, executor=None):
+        """
+        压缩响应体，可缓存的路由优先从 LRU 缓存中获取压缩结果
+        :param body_bytes: 响应体 bytes
+        :param encoding: 压缩方式
+        :param cacheable: 该路由的压缩结果是否可以缓存
+        :param executor: 压缩大响应体时使用的线程池
+        :return: 压缩后的 bytes
+        """
+        cacheable = cacheable and self.cache_size > 0 and len(body_bytes) <= self.cache_max_body_size
+        if cacheable:
+            # 与限流器一样使用 blake2b 摘要作为键，缓存中不需要保留完整的响应体
+            cache_key = (encoding, hashlib.blake2b(body_bytes, digest_size=16).digest())
+            compressed = self.cache.get(cache_key)
+            if compressed is not None:
+                self.cache.move_to_end(cache_key)
+                return compressed
+
+        if len(body_bytes) >= self.thread_threshold:
+            loop = asyncio.get_running_loop()
+            compressed = await loop.run_in_executor(executor, compress_bytes, body_bytes, encoding, self.level)
+        else:
+            compressed = compress_bytes(body_bytes, encoding, self.level)
+
+        if cacheable and len(compressed) <= self.cache_max_bytes:
+            previous = self.cache.pop(cache_key, None)  # 并发请求可能同时压缩了同一个响应体
+            if previous is not None:
+                self.cache_bytes -= len(previous)
+            self.cache[cache_key] = compressed
+            self.cache_bytes += len(compressed)
+            while len(self.cache) > self.cache_size or self.cache_bytes > self.cache_max_bytes:
+                _, evicted = self.cache.popitem(last=False)  # 淘汰最久未使用的压缩结果
+                self.cache_bytes -= len(evicted)
+        return compressed
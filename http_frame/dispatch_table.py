@@ -0,0 +1,85 @@
+"""
+文件描述: 请求分发表，在主进程中根据 route_handlers 和 api 函数字典一次性生成，HTTP 进程通过 fork 继承，不需要在每个进程中重新生成
+            每个 (路由, 请求方法) 对应一个 DispatchEntry，处理请求需要的信息（api 函数、鉴权标记、执行方式、预编码的响应头等）
+            都在生成时确定，处理请求时只需要一次路由匹配和属性访问，不再逐层查找 route_handlers 字典和 api 函数字典
+            api 函数按模块限定名称（模块名称.函数名称）查找，不同模块中可以定义同名的 api 函数
+
+创建者: 汐琳
+创建时间: 2025-01-30 10:12:45
+"""
+from types import MappingProxyType
+
+from http_frame.router import parse_route_pattern
+from http_frame.rate_limiter import parse_rate_limit
+from http_frame.middleware import build_pipeline
+from http_frame.send_http_response import encode_header_block, DEFAULT_HEADERS
+
+
+class DispatchEntry:
+    __slots__ = ("route_key", "handler", "func", "execution_mode", "token_required", "role_required",
+                 "constant_response", "compress", "compression_cache", "response_headers", "header_block",
+                 "param_names", "cache_ttl", "cache_key", "cache_per_user", "coalesce", "rate_limit", "rate_limit_by",
+                 "route_rate_limit", "pipeline")
+
+    def __init__(self, path, method, api_func_info, func=None, middleware_dict=None):
+        """
+        单个路由的分发信息
+        :param path: 注册的路由路径（带参数的路由为路径模板）
+        :param method: 请求方法
+        :param api_func_info: register_route 存储在 route_handlers 中的路由信息
+        :param func: api 函数，懒加载模式下主进程没有引入该函数时为 None，由 HTTP 进程第一次处理请求时通过 load 获取
+        :param middleware_dict: 中间件装饰器收集的中间件信息字典
+        """
+        self.route_key = (path, method)  # (路由, 请求方法)，响应缓存等按它区分路由
+        self.handler = api_func_info["handler"]  # api 函数的模块限定名称，进程池按它查找函数
+        self.func = func
+        self.execution_mode = api_func_info.get("execution_mode", "inline")
+        self.token_required = api_func_info.get("token_required")
+        self.role_required = api_func_info.get("role_required")
+        self.constant_response = api_func_info.get("constant_response")
+        self.compress = api_func_info.get("compress", True)
+        self.compression_cache = api_func_info.get("compression_cache", False)
+        self.response_headers = api_func_info.get("response_headers") or {}
+        # 预先编码好的静态响应头
+        self.header_block = encode_header_block(dict(DEFAULT_HEADERS, **self.response_headers))
+        # 路由中的路径参数名称，按出现的顺序排列
+        self.param_names = tuple(segment[0] for segment in parse_route_pattern(path) if not isinstance(segment, str))
+        # 响应缓存，cache_ttl 为 None 表示不缓存
+        self.cache_ttl = api_func_info.get("cache_ttl")
+        self.cache_key = tuple(api_func_info.get("cache_key") or ())
+        self.cache_per_user = api_func_info.get("cache_per_user", False)
+        self.coalesce = api_func_info.get("coalesce", False)  # 是否合并相同的并发请求
+        # 限流规则解析为 (桶的容量, 每秒补充的令牌数量)，None 表示不限流
+        rate_limit, route_rate_limit = api_func_info.get("rate_limit"), api_func_info.get("route_rate_limit")
+        self.rate_limit = parse_rate_limit(rate_limit) if rate_limit is not None else None
+        self.rate_limit_by = api_func_info.get("rate_limit_by", "ip")  # user / ip
+        self.route_rate_limit = parse_rate_limit(route_rate_limit) if route_rate_limit is not None else None
+        # 组合好的中间件调用链，没有中间件时为 None，处理请求时直接调用 HTTPServer.process_request
+        try:
+            self.pipeline = build_pipeline(api_func_info.get("middleware") or (), middleware_dict or {})
+        except ValueError as e:
+            raise ValueError(f"'{self.handler}' 函数的{e}")
+
+    def load(self, api_func_dict):
+        """
+        从 api 函数字典中取出 api 函数并保存（懒加载模式下会引入函数所在的模块）
+        """
+        self.func = api_func_dict[self.handler]
+        return self.func
+
+
+def build_dispatch_table(route_handlers, api_func_dict, middleware_dict=None):
+    """
+    生成请求分发表
+    :param route_handlers: 路由和 api 函数的关系字典
+    :param api_func_dict: api 函数字典，key 为模块限定名称
+    :param middleware_dict: 中间件装饰器收集的中间件信息字典，None 表示没有中间件
+    :return: 只读的 {(路由, 请求方法): DispatchEntry}
+    """
+    table = {}
+    for path, methods in route_handlers.items():
+        for method, api_func_info in methods.items():
+            # dict.get 不会触发 LazyApiFuncDict 的懒加载，主进程中只使用已经引入的函数
+            func = api_func_dict.get(api_func_info["handler"])
+            table[(path, method)] = DispatchEntry(path, method, api_func_info, func, middleware_dict)
+    return MappingProxyType(table)
@@ -0,0 +1,49 @@
+"""
+文件描述: 多个 HTTP 进程共用同一个端口时的监听策略
+            1. reuseport: 每个 HTTP 进程各自创建监听套接字并设置 SO_REUSEPORT，由内核把新连接均匀地分配给各个进程
+            2. inherit: 主进程只创建一个监听套接字，HTTP 进程通过 fork 继承同一个文件描述符，各进程竞争 accept 同一个监听队列
+            不支持 SO_REUSEPORT 的系统（例如 Windows）上自动退回到 inherit 模式
+
+创建者: 汐琳
+创建时间: 2025-01-17 14:05:38
+"""
+import socket
+
+LISTENER_MODES = ("reuseport", "inherit")
+SUPPORTS_REUSEPORT = hasattr(socket, "SO_REUSEPORT")
+
+
+def resolve_listener_mode(listener_mode):
+    """
+    检查监听模式是否有效，当前系统不支持 SO_REUSEPORT 时退回到 inherit 模式
+    :param listener_mode: "reuseport" / "inherit"
+    :return: 实际使用的监听模式
+    """
+    if listener_mode not in LISTENER_MODES:
+        raise ValueError(f"listener_mode 只能是 {LISTENER_MODES} 之一，当前为 {listener_mode!r}")
+    if listener_mode == "reuseport" and not SUPPORTS_REUSEPORT:
+        print("当前系统不支持 SO_REUSEPORT，监听模式退回到 inherit")
+        return "inherit"
+    return listener_mode
+
+
+def create_listen_socket(port, backlog, host="0.0.0.0", reuse_port=False):
+    """
+    创建并开始监听 TCP 套接字
+    :param port: 监听的端口号
+    :param backlog: 监听队列长度
+    :param host: 监听的地址
+    :param reuse_port: 是否设置 SO_REUSEPORT，多个进程各自绑定同一个端口，由内核做负载均衡
+    :return: 已经开始监听的套接字
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # 服务重启时可以立即重新绑定处于 TIME_WAIT 的端口
+        if reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((host, port))  # 绑定 IP 和端口
+        server_socket.listen(backlog)  # 开始监听，最多允许 backlog 个连接排队
+    except OSError:
+        server_socket.close()
+        raise
+    return server_socket
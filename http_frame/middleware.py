@@ -0,0 +1,214 @@
+"""
+文件描述: 中间件调用链，在生成分发表时按路由组合一次，处理请求时只需要调用路由的 DispatchEntry.pipeline
+            1. 顺序：apply_to_all=True 的中间件（按注册顺序）在前，路由通过 get_func_dict(middleware=[...]) 指定的中间件在后；
+               before 按顺序执行，after 按相反的顺序执行，around 包裹其后的所有阶段
+            2. 调用链的最内层是 HTTPServer.process_request（限流、鉴权、响应缓存、执行 api 函数、编码响应），
+               压缩和发送在调用链之外进行，after 中间件看到的是压缩前的响应体
+            3. 没有中间件的路由不生成调用链（pipeline 为 None），处理请求时不会创建 Request / Response 对象
+            4. 耗时统计：config.MIDDLEWARE_TIMING 为 True 时记录所有阶段（包括 api 函数所在的 handler 阶段），
+               否则只记录 timing=True 的中间件；不需要统计的阶段在组合时不会包裹计时代码。
+               结果放在 request.timings 中，并通过 Server-Timing 响应头返回（around 中间件的耗时包含其后的所有阶段）
+
+创建者: 汐琳
+创建时间: 2025-01-31 15:31:52
+"""
+import time
+
+from config import MIDDLEWARE_TIMING
+from http_frame.send_http_response import encode_status_line, encode_header_block, encode_body
+
+HANDLER_STAGE = "handler"  # 调用链最内层（鉴权、缓存、api 函数）在 Server-Timing 中的名称
+
+
+class Request:
+    __slots__ = ("server", "writer", "parsing_data", "entry", "path_params", "ctx", "state", "response_headers", "timings")
+
+    def __init__(self, server, writer, parsing_data, entry, path_params):
+        """
+        中间件看到的请求
+        :param server: 处理请求的 HTTPServer
+        :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
+        :param parsing_data: parsing_data 方法解析后的请求信息
+        :param entry: 路由的 DispatchEntry
+        :param path_params: 路由中的路径参数，没有时为 None
+        """
+        self.server = server
+        self.writer = writer
+        self.parsing_data = parsing_data
+        self.entry = entry
+        self.path_params = path_params
+        self.ctx = None  # 鉴权后的上下文信息，鉴权之后才会设置，before 中间件中为 None
+        self.state = {}  # 中间件之间、中间件和 api 函数之间传递的数据，api 函数中为 ctx["state"]
+        self.response_headers = {}  # 添加到响应中的响应头
+        self.timings = []  # 各阶段的耗时：(阶段名称, 秒)
+
+    @property
+    def method(self):
+        return self.parsing_data["method"]
+
+    @property
+    def path(self):
+        return self.parsing_data["path"]
+
+    @property
+    def version(self):
+        return self.parsing_data["version"]
+
+    @property
+    def headers(self):
+        return self.parsing_data["header_dict"]
+
+    @property
+    def data(self):
+        return self.parsing_data["data"]
+
+    @property
+    def route(self):
+        """
+        注册时的路由路径（带参数的路由为路径模板）
+        """
+        return self.entry.route_key[0]
+
+    @property
+    def client_ip(self):
+        return self.server.client_ip(self.writer)
+
+    def respond(self, response):
+        """
+        把中间件返回的字典（与 api 函数的返回值格式相同）编码为 Response
+        """
+        return Response(encode_status_line(response["code"], response["message"]), self.entry.header_block,
+                        encode_body(response.get("body")), headers=self.response_headers)
+
+
+class Response:
+    __slots__ = ("status_line", "header_block", "body", "extra_header_block", "headers")
+
+    def __init__(self, status_line, header_block, body, extra_header_block=b"", headers=None):
+        """
+        中间件看到的响应
+        :param status_line: 预编码的状态行
+        :param header_block: 预编码的路由响应头
+        :param body: 编码后的响应体 bytes，流式响应为产出数据块的异步迭代器
+        :param extra_header_block: 预编码的其他响应头，例如 Retry-After
+        :param headers: 中间件添加的响应头，默认为 request.response_headers
+        """
+        self.status_line = status_line
+        self.header_block = header_block
+        self.body = body
+        self.extra_header_block = extra_header_block
+        self.headers = {} if headers is None else headers
+
+    @property
+    def status_code(self):
+        return int(self.status_line[9:12])  # 状态行固定为 b"HTTP/1.1 200 ..."
+
+    @property
+    def streaming(self):
+        return not isinstance(self.body, bytes)
+
+
+async def call_handler(request):
+    """
+    调用链的最内层：交给 HTTPServer 完成限流、鉴权、响应缓存和 api 函数的执行
+    """
+    response = await request.server.process_request(request.writer, request.parsing_data, request.entry,
+                                                     request.path_params, request)
+    return Response(*response, headers=request.response_headers)
+
+
+def timed(func, name, is_coroutine):
+    """
+    包裹一个阶段，把耗时记录到 request.timings 中
+    """
+    if is_coroutine:
+        async def timed_stage(request, *args):
+            start = time.perf_counter()
+            try:
+                return await func(request, *args)
+            finally:
+                request.timings.append((name, time.perf_counter() - start))
+    else:
+        def timed_stage(request, *args):
+            start = time.perf_counter()
+            try:
+                return func(request, *args)
+            finally:
+                request.timings.append((name, time.perf_counter() - start))
+    return timed_stage
+
+
+def before_stage(hook, is_coroutine, call_next):
+    async def stage(request):
+        result = hook(request)
+        if is_coroutine:
+            result = await result
+        if result is not None:
+            return request.respond(result)  # 直接返回，不再执行后续的阶段
+        return await call_next(request)
+    return stage
+
+
+def after_stage(hook, is_coroutine, call_next):
+    async def stage(request):
+        response = await call_next(request)
+        result = hook(request, response)
+        if is_coroutine:
+            result = await result
+        return response if result is None else request.respond(result)
+    return stage
+
+
+def around_stage(hook, is_coroutine, call_next):
+    async def stage(request):
+        result = await hook(request, call_next)
+        return result if isinstance(result, Response) else request.respond(result)
+    return stage
+
+
+STAGE_BUILDERS = {"before": before_stage, "after": after_stage, "around": around_stage}
+
+
+def server_timing_block(timings):
+    """
+    编码 Server-Timing 响应头，例如 b"Server-Timing: auth;dur=0.012, handler;dur=1.305\r\n"（单位为毫秒）
+    """
+    return ("Server-Timing: " + ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings) + "\r\n").encode()
+
+
+def build_pipeline(route_middleware, middleware_dict, timing=MIDDLEWARE_TIMING):
+    """
+    组合路由的中间件调用链
+    :param route_middleware: 路由通过 get_func_dict(middleware=...) 指定的中间件名称
+    :param middleware_dict: 中间件装饰器收集的中间件信息字典
+    :param timing: 是否记录所有阶段的耗时
+    :return: 调用链，接收 Request，返回 (状态行, 路由响应头, 响应体, 其他响应头)；没有中间件并且不记录耗时时返回 None
+    :raise ValueError: 路由指定的中间件不存在
+    """
+    stages = [(name, info) for name, info in middleware_dict.items() if info["apply_to_all"]]
+    for name in route_middleware:
+        info = middleware_dict.get(name)
+        if info is None:
+            raise ValueError(f"中间件 '{name}' 不存在")
+        if not info["apply_to_all"]:  # 作用于所有路由的中间件已经在调用链中
+            stages.append((name, info))
+    if not stages and not timing:
+        return None
+
+    chain = timed(call_handler, HANDLER_STAGE, True) if timing else call_handler
+    for name, info in reversed(stages):
+        hook = info["func"]
+        if timing or info["timing"]:
+            hook = timed(hook, name, info["is_coroutine"])
+        chain = STAGE_BUILDERS[info["stage"]](hook, info["is_coroutine"], chain)
+
+    async def pipeline(request):
+        response = await chain(request)
+        extra_header_block = response.extra_header_block
+        if response.headers:
+            extra_header_block += encode_header_block(response.headers)
+        if request.timings:
+            extra_header_block += server_timing_block(request.timings)
+        return response.status_line, response.header_block, response.body, extra_header_block
+
+    return pipeline
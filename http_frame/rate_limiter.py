@@ -0,0 +1,177 @@
+"""
+文件描述: api 函数的限流，get_func_dict(rate_limit=..., route_rate_limit=...) 声明的限流规则在这里执行
+            1. 令牌桶：每个桶的容量为周期内允许的请求数量，令牌按 次数/周期 的速度匀速补充，桶中有令牌时请求通过并消耗一个令牌，
+               没有令牌时返回 429，Retry-After 为补充一个令牌需要的时间
+            2. 所有令牌桶存储在主进程创建的共享数组中（multiprocessing.Array，不经过 SharedData 的 Manager 代理），
+               HTTP 进程通过 fork 继承，所有进程更新同一组令牌桶，限流对整个服务生效，而不是每个进程单独计算
+            3. Python 中没有共享内存上的原子操作（CAS），共享数组按顺序分为若干段，每段由一把 multiprocessing.Lock 保护，
+               一次检查只在一段中查找、更新一个桶，持有锁的时间只有几微秒；不同段的桶可以被不同进程同时更新
+            4. 桶按 (路由, 限流维度, 用户或客户端 IP) 的 64 位哈希值在段内线性探测查找，已经补满的桶等同于新建的桶，可以直接被其他 key 复用；
+               探测范围内没有可用位置，或者等待锁超时时放行请求（限流失效好过拒绝正常请求）
+
+创建者: 汐琳
+创建时间: 2025-01-31 10:26:14
+"""
+import functools
+import hashlib
+import math
+import multiprocessing
+import re
+import time
+
+from config import RATE_LIMIT_TABLE_SIZE, RATE_LIMIT_PROBES, RATE_LIMIT_LOCK_TIMEOUT
+
+LOCK_STRIPES = 64  # 令牌桶数组的分段数量，每段一把锁
+RATE_LIMIT_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(\d*(?:\.\d+)?)\s*(second|minute|hour|day|s|m|h|d)\s*$")
+PERIOD_SECONDS = {"second": 1, "s": 1, "minute": 60, "m": 60, "hour": 3600, "h": 3600, "day": 86400, "d": 86400}
+RATE_LIMIT_BY = ("auto", "user", "ip")
+
+
+def parse_rate_limit(rate_limit):
+    """
+    解析限流规则，例如 "100/minute"、"10/second"、"5/10s"（每 10 秒 5 次）
+    :param rate_limit: "次数/周期" 格式的字符串，周期单位为 second(s)、minute(m)、hour(h)、day(d)，单位前可以加数字
+    :return: (桶的容量, 每秒补充的令牌数量)
+    :raise ValueError: 格式不正确，或者次数、周期不大于 0
+    """
+    match = RATE_LIMIT_PATTERN.match(rate_limit) if isinstance(rate_limit, str) else None
+    if match is None:
+        raise ValueError(f"限流规则 '{rate_limit}' 格式不正确，应为 '次数/周期'，例如 '100/minute'、'5/10s'")
+    requests, multiplier, unit = match.groups()
+    period = float(multiplier or 1) * PERIOD_SECONDS[unit]
+    if int(requests) <= 0 or period <= 0:
+        raise ValueError(f"限流规则 '{rate_limit}' 的次数和周期必须大于 0")
+    return int(requests), int(requests) / period
+
+
+def bucket_key(route_key, scope, identity=""):
+    """
+    令牌桶的 64 位哈希值，0 表示空位置，不会作为哈希值使用
+    :param route_key: (路由, 请求方法)
+    :param scope: 限流维度，user / ip / route
+    :param identity: token 中的用户或客户端 IP，按路由限流时为空
+    """
+    digest = hashlib.blake2b(f"{route_key[1]} {route_key[0]}\0{scope}\0{identity}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+@functools.lru_cache(maxsize=None)
+def retry_after_block(seconds):
+    """
+    预编码的 Retry-After 响应头，按秒数缓存
+    """
+    return f"Retry-After: {seconds}\r\n".encode()
+
+
+class SharedRateLimiter:
+    def __init__(self, size=RATE_LIMIT_TABLE_SIZE, probes=RATE_LIMIT_PROBES, lock_timeout=RATE_LIMIT_LOCK_TIMEOUT):
+        """
+        在主进程中创建，HTTP 进程通过 fork 继承；单独启动 HTTPServer 时在本进程中创建，只对本进程生效
+        :param size: 令牌桶的数量，同时被限流的 (路由, 用户或 IP) 组合超过该数量时，部分请求不受限流
+        :param probes: 查找令牌桶时最多探测的位置数量
+        :param lock_timeout: 等待锁的最长时间（秒），超时后放行请求
+        """
+        stripes = min(LOCK_STRIPES, size)
+        self.segment = size // stripes  # 每段的令牌桶数量
+        self.stripes = stripes
+        self.probes = min(probes, self.segment)
+        self.lock_timeout = lock_timeout
+        size = self.segment * stripes
+        self.keys = multiprocessing.Array("Q", size, lock=False)  # 令牌桶的哈希值，0 表示空位置
+        self.tokens = multiprocessing.Array("d", size, lock=False)  # 上次更新后剩余的令牌数量
+        self.updated_at = multiprocessing.Array("d", size, lock=False)  # 上次更新的时间（time.monotonic，同一台机器上所有进程一致）
+        self.full_at = multiprocessing.Array("d", size, lock=False)  # 令牌桶补满的时间，之后该位置可以被其他 key 复用
+        self.locks = [multiprocessing.Lock() for _ in range(stripes)]
+
+    def acquire(self, key, capacity, rate, now=None):
+        """
+        从令牌桶中取出一个令牌
+        :param key: bucket_key 生成的哈希值
+        :param capacity: 桶的容量
+        :param rate: 每秒补充的令牌数量
+        :param now: 当前时间（time.monotonic），None 表示取当前时间
+        :return: 需要等待的秒数，0 表示请求通过
+        """
+        if now is None:
+            now = time.monotonic()
+        stripe = key % self.stripes
+        base = stripe * self.segment
+        start = key // self.stripes
+        lock = self.locks[stripe]
+        if not lock.acquire(timeout=self.lock_timeout):
+            return 0.0
+        try:
+            index = free = None
+            for probe in range(self.probes):
+                position = base + (start + probe) % self.segment
+                stored = self.keys[position]
+                if stored == key:
+                    index = position
+                    break
+                if free is None and (stored == 0 or self.full_at[position] <= now):
+                    free = position
+
+            if index is None:
+                if free is None:
+                    return 0.0  # 探测范围内的令牌桶都在使用中
+                index = free
+                self.keys[index] = key
+                tokens = capacity
+            else:
+                tokens = min(capacity, self.tokens[index] + (now - self.updated_at[index]) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / rate
+            self.tokens[index] = tokens
+            self.updated_at[index] = now
+            self.full_at[index] = now + (capacity - tokens) / rate
+            return retry_after
+        finally:
+            lock.release()
+
+    def refund(self, key, capacity, rate):
+        """
+        退还 acquire 取出的一个令牌，用于请求最终被其他限流规则拒绝的情况；等待锁超时或者令牌桶已经被复用时不退还
+        :param key: bucket_key 生成的哈希值
+        :param capacity: 桶的容量
+        :param rate: 每秒补充的令牌数量
+        """
+        stripe = key % self.stripes
+        base = stripe * self.segment
+        start = key // self.stripes
+        lock = self.locks[stripe]
+        if not lock.acquire(timeout=self.lock_timeout):
+            return
+        try:
+            for probe in range(self.probes):
+                position = base + (start + probe) % self.segment
+                if self.keys[position] == key:
+                    tokens = min(capacity, self.tokens[position] + 1)
+                    self.tokens[position] = tokens
+                    self.full_at[position] = self.updated_at[position] + (capacity - tokens) / rate
+                    return
+        finally:
+            lock.release()
+
+    def check(self, entry, identity):
+        """
+        检查路由的限流规则，先检查按用户或 IP 的限流，再检查整个路由的限流；
+        被按用户或 IP 拒绝的请求不消耗路由的令牌，被路由限流拒绝的请求退还已经取出的用户或 IP 的令牌，
+        被拒绝的请求不会消耗任何一个令牌桶
+        :param entry: 路由的 DispatchEntry
+        :param identity: token 中的用户或客户端 IP，路由没有按用户或 IP 限流时不使用
+        :return: 需要等待的整数秒数（至少 1 秒），0 表示请求通过
+        """
+        now = time.monotonic()
+        retry_after = 0.0
+        if entry.rate_limit is not None:
+            key = bucket_key(entry.route_key, entry.rate_limit_by, identity)
+            retry_after = self.acquire(key, *entry.rate_limit, now)
+        if not retry_after and entry.route_rate_limit is not None:
+            retry_after = self.acquire(bucket_key(entry.route_key, "route"), *entry.route_rate_limit, now)
+            if retry_after and entry.rate_limit is not None:
+                self.refund(key, *entry.rate_limit)
+        return max(math.ceil(retry_after), 1) if retry_after else 0
@@ -0,0 +1,284 @@
+"""
+文件描述: 基于字节流的增量 HTTP 请求解析器
+            1. 从 asyncio.StreamReader 中读取请求头，直到遇到 \r\n\r\n（请求头大小有上限）
+            2. 根据 Content-Length 读取完整的请求体，或者解码 Transfer-Encoding: chunked 分块传输的请求体
+            3. 全程使用 bytes 处理，只在需要时才解码为字符串，避免在热路径上反复分割、拷贝字符串
+
+创建者: 汐琳
+创建时间: 2025-01-06 10:12:31
+"""
+import asyncio
+import json
+import urllib.parse
+
+HEADER_END = b"\r\n\r\n"  # 请求头结束标志
+LINE_END = b"\r\n"  # HTTP 标准中定义的换行符是“回车 + 换行”
+
+HEADER_NAME_CACHE_SIZE = 512  # 请求头名称规范化缓存的最大条目数，防止恶意请求头撑爆内存
+header_name_cache = {}  # 原始请求头名称 -> 规范化后的名称，常见请求头只需要规范化一次
+
+
+async def with_deadline(awaitable, timeout):
+    """
+    在超时时间内等待 awaitable 完成，超时抛出 asyncio.TimeoutError；timeout 为 None 时不限制时间
+    asyncio.timeout 不需要像 wait_for 一样额外创建 Task，开销更小（Python 3.11 以下没有 asyncio.timeout，退回到 wait_for）
+    """
+    if timeout is None:
+        return await awaitable
+    if not hasattr(asyncio, "timeout"):
+        return await asyncio.wait_for(awaitable, timeout)
+    async with asyncio.timeout(timeout):
+        return await awaitable
+
+
+class HTTPParseError(Exception):
+    """
+    请求解析失败时抛出的异常，携带需要返回给客户端的 HTTP 状态码
+    """
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+async def read_request_head(reader: asyncio.StreamReader, max_header_size: int):
+    """
+    读取请求行和请求头（直到 \r\n\r\n）
+    :param reader: asyncio.StreamReader 对象
+    :param max_header_size: 请求头最大字节数
+    :return: 请求头的原始字节；如果客户端在发送任何数据之前关闭了连接，返回 None
+    """
+    try:
+        head = await reader.readuntil(HEADER_END)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None  # 客户端已关闭连接，且没有残留数据
+        raise HTTPParseError(400, "请求头不完整")
+    except asyncio.LimitOverrunError:
+        raise HTTPParseError(431, "请求头过大")
+
+    if len(head) > max_header_size:
+        raise HTTPParseError(431, "请求头过大")
+
+    # RFC 7230 要求服务端忽略请求行之前多余的空行（部分客户端在长连接上会多发送一个 \r\n）
+    if head[:1] in (b"\r", b"\n"):
+        head = head.lstrip(LINE_END)
+        if not head:
+            return await read_request_head(reader, max_header_size)
+
+    return head
+
+
+def parse_request_head(head: bytes):
+    """
+    解析请求行和请求头
+    :param head: read_request_head 读取到的请求头原始字节
+    :return: (method, target, version, header_dict)
+    """
+    # 请求头只允许 ASCII 字符，统一按 latin-1 一次性解码，不会出现解码失败
+    request_line, *header_lines = head[:-len(HEADER_END)].decode("latin-1").split("\r\n")
+
+    try:
+        method, target, version = request_line.split(" ")
+    except ValueError:
+        raise HTTPParseError(400, "请求行格式错误")
+
+    if not version.startswith("HTTP/"):
+        raise HTTPParseError(400, "不支持的协议版本")
+
+    header_dict = {}  # 接口头部信息，请求头名称统一为首字母大写的形式，例如 content-type -> Content-Type
+    for header_line in header_lines:
+        header_name, sep, header_value = header_line.partition(":")
+        if not sep:
+            raise HTTPParseError(400, "请求头格式错误")
+        normalized_name = header_name_cache.get(header_name)
+        if normalized_name is None:
+            if not header_name or header_name != header_name.strip():
+                raise HTTPParseError(400, "请求头格式错误")
+            normalized_name = header_name.title()
+            if len(header_name_cache) < HEADER_NAME_CACHE_SIZE:
+                header_name_cache[header_name] = normalized_name
+        header_dict[normalized_name] = header_value.strip()
+
+    return method.upper(), target, version, header_dict
+
+
+async def read_chunked_body(reader: asyncio.StreamReader, max_body_size: int = None):
+    """
+    读取并解码 Transfer-Encoding: chunked 分块传输的请求体
+    分块格式：<十六进制块大小>[;扩展]\r\n<块数据>\r\n ... 0\r\n[尾部头]\r\n
+    :param reader: asyncio.StreamReader 对象
+    :param max_body_size: 请求体最大字节数，None 表示不限制
+    :return: 完整的请求体字节
+    """
+    chunks = []
+    body_size = 0
+    try:
+        while True:
+            size_line = await reader.readuntil(LINE_END)
+            size_text = size_line.split(b";", 1)[0].strip()  # 去掉分块扩展
+            try:
+                chunk_size = int(size_text, 16)
+            except ValueError:
+                raise HTTPParseError(400, "分块大小格式错误")
+            if chunk_size < 0:
+                raise HTTPParseError(400, "分块大小格式错误")
+
+            if chunk_size == 0:
+                # 读取尾部头（trailer），直到遇到空行
+                while (await reader.readuntil(LINE_END)) != LINE_END:
+                    pass
+                break
+
+            body_size += chunk_size
+            if max_body_size is not None and body_size > max_body_size:
+                raise HTTPParseError(413, "请求体过大")
+
+            chunks.append(await reader.readexactly(chunk_size))
+            if (await reader.readexactly(2)) != LINE_END:
+                raise HTTPParseError(400, "分块数据格式错误")
+    except asyncio.IncompleteReadError:
+        raise HTTPParseError(400, "请求体不完整")
+    except asyncio.LimitOverrunError:
+        raise HTTPParseError(400, "分块数据格式错误")
+
+    return b"".join(chunks)
+
+
+async def read_request_body(reader: asyncio.StreamReader, header_dict: dict, max_body_size: int = None):
+    """
+    根据请求头读取完整的请求体
+    :param reader: asyncio.StreamReader 对象
+    :param header_dict: 请求头字典
+    :param max_body_size: 请求体最大字节数，None 表示不限制
+    :return: 请求体字节，没有请求体时返回 b""
+    """
+    transfer_encoding = header_dict.get("Transfer-Encoding")
+    if transfer_encoding is not None:
+        if transfer_encoding.lower() != "chunked":
+            raise HTTPParseError(501, "不支持的 Transfer-Encoding")
+        return await read_chunked_body(reader, max_body_size)
+
+    content_length = header_dict.get("Content-Length")
+    if content_length is None:
+        return b""
+
+    if not content_length.isdigit():
+        raise HTTPParseError(400, "Content-Length 格式错误")
+
+    length = int(content_length)
+    if length == 0:
+        return b""
+
+    # 在读取之前根据 Content-Length 拒绝过大的请求体，避免占用内存
+    if max_body_size is not None and length > max_body_size:
+        raise HTTPParseError(413, "请求体过大")
+
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise HTTPParseError(400, "请求体不完整")
+
+
+def split_target(target: str):
+    """
+    将请求目标拆分为路径和查询字符串，只保留纯净的路由
+    :param target: 请求行中的请求目标，例如 /hello?a=1
+    :return: (path, query)
+    """
+    if target.startswith("/"):
+        # 常见的 origin-form，直接按 ? 拆分，避免 urlparse 的开销
+        path, _, query = target.partition("?")
+        path = path.partition("#")[0]
+        query = query.partition("#")[0]
+        return path, query
+
+    # absolute-form，例如 http://example.com/hello?a=1
+    parsed_url = urllib.parse.urlsplit(target)
+    return parsed_url.path or "/", parsed_url.query
+
+
+def parse_request_data(method: str, query: str, header_dict: dict, body: bytes):
+    """
+    解析请求数据：GET 请求解析查询参数，其他请求根据 Content-Type 解析请求体
+    :return: 接口数据字典
+    """
+    if method == "GET":
+        # GET 请求通常通过查询参数传递数据
+        return urllib.parse.parse_qs(query) if query else {}
+
+    data = {}
+    if not body:
+        return data
+
+    content_type = header_dict.get("Content-Type", "").lower()
+    if "application/x-www-form-urlencoded" in content_type:
+        # 处理 application/x-www-form-urlencoded 数据
+        data.update(urllib.parse.parse_qs(body.decode(errors="replace")))
+
+    elif "application/json" in content_type:
+        # 处理 application/json 数据，json.loads 可以直接处理 bytes，无需先解码
+        try:
+            post_data = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HTTPParseError(400, f"Failed to decode JSON: {e}")
+        if isinstance(post_data, dict):
+            data.update(post_data)
+        else:
+            data["body"] = post_data
+
+    return data
+
+
+async def read_request(reader: asyncio.StreamReader, max_header_size: int, max_body_size: int = None,
+                       header_timeout: float = None, body_timeout: float = None, idle_timeout: float = None,
+                       first_byte: bytes = None):
+    """
+    从连接中读取并解析一个完整的 HTTP 请求
+    :param reader: asyncio.StreamReader 对象
+    :param max_header_size: 请求头最大字节数
+    :param max_body_size: 请求体最大字节数，超过后返回 413，None 表示不限制
+    :param header_timeout: 从收到请求的第一个字节开始，读取完整请求头的超时时间（秒），超时返回 408
+    :param body_timeout: 读取完整请求体的超时时间（秒），超时返回 408
+    :param idle_timeout: 等待请求第一个字节的超时时间（秒），超时直接关闭连接，None 表示一直等待
+    :param first_byte: 调用方已经读取到的请求第一个字节，传入时不再等待（长连接上的空闲等待由调用方控制）
+    :return: 请求信息字典；如果客户端已关闭连接，返回 None
+    """
+    # 先等待请求的第一个字节，请求头的读取时限从收到第一个字节开始计算，这样长连接上的空闲等待不会被当作慢速请求
+    if first_byte is None:
+        try:
+            first_byte = await with_deadline(reader.readexactly(1), idle_timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return None
+
+    try:
+        if first_byte == b"\r" or first_byte == b"\n":
+            head = await with_deadline(read_request_head(reader, max_header_size), header_timeout)
+        else:
+            rest = await with_deadline(read_request_head(reader, max_header_size), header_timeout)
+            head = first_byte + rest if rest is not None else None
+    except asyncio.TimeoutError:
+        raise HTTPParseError(408, "读取请求头超时")
+
+    if head is None:
+        if first_byte.strip():
+            raise HTTPParseError(400, "请求头不完整")
+        return None
+
+    method, target, version, header_dict = parse_request_head(head)
+    try:
+        body = await with_deadline(read_request_body(reader, header_dict, max_body_size), body_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPParseError(408, "读取请求体超时")
+    path, query = split_target(target)
+
+    return {
+        "path": path,
+        "method": method,
+        "version": version,
+        "query": query,
+        "header_dict": header_dict,
+        "body": body,
+        "data": parse_request_data(method, query, header_dict, body),
+    }
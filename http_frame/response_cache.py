@@ -0,0 +1,285 @@
+"""
+文件描述: api 函数的响应缓存，get_func_dict(cache_ttl=...) 的 GET 路由在有效期内直接返回缓存的状态行和响应体，
+            不再执行 api 函数和序列化 JSON
+            1. 每个 HTTP 进程一个 LRU 缓存（ResponseCache），命中时没有任何跨进程开销
+            2. 可选的跨进程缓存（SharedResponseCache），在主进程中创建一块 multiprocessing.shared_memory，HTTP 进程通过 fork 继承，
+               某个进程生成的响应其他进程也可以直接使用。共享内存按固定大小划分为槽位，每个 key 只对应一个槽位（直接映射），
+               放不下的响应只缓存在本进程中。写入时加锁（同一槽位的写入互斥，锁被占用时放弃写入），
+               读取不加锁，通过槽位的版本号（seqlock）检测读到一半被改写的数据
+            3. 缓存 key 由请求方法、路由、请求路径、cache_key 中指定的查询参数，以及 cache_per_user=True 时 token 中的用户组成
+            4. 失效：每个路由对应一个共享的版本号，invalidate_response_cache 把版本号加一，所有进程中该路由已经缓存的响应立即失效；
+               进程池进程、后台任务进程和主进程中也可以调用（直接修改共享的版本号）；滚动重启时所有路由的缓存都会失效
+            5. 每个 HTTP 进程分别统计命中（本进程 / 共享内存）和未命中的次数，主进程中可以通过 SharedResponseCache.stats 汇总
+
+创建者: 汐琳
+创建时间: 2025-01-30 16:20:31
+"""
+import multiprocessing
+import struct
+from contextlib import nullcontext
+import time
+import zlib
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+from user.authority import token_subject
+from config import (RESPONSE_CACHE_SIZE, RESPONSE_CACHE_SHARED_SIZE, RESPONSE_CACHE_SHARED_SLOT_SIZE,
+                    RESPONSE_CACHE_GENERATIONS)
+
+# 共享内存槽位的头部: 版本号（奇数表示正在写入）、过期时间（time.monotonic，同一台机器上所有进程一致）、路由版本号、
+# key 长度、状态行长度、响应体长度
+SLOT_HEADER = struct.Struct("<QdqIII")
+SEQUENCE = struct.Struct("<Q")
+LOCK_STRIPES = 64  # 共享内存写锁的数量，槽位按编号分配到各个锁上
+
+COUNTER_NAMES = ("hits", "shared_hits", "misses", "stores", "invalidations")
+
+response_cache = None  # 当前 HTTP 进程的响应缓存，由 HTTPServer 创建，api 函数通过 invalidate_response_cache 使缓存失效
+shared_response_cache = None  # 主进程创建的跨进程缓存，由 ServerManager 设置，之后创建的子进程通过 fork 继承
+
+
+def route_generation_index(route_key, generations):
+    """
+    路由对应的版本号位置，不同路由可能共用一个版本号，只会导致多余的失效
+    """
+    return zlib.crc32(f"{route_key[1]} {route_key[0]}".encode()) % generations
+
+
+def invalidate_all_generations(generations, lock=None):
+    """
+    所有路由的版本号加一，所有路由已经缓存的响应失效
+    :param lock: 共享版本号的锁，共享数组上的 += 不是原子操作，多个进程同时加一时会丢失其中一次失效
+    """
+    with lock or nullcontext():
+        for index in range(len(generations)):
+            generations[index] += 1
+
+
+def invalidate_generation(generations, index, lock=None):
+    """
+    一个路由版本号加一，该位置上所有路由已经缓存的响应失效
+    :param lock: 共享版本号的锁
+    """
+    with lock or nullcontext():
+        generations[index] += 1
+
+
+class SharedResponseCache:
+    def __init__(self, worker_slots, memory_size=RESPONSE_CACHE_SHARED_SIZE, slot_size=RESPONSE_CACHE_SHARED_SLOT_SIZE,
+                 generations=RESPONSE_CACHE_GENERATIONS):
+        """
+        在主进程中创建，HTTP 进程通过 fork 继承
+        :param worker_slots: HTTP 进程的槽位数量，每个槽位一组计数器
+        :param memory_size: 共享内存的大小（字节），None 或 0 表示不使用跨进程缓存，只共享路由版本号和计数器
+        :param slot_size: 每个共享内存槽位的大小（字节），超过该大小的响应只缓存在各个进程中
+        :param generations: 路由版本号的数量
+        """
+        self.generations = multiprocessing.Array("q", generations, lock=False)  # 路由版本号，加一即失效，读取不加锁
+        self.generation_lock = multiprocessing.Lock()  # 修改路由版本号时加锁，失效操作很少，一把锁即可
+        self.counters = multiprocessing.Array("q", worker_slots * len(COUNTER_NAMES), lock=False)  # 每个 HTTP 进程只写自己的计数器
+        self.worker_slots = worker_slots
+        self.slot_size = slot_size
+        self.memory = None
+        self.slots = 0
+        if memory_size:
+            self.slots = max(memory_size // slot_size, 1)
+            self.memory = shared_memory.SharedMemory(create=True, size=self.slots * slot_size)
+            self.locks = [multiprocessing.Lock() for _ in range(min(LOCK_STRIPES, self.slots))]
+
+    def get(self, key, generation, now):
+        """
+        读取共享内存中的响应
+        :return: (过期时间, 状态行, 响应体)，不存在、已过期、已失效或读取期间被改写时返回 None
+        """
+        slot = zlib.crc32(key) % self.slots
+        offset = slot * self.slot_size
+        buf = self.memory.buf
+        sequence, expires_at, stored_generation, key_length, status_length, body_length = SLOT_HEADER.unpack_from(buf, offset)
+        if sequence & 1 or not sequence or expires_at <= now or stored_generation != generation or key_length != len(key):
+            return None
+        start = offset + SLOT_HEADER.size
+        data = bytes(buf[start:start + key_length + status_length + body_length])
+        if SEQUENCE.unpack_from(buf, offset)[0] != sequence or data[:key_length] != key:
+            return None
+        return expires_at, data[key_length:key_length + status_length], data[key_length + status_length:]
+
+    def put(self, key, generation, expires_at, status_line, body_bytes):
+        """
+        写入共享内存，响应太大或者槽位的锁正在被其他进程占用时放弃写入
+        :return: 是否写入
+        """
+        if SLOT_HEADER.size + len(key) + len(status_line) + len(body_bytes) > self.slot_size:
+            return False
+        slot = zlib.crc32(key) % self.slots
+        lock = self.locks[slot % len(self.locks)]
+        if not lock.acquire(block=False):
+            return False
+        try:
+            offset = slot * self.slot_size
+            buf = self.memory.buf
+            sequence = SEQUENCE.unpack_from(buf, offset)[0] + 1
+            SEQUENCE.pack_into(buf, offset, sequence)  # 奇数：正在写入，读取的进程会放弃
+            start = offset + SLOT_HEADER.size
+            data = key + status_line + body_bytes
+            buf[start:start + len(data)] = data
+            SLOT_HEADER.pack_into(buf, offset, sequence + 1, expires_at, generation,
+                                  len(key), len(status_line), len(body_bytes))
+        finally:
+            lock.release()
+        return True
+
+    def invalidate(self, path=None, method="GET"):
+        """
+        在没有 ResponseCache 的进程中（进程池进程、后台任务进程、主进程）使路由的缓存失效，参数见 ResponseCache.invalidate
+        """
+        if path is None:
+            invalidate_all_generations(self.generations, self.generation_lock)
+        else:
+            index = route_generation_index((path, method.upper()), len(self.generations))
+            invalidate_generation(self.generations, index, self.generation_lock)
+
+    def stats(self):
+        """
+        汇总所有 HTTP 进程的命中和未命中次数
+        """
+        totals = dict.fromkeys(COUNTER_NAMES, 0)
+        for slot in range(self.worker_slots):
+            for index, name in enumerate(COUNTER_NAMES):
+                totals[name] += self.counters[slot * len(COUNTER_NAMES) + index]
+        return totals
+
+    def close(self):
+        """
+        主进程退出时释放共享内存
+        """
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+class ResponseCache:
+    def __init__(self, size=RESPONSE_CACHE_SIZE, shared=None, worker_slot=0):
+        """
+        HTTP 进程中的响应缓存
+        :param size: 本进程 LRU 缓存的最大条目数
+        :param shared: 主进程创建的 SharedResponseCache，None 表示只使用本进程的缓存（例如单独启动 HTTPServer）
+        :param worker_slot: 本进程的槽位编号，用于写入自己的计数器
+        """
+        self.size = size
+        self.shared = shared
+        self.entries = OrderedDict()  # key -> (过期时间, 路由版本号, 状态行, 响应体)
+        self.generation_indexes = {}  # route_key -> 路由版本号的位置
+        if shared is not None:
+            self.generations = shared.generations
+            self.generation_lock = shared.generation_lock
+            self.counters = shared.counters
+            self.counter_offset = worker_slot * len(COUNTER_NAMES)
+        else:
+            self.generations = [0] * RESPONSE_CACHE_GENERATIONS
+            self.generation_lock = None  # 只在本进程中使用，不需要加锁
+            self.counters = [0] * len(COUNTER_NAMES)
+            self.counter_offset = 0
+
+    def generation_index(self, route_key):
+        index = self.generation_indexes.get(route_key)
+        if index is None:
+            index = self.generation_indexes[route_key] = route_generation_index(route_key, len(self.generations))
+        return index
+
+    def count(self, name):
+        self.counters[self.counter_offset + COUNTER_NAMES.index(name)] += 1
+
+    @staticmethod
+    def make_key(entry, path, data, ctx):
+        """
+        生成缓存 key：请求方法、路由、请求路径、cache_key 中指定的查询参数，以及 cache_per_user=True 时 token 中的用户
+        """
+        parts = [entry.route_key[1], entry.route_key[0], path]
+        for name in entry.cache_key:
+            parts.append(repr(data.get(name)))
+        if entry.cache_per_user:
+            parts.append(repr(token_subject(ctx)))
+        return "\0".join(parts).encode()
+
+    def get(self, entry, key):
+        """
+        查找缓存的响应，先查本进程的 LRU 缓存，再查共享内存
+        :return: (状态行, 响应体)，没有命中时返回 None
+        """
+        now = time.monotonic()
+        generation = self.generations[self.generation_index(entry.route_key)]
+        cached = self.entries.get(key)
+        if cached is not None:
+            expires_at, stored_generation, status_line, body_bytes = cached
+            if expires_at > now and stored_generation == generation:
+                self.entries.move_to_end(key)
+                self.count("hits")
+                return status_line, body_bytes
+            del self.entries[key]
+
+        if self.shared is not None and self.shared.memory is not None:
+            cached = self.shared.get(key, generation, now)
+            if cached is not None:
+                expires_at, status_line, body_bytes = cached
+                self.store_local(key, expires_at, generation, status_line, body_bytes)
+                self.count("shared_hits")
+                return status_line, body_bytes
+
+        self.count("misses")
+        return None
+
+    def put(self, entry, key, status_line, body_bytes):
+        """
+        缓存 api 函数的响应，有效期为路由的 cache_ttl
+        """
+        expires_at = time.monotonic() + entry.cache_ttl
+        generation = self.generations[self.generation_index(entry.route_key)]
+        self.store_local(key, expires_at, generation, status_line, body_bytes)
+        if self.shared is not None and self.shared.memory is not None:
+            self.shared.put(key, generation, expires_at, status_line, body_bytes)
+        self.count("stores")
+
+    def store_local(self, key, expires_at, generation, status_line, body_bytes):
+        if self.size <= 0:
+            return
+        self.entries[key] = (expires_at, generation, status_line, body_bytes)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)  # 淘汰最久未使用的响应
+
+    def invalidate(self, path=None, method="GET"):
+        """
+        使路由的所有缓存失效，所有 HTTP 进程中的缓存都会失效
+        :param path: 注册时的路由路径（带参数的路由为路径模板），None 表示所有路由
+        :param method: 请求方法
+        """
+        if path is None:
+            invalidate_all_generations(self.generations, self.generation_lock)
+            self.entries.clear()
+        else:
+            invalidate_generation(self.generations, self.generation_index((path, method.upper())), self.generation_lock)
+        self.count("invalidations")
+
+    def stats(self):
+        """
+        本进程的命中和未命中次数
+        """
+        return {name: self.counters[self.counter_offset + index] for index, name in enumerate(COUNTER_NAMES)}
+
+
+def invalidate_response_cache(path=None, method="GET"):
+    """
+    api 函数中使响应缓存失效，例如修改数据的 POST 接口使对应的 GET 接口的缓存失效:
+        invalidate_response_cache("/items/{item_id:int}")
+    可以在 HTTP 进程、进程池进程（executor="process"）、后台任务进程和主进程中调用
+    :param path: 注册时的路由路径（带参数的路由为路径模板），None 表示所有路由
+    :param method: 请求方法
+    """
+    if response_cache is not None:
+        response_cache.invalidate(path, method)
+    elif shared_response_cache is not None:
+        shared_response_cache.invalidate(path, method)
+    else:
+        # 没有共享的路由版本号时，各个 HTTP 进程的缓存只能在本进程中失效，静默返回会让调用方误以为缓存已经失效
+        raise RuntimeError("当前进程无法使响应缓存失效：没有 cache_ttl 路由，或者不是由 ServerManager 启动的进程")
@@ -0,0 +1,269 @@
+"""
+文件描述: 路由匹配，服务启动时把请求分发表（http_frame/dispatch_table.py）编译为按路径段组织的前缀树，支持带类型的路径参数
+            1. 路由路径中可以使用 {参数名} 或 {参数名:类型}，类型为 str（默认）、int、float、uuid、path，
+               path 匹配剩余的所有路径段（包括 /），只能出现在路由的最后，例如：
+                   /user/{user_id:int}
+                   /files/{file_path:path}
+            2. 不含参数的路由直接用一次 (路径, 请求方法) 字典查找完成匹配；含参数的路由在前缀树中逐段匹配，
+               同一位置静态路径段优先于参数，参数按 int、float、uuid、str 的顺序尝试，最后是 path；
+               按该顺序找到第一个支持请求方法的路由，某个分支上的路由不支持该请求方法时继续尝试其他分支
+            3. 路径不存在时返回 404；路径匹配的路由都不支持该请求方法时返回 405，
+               Allow 响应头为所有匹配该路径的路由支持的请求方法，按方法组合预编码
+            4. 匹配到的路径参数按类型转换后放在 api 函数的 ctx["path_params"] 中
+
+创建者: 汐琳
+创建时间: 2025-01-29 10:36:12
+"""
+import re
+import uuid
+
+from http_frame.send_http_response import encode_header_block, DEFAULT_HEADERS
+
+
+INT_PATTERN = re.compile(r"-?[0-9]+")
+FLOAT_PATTERN = re.compile(r"-?[0-9]+(\.[0-9]+)?")
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}")
+
+MISMATCH = object()  # 转换函数的返回值，表示路径段与参数类型不匹配；匹配失败是常见情况，不使用异常
+
+
+def convert_int(segment):
+    # int() 还接受空格、下划线和其他语言的数字，路径参数只接受 ASCII 数字；非负整数是最常见的情况，不需要正则
+    if not (segment.isdigit() and segment.isascii()) and INT_PATTERN.fullmatch(segment) is None:
+        return MISMATCH
+    return int(segment)
+
+
+def convert_float(segment):
+    if FLOAT_PATTERN.fullmatch(segment) is None:
+        return MISMATCH
+    return float(segment)
+
+
+def convert_str(segment):
+    return segment or MISMATCH
+
+
+def convert_uuid(segment):
+    if UUID_PATTERN.fullmatch(segment) is None:
+        return MISMATCH
+    return str(uuid.UUID(segment))
+
+
+# 参数类型 -> 转换函数，按匹配时尝试的顺序排列
+PARAM_CONVERTERS = {
+    "int": convert_int,
+    "float": convert_float,
+    "uuid": convert_uuid,
+    "str": convert_str,
+}
+CATCH_ALL_TYPE = "path"
+
+ROUTE_FOUND = 200
+NOT_FOUND = (404, None, None)
+
+
+def parse_route_pattern(pattern):
+    """
+    解析路由路径
+    :param pattern: 路由路径，例如 /user/{user_id:int}/posts
+    :return: 路径段列表，静态段为字符串，参数为 (参数名, 类型)
+    """
+    if not pattern.startswith("/"):
+        raise ValueError(f"路由 '{pattern}' 必须以 / 开头")
+    segments = []
+    parts = pattern[1:].split("/")
+    for index, part in enumerate(parts):
+        if not (part.startswith("{") and part.endswith("}")):
+            if "{" in part or "}" in part:
+                raise ValueError(f"路由 '{pattern}' 中的参数必须占据完整的路径段: '{part}'")
+            segments.append(part)
+            continue
+        name, _, param_type = part[1:-1].partition(":")
+        param_type = param_type or "str"
+        if not name.isidentifier():
+            raise ValueError(f"路由 '{pattern}' 中的参数名 '{name}' 不合法")
+        if param_type not in PARAM_CONVERTERS and param_type != CATCH_ALL_TYPE:
+            raise ValueError(f"路由 '{pattern}' 中的参数类型 '{param_type}' 不支持，"
+                             f"可用的类型: {', '.join(list(PARAM_CONVERTERS) + [CATCH_ALL_TYPE])}")
+        if param_type == CATCH_ALL_TYPE and index != len(parts) - 1:
+            raise ValueError(f"路由 '{pattern}' 中 path 类型的参数只能出现在最后")
+        segments.append((name, param_type))
+    return segments
+
+
+class RouteNode:
+    __slots__ = ("static_children", "param_children", "param_types", "catch_all", "methods")
+
+    def __init__(self):
+        """
+        前缀树的节点，对应一个路径段
+        """
+        self.static_children = {}  # 静态路径段 -> 子节点
+        self.param_children = ()  # (转换函数, 子节点)，按 PARAM_CONVERTERS 的顺序排列，编译时由 param_types 生成
+        self.param_types = {}  # 参数类型 -> 子节点
+        self.catch_all = None  # path 类型参数的子节点
+        self.methods = {}  # 请求方法 -> DispatchEntry，在该节点结束的路由
+
+
+class Router:
+    def __init__(self, dispatch_table):
+        """
+        编译路由表
+        :param dispatch_table: build_dispatch_table 生成的 {(路由, 请求方法): DispatchEntry}
+        """
+        self.static_routes = {}  # (不含参数的路由路径, 请求方法) -> DispatchEntry
+        self.static_paths = {}  # 不含参数的路由路径 -> 节点，用于 405
+        self.root = RouteNode()  # 含参数的路由的前缀树
+        self.allow_header_blocks = {}  # 排序后的请求方法 -> 405 响应的预编码响应头
+        for (pattern, method), entry in dispatch_table.items():
+            if entry.param_names:
+                node = self.insert(parse_route_pattern(pattern))
+            else:
+                node = self.static_paths.setdefault(pattern, RouteNode())
+                self.static_routes[(pattern, method)] = entry
+            node.methods[method] = entry
+
+        for node in self.iterate_nodes():
+            # 按转换函数的优先级排序，匹配时依次尝试
+            node.param_children = tuple(
+                (converter, node.param_types[param_type])
+                for param_type, converter in PARAM_CONVERTERS.items() if param_type in node.param_types
+            )
+
+    def insert(self, segments):
+        node = self.root
+        for segment in segments:
+            if isinstance(segment, str):
+                node = node.static_children.setdefault(segment, RouteNode())
+            elif segment[1] == CATCH_ALL_TYPE:
+                node.catch_all = node.catch_all or RouteNode()
+                node = node.catch_all
+            else:
+                node = node.param_types.setdefault(segment[1], RouteNode())
+        return node
+
+    def iterate_nodes(self):
+        stack = [self.root] + list(self.static_paths.values())
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.static_children.values())
+            stack.extend(node.param_types.values())
+            if node.catch_all:
+                stack.append(node.catch_all)
+
+    def match(self, path, method):
+        """
+        匹配请求路径和请求方法
+        :return: (状态码, DispatchEntry, 路径参数)
+                 匹配成功时状态码为 200，路径参数为 {参数名: 值}，不含参数的路由为 None；
+                 404 时其余各项为 None；405 时最后一项为预编码的 Allow 响应头
+        """
+        entry = self.static_routes.get((path, method))
+        if entry is not None:
+            return ROUTE_FOUND, entry, None
+
+        segments = path[1:].split("/")
+        values = []
+        node = self.walk(segments, values)
+        if node is None or method not in node.methods:
+            # 贪心匹配走进了死路，或者匹配到的路由不支持该请求方法，回溯尝试其他分支
+            values = []
+            node = self.match_node(self.root, segments, 0, values, method)
+        if node is not None:
+            entry = node.methods[method]
+            return ROUTE_FOUND, entry, dict(zip(entry.param_names, values))
+
+        # 没有支持该请求方法的路由，收集所有匹配该路径的路由支持的请求方法
+        allowed = set()
+        static_node = self.static_paths.get(path)
+        if static_node is not None:
+            allowed.update(static_node.methods)
+        self.collect_methods(self.root, segments, 0, allowed)
+        if not allowed:
+            return NOT_FOUND
+        return 405, None, self.allow_header_block(allowed)
+
+    def allow_header_block(self, methods):
+        """
+        405 响应的预编码响应头，按请求方法的组合缓存
+        """
+        allow = ", ".join(sorted(methods))
+        header_block = self.allow_header_blocks.get(allow)
+        if header_block is None:
+            header_block = self.allow_header_blocks[allow] = encode_header_block(dict(DEFAULT_HEADERS, Allow=allow))
+        return header_block
+
+    def walk(self, segments, values):
+        """
+        不回溯的快速匹配：每一段都选择第一个匹配的分支（静态路径段、参数、path 参数的顺序），
+        与 match_node 的搜索顺序相同，所以走通并且支持请求方法时结果与 match_node 一致；否则由 match_node 回溯
+        """
+        node = self.root
+        for index, segment in enumerate(segments):
+            child = node.static_children.get(segment)
+            if child is None:
+                for converter, param_child in node.param_children:
+                    value = converter(segment)
+                    if value is not MISMATCH:
+                        values.append(value)
+                        child = param_child
+                        break
+                else:
+                    if node.catch_all is not None and node.catch_all.methods and segment:
+                        values.append("/".join(segments[index:]))
+                        return node.catch_all
+                    return None
+            node = child
+        return node if node.methods else None
+
+    def match_node(self, node, segments, index, values, method):
+        """
+        从 node 开始逐段匹配，静态路径段优先，匹配失败时回溯尝试参数
+        :param values: 已经匹配到的参数值，匹配成功后按顺序对应路由中的参数名
+        :param method: 请求方法，只匹配支持该请求方法的路由
+        :return: 匹配到的节点，没有匹配时返回 None
+        """
+        if index == len(segments):
+            return node if method in node.methods else None
+
+        segment = segments[index]
+        child = node.static_children.get(segment)
+        if child is not None:
+            matched = self.match_node(child, segments, index + 1, values, method)
+            if matched is not None:
+                return matched
+
+        for converter, child in node.param_children:
+            value = converter(segment)
+            if value is MISMATCH:
+                continue
+            values.append(value)
+            matched = self.match_node(child, segments, index + 1, values, method)
+            if matched is not None:
+                return matched
+            values.pop()
+
+        if node.catch_all is not None and method in node.catch_all.methods and segment:
+            values.append("/".join(segments[index:]))
+            return node.catch_all
+        return None
+
+    def collect_methods(self, node, segments, index, allowed):
+        """
+        收集所有匹配路径的路由支持的请求方法，只在返回 405 时使用
+        """
+        if index == len(segments):
+            allowed.update(node.methods)
+            return
+
+        segment = segments[index]
+        child = node.static_children.get(segment)
+        if child is not None:
+            self.collect_methods(child, segments, index + 1, allowed)
+        for converter, child in node.param_children:
+            if converter(segment) is not MISMATCH:
+                self.collect_methods(child, segments, index + 1, allowed)
+        if node.catch_all is not None and segment:
+            allowed.update(node.catch_all.methods)
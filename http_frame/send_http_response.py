@@ -1,46 +1,176 @@
 """
 文件描述: 用于将处理后的数据返回给客户端（异步版本）
+            状态行、静态响应头、连接管理响应头都会预先编码为 bytes 并缓存，
+            发送时通过一次 writelines 将状态行、响应头和响应体一起写入，避免每次请求都拼接字符串、编码
 
 创建者: 汐琳
 创建时间: 2024-12-06 17:24:05
 """
 import json  # 导入 JSON 模块
+from http import HTTPStatus
 
-async def send_http_response(writer, status_code=200, status_message="请求成功", headers=None, body=None):
+ENCODED_CACHE_SIZE = 256  # 每种预编码缓存的最大条目数，防止动态的状态消息撑爆内存
+
+status_line_cache = {}  # (状态码, 状态消息) -> 预编码的状态行
+keep_alive_block_cache = {}  # (超时时间, 剩余请求数) -> 预编码的 Connection/Keep-Alive 响应头
+
+CONNECTION_CLOSE_BLOCK = b"Connection: close\r\n"
+DEFAULT_HEADERS = {"Content-Type": "application/json"}  # 默认的响应头
+
+
+def encode_status_line(status_code, status_message):
+    """
+    获取预编码的状态行，例如 b"HTTP/1.1 200 OK\r\n"
+    :param status_code: HTTP 状态码
+    :param status_message: HTTP 状态消息
+    :return: 状态行 bytes
+    """
+    key = (status_code, status_message)
+    status_line = status_line_cache.get(key)
+    if status_line is None:
+        status_line = f"HTTP/1.1 {status_code} {status_message}\r\n".encode()
+        if len(status_line_cache) < ENCODED_CACHE_SIZE:
+            status_line_cache[key] = status_line
+    return status_line
+
+
+def encode_header_block(headers):
+    """
+    将响应头字典编码为 bytes，例如 b"Content-Type: application/json\r\n"
+    路由的静态响应头只需要在启动时编码一次
+    :param headers: 响应头字典
+    :return: 响应头 bytes
+    """
+    return "".join(f"{header_name}: {header_value}\r\n" for header_name, header_value in headers.items()).encode()
+
+
+def encode_connection_block(keep_alive=False, keep_alive_timeout=None, keep_alive_max=None):
+    """
+    获取预编码的连接管理响应头，告知客户端本连接是否可以继续复用
+    :param keep_alive: 发送完本次响应后是否保持连接
+    :param keep_alive_timeout: 长连接空闲超时时间（秒）
+    :param keep_alive_max: 该连接剩余可处理的请求数量
+    :return: Connection / Keep-Alive 响应头 bytes
+    """
+    if not keep_alive:
+        return CONNECTION_CLOSE_BLOCK
+
+    key = (keep_alive_timeout, keep_alive_max)
+    connection_block = keep_alive_block_cache.get(key)
+    if connection_block is None:
+        keep_alive_params = []
+        if keep_alive_timeout is not None:
+            keep_alive_params.append(f"timeout={int(keep_alive_timeout)}")
+        if keep_alive_max is not None:
+            keep_alive_params.append(f"max={int(keep_alive_max)}")
+
+        connection_block = "Connection: keep-alive\r\n"
+        if keep_alive_params:
+            connection_block += f"Keep-Alive: {', '.join(keep_alive_params)}\r\n"
+        connection_block = connection_block.encode()
+
+        if len(keep_alive_block_cache) < ENCODED_CACHE_SIZE:
+            keep_alive_block_cache[key] = connection_block
+    return connection_block
+
+
+def encode_body(body):
+    """
+    将响应体序列化为 bytes
+    :param body: 响应体内容，通常是 JSON 格式的字典
+    :return: 响应体 bytes
+    """
+    if body:
+        return json.dumps(body, ensure_ascii=False).encode()  # 将 JSON 数据转换为字节流
+    return b""
+
+
+def write_response(writer, status_line, header_block, connection_block, body_bytes=b"", extra_header_block=b""):
+    """
+    将预编码的各个部分通过一次 writelines 写入，不再拼接出完整的响应再发送
+    :param writer: asyncio.StreamWriter 对象
+    :param status_line: 预编码的状态行
+    :param header_block: 预编码的静态响应头
+    :param connection_block: 预编码的连接管理响应头
+    :param body_bytes: 响应体 bytes
+    :param extra_header_block: 预编码的其他响应头，例如 Content-Encoding
+    """
+    writer.writelines((
+        status_line,
+        header_block,
+        connection_block,
+        extra_header_block,
+        b"Content-Length: %d\r\n\r\n" % len(body_bytes),  # 自动计算并设置 Content-Length，头部以空行结束
+        body_bytes,
+    ))
+
+
+DEFAULT_HEADER_BLOCK = encode_header_block(DEFAULT_HEADERS)
+
+# 预先编码常用状态码的标准状态行
+for common_status in (HTTPStatus.OK, HTTPStatus.CREATED, HTTPStatus.NO_CONTENT, HTTPStatus.BAD_REQUEST,
+                      HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND,
+                      HTTPStatus.METHOD_NOT_ALLOWED, HTTPStatus.INTERNAL_SERVER_ERROR):
+    encode_status_line(common_status.value, common_status.phrase)
+
+
+async def send_http_response(writer, status_code=200, status_message="请求成功", headers=None, body=None,
+                             keep_alive=False, keep_alive_timeout=None, keep_alive_max=None):
     """
     构造并发送一个完整的 HTTP 响应（异步版本）。
 
     :param writer: asyncio.StreamWriter 对象，用于向客户端发送数据
     :param status_code: HTTP 状态码 (例如: 404, 200)
     :param status_message: HTTP 状态消息 (例如: "Not Found", "OK")
-    :param headers: 响应头字典，例如 {"Content-Type": "application/json"}
+    :param headers: 响应头字典，例如 {"Content-Type": "application/json"}，也可以直接传入 encode_header_block 预编码后的 bytes
     :param body: 响应体内容，通常是 JSON 格式的字典
+    :param keep_alive: 发送完本次响应后是否保持连接，决定 Connection 响应头
+    :param keep_alive_timeout: 长连接空闲超时时间（秒），用于生成 Keep-Alive 响应头
+    :param keep_alive_max: 该连接剩余可处理的请求数量，用于生成 Keep-Alive 响应头
     """
     # 初始化响应头部
     if headers is None:
-        headers = {"Content-Type": "application/json"}
+        header_block = DEFAULT_HEADER_BLOCK
+    elif isinstance(headers, bytes):
+        header_block = headers
+    else:
+        header_block = encode_header_block(headers)
 
-    # 构造状态行
-    status_line = f"HTTP/1.1 {status_code} {status_message}\r\n"
+    write_response(
+        writer,
+        encode_status_line(status_code, status_message),
+        header_block,
+        encode_connection_block(keep_alive, keep_alive_timeout, keep_alive_max),
+        encode_body(body),
+    )
+    await writer.drain()  # 确保数据完全发送
 
-    # 构造响应体
-    if body:
-        body_bytes = json.dumps(body, ensure_ascii=False).encode()  # 将 JSON 数据转换为字节流
-        headers["Content-Length"] = str(len(body_bytes))  # 自动计算并设置 Content-Length
-    else:
-        body_bytes = b""
-        headers["Content-Length"] = "0"
 
-    # 构造头部
-    header_lines = ""
-    for header_name, header_value in headers.items():
-        header_lines += f"{header_name}: {header_value}\r\n"
+async def send_streaming_response(writer, status_line, header_block, connection_block, chunks, chunked=True):
+    """
+    流式发送响应体，每发送一个数据块都会等待 drain，客户端接收慢时暂停生成数据（背压）
+    :param writer: asyncio.StreamWriter 对象
+    :param status_line: 预编码的状态行
+    :param header_block: 预编码的静态响应头
+    :param connection_block: 预编码的连接管理响应头
+    :param chunks: 异步迭代器，逐个产出 bytes 数据块
+    :param chunked: 是否使用 Transfer-Encoding: chunked 发送；HTTP/1.0 客户端不支持分块传输，
+                    此时直接发送原始数据，并以关闭连接表示响应结束（connection_block 必须是 Connection: close）
+    """
+    if chunked:
+        writer.writelines((status_line, header_block, connection_block, b"Transfer-Encoding: chunked\r\n\r\n"))
+    else:
+        writer.writelines((status_line, header_block, connection_block, b"\r\n"))
 
-    # 完整的响应：状态行 + 头部 + 空行
-    response = status_line + header_lines + "\r\n"
+    async for chunk in chunks:
+        if not chunk:
+            continue  # 空数据块在分块传输中表示响应结束，需要跳过
+        if chunked:
+            writer.writelines((b"%X\r\n" % len(chunk), chunk, b"\r\n"))
+        else:
+            writer.write(chunk)
+        await writer.drain()
 
-    # 使用 writer 异步发送响应数据
-    writer.write(response.encode())  # 发送状态行和头部
-    if body_bytes:
-        writer.write(body_bytes)  # 如果有响应体，发送响应体
-    await writer.drain()  # 确保数据完全发送
+    if chunked:
+        writer.write(b"0\r\n\r\n")  # 最后一个长度为 0 的数据块表示响应结束
+    await writer.drain()
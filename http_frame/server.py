@@ -4,59 +4,203 @@
 创建者: 汐琳
 创建时间: 2024-12-25 15:50:05
 """
-import socket  # 导入套接字模块
-import json
-import urllib.parse
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-from http_frame.send_http_response import send_http_response
-from user.authority import Authority
+from config import (KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS, MAX_HEADER_SIZE, PIPELINE_MAX_REQUESTS,
+                    HANDLER_THREAD_POOL_SIZE, COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL, COMPRESSION_THREAD_THRESHOLD,
+                    COMPRESSION_CACHE_SIZE, COMPRESSION_CACHE_MAX_BYTES, COMPRESSION_CACHE_MAX_BODY_SIZE, LISTEN_BACKLOG, MAX_CONNECTIONS, HEADER_READ_TIMEOUT, BODY_READ_TIMEOUT,
+                    MAX_BODY_SIZE, DRAIN_TIMEOUT, DRAIN_IDLE_GRACE, RESPONSE_CACHE_SIZE)
+from http_frame.listener import create_listen_socket
+from http_frame.compression import ResponseCompressor, negotiate_encoding, CONTENT_ENCODING_BLOCKS, VARY_BLOCK
+from http_frame.request_parser import HTTPParseError, read_request, with_deadline
+from http_frame import response_cache
+from http_frame.dispatch_table import build_dispatch_table
+from http_frame.rate_limiter import SharedRateLimiter, retry_after_block
+from http_frame.middleware import Request
+from http_frame.router import Router, ROUTE_FOUND
+from project_frame.process_pool import ProcessPoolFull, ProcessPoolTimeout
+from http_frame.send_http_response import (send_http_response, write_response, send_streaming_response, encode_status_line,
+                                           encode_header_block, encode_connection_block, encode_body, DEFAULT_HEADERS,
+                                           DEFAULT_HEADER_BLOCK)
+from http_frame.streaming import StreamingBody, is_streaming_body, iterate_chunks
+from user.authority import Authority, token_subject
+
+RETRY_AFTER_HEADER_BLOCK = encode_header_block(dict(DEFAULT_HEADERS, **{"Retry-After": "1"}))  # 拒绝连接时建议客户端 1 秒后重试
+TOO_MANY_REQUESTS_STATUS_LINE = encode_status_line(429, "Too Many Requests")  # 超过路由的限流规则时返回
+INTERNAL_SERVER_ERROR_STATUS_LINE = encode_status_line(500, "Internal Server Error")  # api 函数抛出异常时返回
+GATEWAY_TIMEOUT_STATUS_LINE = encode_status_line(504, "Gateway Timeout")  # 进程池中的 api 函数超过 PROCESS_POOL_TASK_TIMEOUT 没有返回时返回
+LINGERING_CLOSE_TIMEOUT = 1  # 发送错误响应后，最多等待多少秒丢弃客户端剩余的数据
+LINGERING_READ_SIZE = 64 * 1024  # 丢弃数据时每次读取的字节数
 
 class HTTPServer:
-    def __init__(self, port, route_handlers, import_api_func_dict):
+    def __init__(self, port, route_handlers, import_api_func_dict,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT, keep_alive_max_requests=KEEP_ALIVE_MAX_REQUESTS,
+                 max_header_size=MAX_HEADER_SIZE, pipeline_max_requests=PIPELINE_MAX_REQUESTS,
+                 handler_thread_pool_size=HANDLER_THREAD_POOL_SIZE, process_pool_client=None,
+                 compression_min_size=COMPRESSION_MIN_SIZE, compression_level=COMPRESSION_LEVEL,
+                 compression_thread_threshold=COMPRESSION_THREAD_THRESHOLD, compression_cache_size=COMPRESSION_CACHE_SIZE,
+                 compression_cache_max_bytes=COMPRESSION_CACHE_MAX_BYTES,
+                 compression_cache_max_body_size=COMPRESSION_CACHE_MAX_BODY_SIZE,
+                 listen_backlog=LISTEN_BACKLOG, max_connections=MAX_CONNECTIONS, header_read_timeout=HEADER_READ_TIMEOUT,
+                 body_read_timeout=BODY_READ_TIMEOUT, max_body_size=MAX_BODY_SIZE, listen_socket=None, reuse_port=False,
+                 drain_timeout=DRAIN_TIMEOUT, drain_idle_grace=DRAIN_IDLE_GRACE, router=None,
+                 response_cache_size=RESPONSE_CACHE_SIZE, shared_response_cache=None, worker_slot=0, rate_limiter=None,
+                 middleware_dict=None):
         self.port = port  # 服务器监听的端口
         self.route_handlers = route_handlers # 路由和 api 函数的关系字典
-        self.import_api_func_dict = import_api_func_dict # 在主进程中引入的 api 函数字典
+        self.import_api_func_dict = import_api_func_dict # 在主进程中引入的 api 函数字典，key 为模块限定名称
+        self.keep_alive_timeout = keep_alive_timeout # 长连接空闲超时时间（秒）
+        self.keep_alive_max_requests = keep_alive_max_requests # 单个连接最多处理的请求数量
+        self.max_header_size = max_header_size # 请求头最大字节数
+        self.pipeline_max_requests = pipeline_max_requests # 单个连接上等待处理的流水线请求数量上限
+
+        # 连接准入控制和慢速客户端防护
+        self.listen_backlog = listen_backlog # 监听队列长度
+        self.max_connections = max_connections # 同时处理的连接数量上限
+        self.header_read_timeout = header_read_timeout # 读取请求头的时限（秒）
+        self.body_read_timeout = body_read_timeout # 读取请求体的时限（秒）
+        self.max_body_size = max_body_size # 请求体最大字节数
+        self.active_connections = 0 # 当前正在处理的连接数量
+        self.handled_requests = 0 # 本进程累计处理的请求数量，主进程据此回收处理请求过多的进程
+
+        # 监听策略：listen_socket 为主进程创建、本进程继承的监听套接字；否则由本进程自己绑定端口，reuse_port 表示是否设置 SO_REUSEPORT
+        self.listen_socket = listen_socket
+        self.reuse_port = reuse_port
+
+        # 停止服务时的排空状态
+        self.server = None # asyncio.start_server 创建的服务器
+        self.stopped = None # 调用 stop_accepting 后完成的 Future
+        self.draining = False # 是否已经停止接受新连接，正在等待已有连接处理完毕
+        self.drain_timeout = drain_timeout # 等待已有连接处理完毕的时限（秒）
+        self.connection_tasks = set() # 所有正在处理的连接的协程任务
+        self.idle_request_queues = set() # 正在等待下一个请求的空闲连接的请求队列，排空时直接关闭这些连接
+        self.drain_idle_grace = drain_idle_grace # 开始排空后，等待多久关闭空闲的长连接（秒）
+        self.idle_connections_closed = False # 是否已经关闭了空闲连接，之后变为空闲的连接立即关闭
+
+        # 编译后的路由表，支持路径参数，并区分 404 和 405；ServerManager 在主进程中生成后传入，单独启动时在这里生成
+        self.router = router or Router(build_dispatch_table(route_handlers, import_api_func_dict, middleware_dict))
+        # 流式响应指定了 Content-Type 时使用的响应头，key 为 (路由, 请求方法, Content-Type)，第一次使用时编码
+        self.content_type_header_blocks = {}
+        # 返回值固定不变的 api 函数的响应缓存，key 为 (路由, 请求方法)，value 为 (预编码的状态行, 序列化后的响应体)
+        self.constant_response_cache = {}
+        # cache_ttl 路由的响应缓存，shared_response_cache 为主进程创建的跨进程缓存，worker_slot 为本进程的计数器位置
+        self.response_cache = response_cache.ResponseCache(response_cache_size, shared_response_cache, worker_slot)
+        response_cache.response_cache = self.response_cache  # api 函数通过 invalidate_response_cache 使缓存失效
+        # coalesce=True 的路由正在执行的请求，key 为 make_coalesce_key 生成的请求标识，value 为等待编码后响应的 Future
+        self.inflight_requests = {}
+        self.coalesced_requests = 0 # 本进程累计合并的请求数量（等待其他请求的结果、没有执行 api 函数的请求）
+        # 限流的令牌桶，ServerManager 在主进程中创建后传入，所有 HTTP 进程共用；单独启动时在第一次限流检查时创建，只对本进程生效
+        self.rate_limiter = rate_limiter
+        self.rate_limited_requests = 0 # 本进程累计因限流返回 429 的请求数量
 
-    async def serve_forever(self):
+        # 用于执行 executor="thread" 的同步 api 函数的线程池，每个 HTTP 进程一个，线程数量有上限
+        self.handler_thread_pool_size = handler_thread_pool_size
+        self.handler_thread_pool = None
+        # ServerManager 共享进程池的客户端，用于执行 executor="process" 的 api 函数
+        self.process_pool_client = process_pool_client
+
+        # 响应压缩器，每个 HTTP 进程一个，压缩结果缓存只在本进程内有效
+        self.compressor = ResponseCompressor(compression_min_size, compression_level,
+                                             compression_thread_threshold, compression_cache_size,
+                                             compression_cache_max_bytes, compression_cache_max_body_size)
+
+    def get_content_type_header_block(self, entry, content_type):
         """
-        启动 HTTP 服务，并监听客户端发送的请求
+        获取替换了 Content-Type 的路由响应头（流式响应可以指定自己的 Content-Type，例如 application/x-ndjson）
+        :param entry: 路由的 DispatchEntry
+        :param content_type: 响应的 Content-Type
+        :return: 预编码的响应头
+        """
+        key = entry.route_key + (content_type,)
+        header_block = self.content_type_header_blocks.get(key)
+        if header_block is None:
+            headers = dict(DEFAULT_HEADERS, **entry.response_headers)
+            headers["Content-Type"] = content_type
+            header_block = self.content_type_header_blocks[key] = encode_header_block(headers)
+        return header_block
+
+    async def serve_forever(self, on_listening=None):
+        """
+        启动 HTTP 服务，并监听客户端发送的请求，调用 stop_accepting 后停止接受新连接，等待已有连接处理完毕后返回
+        :param on_listening: 开始接受连接后调用的函数，ServerManager 用它通知主进程新进程已经就绪
         :return:
         """
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # 允许端口复用 -- 虽然说 asyncio 是自主支持端口复用，但是如果不添加这句代码会报错，不允许复用端口
-        server_socket.bind(('0.0.0.0', self.port))  # 绑定 IP 和端口
-        server_socket.listen(5) # 开始监听，最多允许 5 个连接排队
+        # 主进程已经创建了监听套接字（inherit 模式）时直接使用，否则本进程自己绑定端口（reuseport 模式下由内核做负载均衡）
+        server_socket = self.listen_socket
+        if server_socket is None:
+            server_socket = create_listen_socket(self.port, self.listen_backlog, reuse_port=self.reuse_port)
 
-        server = await asyncio.start_server(self.handle_client, sock=server_socket)  # 异步创建 TCP 服务器
+        # 异步创建 TCP 服务器，limit 限制 StreamReader 缓冲区大小，读取请求头时超过该大小会直接报错，而不是无限缓冲
+        self.server = await asyncio.start_server(self.handle_client, sock=server_socket, limit=self.max_header_size)
+        self.stopped = asyncio.get_running_loop().create_future()
         print(f"Server listening on port {self.port}...")  # 打印启动信息
+        if on_listening:
+            on_listening()
+
+        # 运行服务器直到调用 stop_accepting
+        try:
+            await self.stopped
+        finally:
+            self.server.close()  # 关闭监听套接字，不再接受新连接，已经建立的连接不受影响
 
-        # 运行服务器直到手动停止
-        async with server:
-            await server.serve_forever()  # 异步地一直运行，直到手动停止
+        await self.drain_connections()
 
-    async def parsing_data(self, reader):
+    def stop_accepting(self):
         """
-        解析客户端发送的数据
-        :param reader:
-        :return:
+        停止接受新连接并开始排空：立即关闭空闲的长连接，正在处理请求的连接在返回当前响应后关闭（Connection: close），
+        serve_forever 在所有连接关闭后返回；可以直接作为事件循环的信号处理函数使用
         """
-        # request 前端传过来的数据
-        request = (await reader.read(1024)).decode()  # 异步读取请求数据（最大 1024 字节），并使用decode()方法将字节流解码为字符串  asyncio.start_server 提供的 reader 和 writer 是对原始套接字的封装
-        if not request:
-            return  # 如果没有请求数据，直接返回
+        if self.draining:
+            return
+        self.draining = True
+        # 正在使用的长连接通常很快会发来下一个请求，并在响应中收到 Connection: close；
+        # 等待一小段时间后仍然空闲的连接才主动关闭，减少客户端恰好在关闭时发出请求的情况
+        asyncio.get_running_loop().call_later(self.drain_idle_grace, self.close_idle_connections)
+        if self.stopped is not None and not self.stopped.done():
+            self.stopped.set_result(None)
 
-        # 解析请求头，提取请求方法、路径、HTTP 版本、头部信息等
-        # 状态行： HTTP/1.0 200 OK -- 200 是状态码
-        request_line, *headers = request.split('\r\n')  # 按行分隔请求和头部 -- HTTP 标准中定义的换行符是“回车 + 换行”
-        method, path, version = request_line.split()  # 提取方法、路径和 HTTP 版本
+    def close_idle_connections(self):
+        """
+        关闭所有正在等待下一个请求的空闲连接
+        """
+        self.idle_connections_closed = True
+        for request_queue in self.idle_request_queues:
+            try:
+                request_queue.put_nowait(None)  # 空闲连接的请求队列为空，放入结束标记后响应协程会关闭连接
+            except asyncio.QueueFull:
+                pass  # 刚好收到了一批流水线请求，处理完后会因为排空而关闭连接
+        self.idle_request_queues.clear()
 
-        # 解析 URL，去掉查询参数，只保留纯净的路由
-        parsed_url = urllib.parse.urlparse(path) # 将 URL 拆解为各个组成部分，包括路径、查询参数、锚点等。我们只需要使用 path 部分，而 params 和 query 部分会被自动去掉
-        path = parsed_url.path  # 只保留路径部分，不包括查询字符串
+    async def drain_connections(self):
+        """
+        等待正在处理的请求完成，超过 drain_timeout 后取消剩余的连接，
+        取消后连接仍然会在 handle_client 的 finally 中正常关闭，客户端收到的是 FIN 而不是进程退出时的 RST
+        """
+        if self.connection_tasks:
+            _, pending = await asyncio.wait(set(self.connection_tasks), timeout=self.drain_timeout)
+            if pending:
+                print(f"还有 {len(pending)} 个连接在 {self.drain_timeout} 秒内没有处理完，强制关闭")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
 
+        if self.handler_thread_pool is not None:
+            self.handler_thread_pool.shutdown(wait=False, cancel_futures=True)  # 丢弃还没有开始执行的 api 函数
+
+    async def parsing_data(self, reader, first_request=False, first_byte=None):
+        """
+        解析客户端发送的数据：读取完整的请求头和请求体（支持 Content-Length 和 chunked 分块传输），
+        每个请求的请求头和请求体分别受 header_read_timeout 和 body_read_timeout 限制，超时返回 408
+        :param reader:
+        :param first_request: 是否是连接上的第一个请求，新连接在 header_read_timeout 内没有发送任何数据会被直接关闭；
+                              之后的请求由 wait_next_request 等待第一个字节
+        :param first_byte: wait_next_request 读取到的请求第一个字节
+        :return: 请求信息字典；如果客户端已关闭连接，返回 None
+        """
         """
-        创建一个字典存储请求头
+        请求头字典中的名称统一为首字母大写的形式（例如 content-type -> Content-Type）
         常见的HTTP请求头字段：
             Host: 请求的目标主机（服务器）地址。例如：Host: www.example.com
             User-Agent: 浏览器或客户端软件的标识信息。例如：User-Agent: Mozilla/5.0
@@ -71,115 +215,516 @@ class HTTPServer:
             Referer: 上一个请求的 URL 地址，浏览器发送该头用于引用页面。
             Origin: 请求的原始域，通常用于跨域请求时识别来源。
         """
-        header_dict = {}  # 接口头部信息
-        for header in headers:
-            if header:
-                header_name, header_value = header.split(': ', 1)  # 解析键值对
-                header_dict[header_name] = header_value
-
-        # 判断 Content-Type
-        content_type = header_dict.get('Content-Type', '').lower()
-
-        # 解析请求数据
-        data = {}  # 接口数据
-        if method == 'GET':
-            # GET 请求通常通过查询参数传递数据
-            data = urllib.parse.parse_qs(parsed_url.query)
-        elif method == 'POST':
-            header_end = request.find("\r\n\r\n")
-            if header_end != -1:
-                body = request[header_end + 4:] # str 类型数据
-
-                # 处理不同的 Content-Type
-                if 'application/x-www-form-urlencoded' in content_type:
-                    # 处理 application/x-www-form-urlencoded 数据
-                    post_params = urllib.parse.parse_qs(body)
-                    for key, value in post_params.items():
-                        data[key] = value
-
-                elif 'application/json' in content_type:
-                    # 处理 application/json 数据
-                    try:
-                        post_data = json.loads(body)
-                        data.update(post_data)  # 更新字典
-                    except json.JSONDecodeError as e:
-                        print(f"Failed to decode JSON: {e}")
-
-        return {
-            "request": request,
-            "path": path,
-            "method": method,
-            "header_dict": header_dict,
-            "data": data,
-        }
+        return await read_request(
+            reader,
+            self.max_header_size,
+            max_body_size=self.max_body_size,
+            header_timeout=self.header_read_timeout,
+            body_timeout=self.body_read_timeout,
+            idle_timeout=self.header_read_timeout if first_request else None,
+            first_byte=first_byte,
+        )
+
+    async def wait_next_request(self, reader, connection_idle):
+        """
+        等待长连接上下一个请求的第一个字节：前一个响应发送完之前一直等待（客户端通常收到响应后才发送下一个请求），
+        连接空闲之后最多等待 keep_alive_timeout；请求开始之后的读取时间由 header_read_timeout / body_read_timeout 限制
+        :param reader: asyncio.start_server 封装后的内容，是客户端传入的数据
+        :param connection_idle: 已经读取的请求全部响应完毕时设置的事件
+        :return: 请求的第一个字节；客户端关闭连接或长连接空闲超时返回 None
+        """
+        first_byte = asyncio.ensure_future(reader.readexactly(1))
+        idle = None
+        try:
+            if not connection_idle.is_set():
+                idle = asyncio.ensure_future(connection_idle.wait())
+                await asyncio.wait((first_byte, idle), return_when=asyncio.FIRST_COMPLETED)
+            if not first_byte.done():
+                await asyncio.wait((first_byte,), timeout=self.keep_alive_timeout)
+            if not first_byte.done():
+                return None  # 长连接空闲超时，关闭连接
+            return first_byte.result()
+        except asyncio.IncompleteReadError:
+            return None  # 客户端已关闭连接
+        finally:
+            first_byte.cancel()  # 还没有收到数据时取消读取不会丢失数据
+            if idle is not None:
+                idle.cancel()
 
     @staticmethod
-    def create_header(content_type ="application/json", **other_info):
+    def is_keep_alive(version, header_dict):
         """
-        创建请求头，默认 content_type 的属性为 application/json，如果还传入了其他属性，会合并并返回
-        :param content_type: 请求头中的 content_type 属性
-        :param other_info: 请求头中的其他属性
-        :return: 请求头信息
+        根据 HTTP 版本和 Connection 请求头判断客户端是否希望保持连接
+            HTTP/1.1 默认保持连接，除非请求头中声明 Connection: close
+            HTTP/1.0 默认关闭连接，除非请求头中声明 Connection: keep-alive
+        :param version: 请求的 HTTP 版本，例如 HTTP/1.1
+        :param header_dict: 请求头字典
+        :return: 是否保持连接
         """
-        header_info = {
-            "Content-Type": content_type
-        }
+        connection = header_dict.get("Connection", "").lower()
 
-        # 如果传入了其他头部信息，合并到默认的 headers 中
-        if other_info:
-            header_info.update(other_info)
+        # Connection 头可能包含多个以逗号分隔的选项，例如 "keep-alive, Upgrade"
+        connection_options = {option.strip() for option in connection.split(",")}
 
-        return header_info
+        if version == "HTTP/1.1":
+            return "close" not in connection_options
+        return "keep-alive" in connection_options
 
     async def handle_client(self, reader, writer):
         """
-        处理客户端请求
+        处理客户端请求，一个连接上可以依次处理多个请求（HTTP 长连接），并支持 HTTP 流水线（pipelining）：
+            读取协程持续解析后续请求并放入队列，响应协程按请求到达的顺序依次处理并返回响应，
+            这样下一个请求的解析可以和当前请求的处理重叠进行
         :param reader: asyncio.start_server 封装后的内容，是客户端传入的数据
         :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
         :return:
         """
+        # 连接数量达到上限时直接返回 503，不再读取请求，避免连接和内存无限增长
+        if self.active_connections >= self.max_connections:
+            try:
+                write_response(writer, encode_status_line(503, "服务繁忙，请稍后重试"), RETRY_AFTER_HEADER_BLOCK,
+                               encode_connection_block(False))
+                await writer.drain()
+                await self.lingering_close(reader, writer)
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+            finally:
+                writer.close()
+            return
+
+        self.active_connections += 1
+        connection_task = asyncio.current_task()
+        self.connection_tasks.add(connection_task)
+
+        # 已解析、等待处理的请求队列，队列满时读取协程会暂停读取
+        request_queue = asyncio.Queue(maxsize=self.pipeline_max_requests)
+        connection_idle = asyncio.Event()  # 已经读取的请求全部响应完毕，开始计算长连接空闲时间
+        read_task = asyncio.create_task(self.read_requests(reader, request_queue, connection_idle))
         try:
-            # 解析接收到的信息
-            parsing_data = await self.parsing_data(reader)
+            await self.respond_requests(reader, writer, request_queue, connection_idle)
+
+            if self.draining:
+                # 排空时主动关闭的长连接上，客户端可能已经发出了下一个请求，使用 lingering close 避免客户端收到 RST
+                read_task.cancel()
+                await asyncio.wait({read_task})
+                await self.lingering_close(reader, writer)
+
+        except (ConnectionResetError, BrokenPipeError):
+            pass  # 客户端主动断开连接，无需处理
+
+        finally:
+            self.active_connections -= 1
+            self.connection_tasks.discard(connection_task)
+            self.idle_request_queues.discard(request_queue)
+            read_task.cancel()  # 响应协程已经结束，不再需要读取后续请求
+            writer.close()  # 无论如何关闭客户端连接
+
+    @staticmethod
+    async def lingering_close(reader, writer):
+        """
+        发送错误响应后，先关闭写端，再短暂读取并丢弃客户端已经发送的数据，然后才关闭连接
+        如果直接关闭一个还有未读数据的连接，内核会发送 RST，客户端可能收不到刚刚发送的错误响应
+        :param reader: asyncio.start_server 封装后的内容，是客户端传入的数据
+        :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
+        """
+        async def discard_input():
+            while await reader.read(LINGERING_READ_SIZE):
+                pass
+
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+            await with_deadline(discard_input(), LINGERING_CLOSE_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionResetError, BrokenPipeError, OSError):
+            pass
+
+    async def read_requests(self, reader, request_queue, connection_idle):
+        """
+        读取协程：持续解析同一个连接上的请求，并按顺序放入请求队列
+        队列中放入 None 表示不会再有新的请求，放入 HTTPParseError 表示请求解析失败
+        :param reader: asyncio.start_server 封装后的内容，是客户端传入的数据
+        :param request_queue: 请求队列
+        :param connection_idle: 已经读取的请求全部响应完毕时由响应协程设置的事件
+        :return:
+        """
+        request_count = 0  # 当前连接已经读取的请求数量
+        try:
+            while True:
+                first_byte = None
+                if request_count:
+                    first_byte = await self.wait_next_request(reader, connection_idle)
+                    if first_byte is None:
+                        break
+                try:
+                    parsing_data = await self.parsing_data(reader, request_count == 0, first_byte)
+                except HTTPParseError as e:
+                    # 请求格式错误时，连接中剩余的数据已经无法可靠解析，交给响应协程返回错误信息后关闭连接
+                    await request_queue.put(e)
+                    break
+
+                if parsing_data is None:
+                    break  # 如果没有请求数据（客户端已关闭连接），直接返回
+
+                request_count += 1
+
+                # 客户端希望保持连接，并且当前连接处理的请求数量未达到上限时，才保持连接
+                keep_alive = (self.is_keep_alive(parsing_data["version"], parsing_data["header_dict"])
+                              and request_count < self.keep_alive_max_requests)
+                parsing_data["keep_alive"] = keep_alive
+                parsing_data["keep_alive_max"] = self.keep_alive_max_requests - request_count
+
+                connection_idle.clear()  # 响应协程处理完这个请求后才开始计算空闲时间
+                await request_queue.put(parsing_data)  # 队列已满时在这里等待，不再继续读取客户端数据
+
+                if not keep_alive:
+                    break  # 连接将在本次响应后关闭，后续的数据不需要再读取
+
+        except (ConnectionResetError, BrokenPipeError):
+            pass  # 客户端主动断开连接，已经读取的请求仍然按顺序处理
+
+        except Exception as e:
+            print(f"读取请求失败: {type(e).__name__}: {e}")
+
+        # 响应协程等待请求时没有超时，必须收到结束标记才会关闭连接；
+        # 流水线请求填满队列时在这里等待响应协程取出请求，不能因为队列已满而丢弃结束标记
+        await request_queue.put(None)
+
+    async def respond_requests(self, reader, writer, request_queue, connection_idle):
+        """
+        响应协程：按顺序从请求队列中取出请求进行处理，保证响应的顺序和请求的顺序一致；
+        连接上的所有超时都由读取协程处理，读取协程结束时会放入结束标记，这里不需要再限制等待时间
+        :param reader: asyncio.start_server 封装后的内容，是客户端传入的数据（返回错误信息后用于丢弃剩余的数据）
+        :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
+        :param request_queue: 请求队列
+        :param connection_idle: 已经读取的请求全部响应完毕时设置的事件，读取协程从这时开始计算长连接空闲时间
+        :return:
+        """
+        while True:
+            # 没有待处理的请求时连接处于空闲状态，服务排空时可以直接关闭
+            idle = request_queue.empty()
+            if idle:
+                if self.idle_connections_closed:
+                    break
+                self.idle_request_queues.add(request_queue)
+
+            try:
+                parsing_data = await request_queue.get()
+            finally:
+                if idle:
+                    self.idle_request_queues.discard(request_queue)
+
             if parsing_data is None:
-                return  # 如果没有请求数据，直接返回
-
-            request, path, method, header_dict, data = parsing_data.values()
-
-            # 找到并导入对应的 api 函数
-            api_func_info = self.route_handlers.get(path, {}).get(method, {}) # 根据路由和请求方法，从 route_handlers 字典中获取本次请求对应的 api 函数的具体信息
-            api_func_name = api_func_info.get("func_name")  # 获取 api 函数名称
-            api_func = self.import_api_func_dict[api_func_name] # 从主进程中引入的所有 api 函数字典中国年获取本次请求所需的函数
-
-            # 创建 header 信息
-            return_headers = self.create_header()
-
-            # 判断 token 是否有效，并从中获取有用信息
-            is_validate_token = api_func_info.get("token_required")
-            is_validate_role = api_func_info.get("role_required")
-            if is_validate_token:
-                # 从请求头中获取 Authorization 头部并提取 token
-                authorization = header_dict.get('Authorization', '')
-                token = None
-                if authorization.startswith('Bearer '):
-                    token = authorization[len('Bearer '):]  # 获取 Bearer 后面的 token
-
-                if token:
-                    token_validate_result = Authority(token, verify_identity = is_validate_role, verify_token = is_validate_token)
-                    decoded_token = token_validate_result.get_decoded_info()
-                    if not token_validate_result:
-                        await send_http_response(writer, 401, "'错误':'令牌已过期或无效'", return_headers)
-                    else:
-                        response = api_func(ctx=decoded_token, data=data)
-                        await send_http_response(writer, response["code"], response["message"], return_headers, response["body"])
+                break  # 不会再有新的请求
+
+            # 服务正在排空时，返回本次响应后关闭连接，客户端会在新的连接上重试后续请求
+            if self.draining and not isinstance(parsing_data, HTTPParseError):
+                parsing_data["keep_alive"] = False
+
+            if isinstance(parsing_data, HTTPParseError):
+                await send_http_response(writer, parsing_data.status_code, parsing_data.message)
+                await self.lingering_close(reader, writer)
+                break
+
+            try:
+                await self.handle_request(writer, parsing_data, parsing_data["keep_alive"], parsing_data["keep_alive_max"])
+            except (ConnectionResetError, BrokenPipeError):
+                raise  # 客户端主动断开连接，由 handle_client 处理
+            except Exception as e:
+                # 处理请求时出现未预料的错误：返回 500 并关闭连接，不再处理同一连接上排队的请求，客户端会在新连接上重试
+                print(f"处理请求 {parsing_data['method']} {parsing_data['path']} 失败: {type(e).__name__}: {e}")
+                if not parsing_data.get("response_started"):
+                    await send_http_response(writer, 500, "Internal Server Error")
+                break
+            self.handled_requests += 1
+            if request_queue.empty():
+                connection_idle.set()
+
+            if not parsing_data["keep_alive"]:
+                break
+
+    async def handle_request(self, writer, parsing_data, keep_alive=False, keep_alive_max=None):
+        """
+        处理单个请求：找到对应的 api 函数，经过路由的中间件调用链（没有中间件时直接）鉴权并执行，最后将结果返回给客户端
+        :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
+        :param parsing_data: parsing_data 方法解析后的请求信息
+        :param keep_alive: 发送完本次响应后是否保持连接
+        :param keep_alive_max: 当前连接剩余可处理的请求数量
+        :return:
+        """
+        # 找到对应的 api 函数的分发信息，带参数的路由的 route_key 为注册时的路径模板
+        status, entry, route_result = self.router.match(parsing_data["path"], parsing_data["method"])
+        if status != ROUTE_FOUND:
+            # 连接管理相关的响应头
+            connection_block = encode_connection_block(keep_alive, self.keep_alive_timeout, keep_alive_max)
+            if status == 404:
+                write_response(writer, encode_status_line(404, "Not Found"), DEFAULT_HEADER_BLOCK, connection_block)
+            else:
+                write_response(writer, encode_status_line(405, "Method Not Allowed"), route_result, connection_block)
+            await writer.drain()
+            return
+
+        if entry.pipeline is None:
+            response = await self.process_request(writer, parsing_data, entry, route_result)
+        else:
+            response = await entry.pipeline(Request(self, writer, parsing_data, entry, route_result))
+
+        # 处理期间可能决定本次响应后关闭连接（服务开始排空、HTTP/1.0 的流式响应）
+        keep_alive = keep_alive and parsing_data["keep_alive"]
+        await self.send_response(writer, parsing_data, entry, response,
+                                 encode_connection_block(keep_alive, self.keep_alive_timeout, keep_alive_max))
+
+    async def process_request(self, writer, parsing_data, entry, route_result, request=None):
+        """
+        限流、鉴权，然后从响应缓存中取出响应或者执行 api 函数，中间件调用链的最内层
+        :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
+        :param parsing_data: parsing_data 方法解析后的请求信息
+        :param entry: 路由的 DispatchEntry
+        :param route_result: 路由中的路径参数，没有时为 None
+        :param request: 中间件看到的 Request，路由没有中间件时为 None
+        :return: (状态行, 路由响应头, 响应体, 其他响应头)，流式响应的响应体为产出数据块的异步迭代器
+        """
+        path = parsing_data["path"]
+        data = parsing_data["data"]
+        route_key = entry.route_key
+        api_func = entry.func
+        if api_func is None:
+            # 懒加载模式下第一次请求时引入 api 函数所在的模块，引入时会执行模块的顶层代码，放到线程池中执行，不阻塞事件循环
+            api_func = await asyncio.get_running_loop().run_in_executor(self.get_handler_thread_pool(), entry.load,
+                                                                        self.import_api_func_dict)
+
+        # 获取预先编码好的响应头
+        header_block = entry.header_block
+
+        # 按客户端 IP 和按整个路由的限流在鉴权之前检查，被拒绝的请求不需要再验证 token
+        limited = entry.rate_limit is not None or entry.route_rate_limit is not None
+        if limited and (entry.rate_limit is None or entry.rate_limit_by == "ip"):
+            retry_after = self.check_rate_limit(entry, self.client_ip(writer))
+            if retry_after:
+                return TOO_MANY_REQUESTS_STATUS_LINE, header_block, b"", retry_after_block(retry_after)
+            limited = False
+
+        # 判断 token 是否有效，并从中获取有用信息
+        is_validate_token = entry.token_required
+        is_validate_role = entry.role_required
+        ctx = {}
+        if is_validate_token:
+            # 从请求头中获取 Authorization 头部并提取 token
+            authorization = parsing_data["header_dict"].get('Authorization', '')
+            token = None
+            if authorization.startswith('Bearer '):
+                token = authorization[len('Bearer '):]  # 获取 Bearer 后面的 token
+
+            token_validate_result = None
+            if token:
+                token_validate_result = Authority(token, verify_identity = is_validate_role, verify_token = is_validate_token)
+
+            if not token_validate_result:
+                return encode_status_line(401, "'错误':'令牌已过期或无效'"), header_block, b"", b""
+
+            ctx = token_validate_result.get_decoded_info()
+
+        # 按 token 中的用户限流，token 中没有用户信息时按客户端 IP
+        if limited:
+            identity = token_subject(ctx)
+            retry_after = self.check_rate_limit(entry, self.client_ip(writer) if identity is None else f"user:{identity}")
+            if retry_after:
+                return TOO_MANY_REQUESTS_STATUS_LINE, header_block, b"", retry_after_block(retry_after)
+
+        if route_result is not None:
+            ctx["path_params"] = route_result  # 路由中的路径参数，已经按类型转换
+        if request is not None:
+            ctx["state"] = request.state  # 中间件传递给 api 函数的数据
+            request.ctx = ctx
+
+        # 返回值固定不变的 api 函数和有效期内的缓存响应，直接返回缓存的状态行和响应体，无需再次执行和序列化
+        cache_key = None
+        if entry.cache_ttl is not None:
+            cache_key = self.response_cache.make_key(entry, path, data, ctx)
+            cached_response = self.response_cache.get(entry, cache_key)
+        else:
+            cached_response = self.constant_response_cache.get(route_key)
+        if cached_response is None:
+            execution_mode = entry.execution_mode
+            try:
+                if entry.coalesce:
+                    # 相同的并发请求只执行一次 api 函数，等待的请求直接得到编码后的响应，response 为 None
+                    response, cached_response = await self.call_coalesced(entry, api_func, path, data, ctx, cache_key)
                 else:
-                    await send_http_response(writer, 401, "'错误':'令牌已过期或无效'", return_headers)
+                    response = await self.call_api_func(api_func, entry.handler, execution_mode, ctx, data)
+            except ProcessPoolFull:
+                return encode_status_line(503, "服务繁忙，请稍后重试"), header_block, b"", b""
+            except ProcessPoolTimeout:
+                return GATEWAY_TIMEOUT_STATUS_LINE, header_block, b"", b""
+            except Exception as e:
+                # api 函数抛出异常（包括进程池中的异常和进程崩溃），返回 500，而不是断开连接
+                print(f"执行 api 函数 {entry.handler} 失败: {type(e).__name__}: {e}")
+                return INTERNAL_SERVER_ERROR_STATUS_LINE, header_block, b"", b""
+
+            # 执行 api 函数期间服务开始排空时，本次响应后关闭连接
+            if self.draining:
+                parsing_data["keep_alive"] = False
+
+        if cached_response is None:
+            # api 函数直接返回生成器等流式响应体时，按 200 处理
+            if is_streaming_body(response):
+                response = {"code": 200, "message": "OK", "body": response}
+
+            body = response.get("body")
+            if is_streaming_body(body):
+                # 流式响应：HTTP/1.1 使用分块传输，HTTP/1.0 不支持分块传输，发送完毕后关闭连接
+                if parsing_data["version"] != "HTTP/1.1":
+                    parsing_data["keep_alive"] = False
+                if isinstance(body, StreamingBody) and body.content_type:
+                    header_block = self.get_content_type_header_block(entry, body.content_type)
+                # executor="thread" 的 api 函数返回的同步生成器也在线程池中迭代，避免阻塞事件循环
+                executor = self.get_handler_thread_pool() if execution_mode == "thread" else None
+                return (encode_status_line(response["code"], response["message"]), header_block,
+                        iterate_chunks(body, executor), b"")
+
+            cached_response = self.encode_response(entry, cache_key, response)
+
+        status_line, body_bytes = cached_response
+        return status_line, header_block, body_bytes, b""
+
+    async def send_response(self, writer, parsing_data, entry, response, connection_block):
+        """
+        压缩并发送 process_request（或中间件调用链）返回的响应
+        :param writer: asyncio.start_server 封装后的内容，是服务端输出的数据
+        :param parsing_data: parsing_data 方法解析后的请求信息
+        :param entry: 路由的 DispatchEntry
+        :param response: (状态行, 路由响应头, 响应体, 其他响应头)
+        :param connection_block: 预编码的连接管理响应头
+        """
+        status_line, header_block, body_bytes, extra_header_block = response
+        if not isinstance(body_bytes, bytes):
+            parsing_data["response_started"] = True  # 响应头发出后出错时，无法再返回 500，只能关闭连接
+            await send_streaming_response(writer, status_line, header_block + extra_header_block, connection_block,
+                                          body_bytes, parsing_data["version"] == "HTTP/1.1")
+            return
+
+        # 响应体足够大时，根据 Accept-Encoding 压缩响应体
+        if len(body_bytes) >= self.compressor.min_size and entry.compress:
+            encoding = negotiate_encoding(parsing_data["header_dict"].get("Accept-Encoding"))
+            if encoding:
+                body_bytes = await self.compressor.compress(body_bytes, encoding, entry.compression_cache,
+                                                            self.get_handler_thread_pool())
+                extra_header_block += CONTENT_ENCODING_BLOCKS[encoding]
             else:
-                response = api_func({}, data)
-                await send_http_response(writer, response["code"], response["message"], return_headers, response["body"])
+                extra_header_block += VARY_BLOCK  # 告知中间缓存：响应内容会因 Accept-Encoding 不同而不同
+
+        write_response(writer, status_line, header_block, connection_block, body_bytes, extra_header_block)
+        await writer.drain()  # 确保数据完全发送
+
+    @staticmethod
+    def client_ip(writer):
+        """
+        客户端 IP，取自 TCP 连接的对端地址（不读取 X-Forwarded-For，该请求头可以被客户端任意伪造）
+        """
+        peername = writer.get_extra_info("peername")
+        return peername[0] if isinstance(peername, tuple) else str(peername)
+
+    def check_rate_limit(self, entry, identity):
+        """
+        检查路由的限流规则
+        :param identity: 客户端 IP 或 token 中的用户，作为令牌桶 key 的一部分
+        :return: 超过限制时客户端需要等待的秒数，0 表示请求通过
+        """
+        if self.rate_limiter is None:
+            self.rate_limiter = SharedRateLimiter()
+        retry_after = self.rate_limiter.check(entry, identity)
+        if retry_after:
+            self.rate_limited_requests += 1
+        return retry_after
+
+    def encode_response(self, entry, cache_key, response):
+        """
+        编码 api 函数返回的非流式响应，并按路由的设置缓存
+        :param entry: 路由的 DispatchEntry
+        :param cache_key: 响应缓存的 key，路由没有指定 cache_ttl 时为 None
+        :param response: api 函数的返回值
+        :return: (预编码的状态行, 序列化后的响应体)
+        """
+        encoded = (encode_status_line(response["code"], response["message"]), encode_body(response.get("body")))
+        # 每个路由只使用一种缓存：指定了 cache_ttl 的路由只查找响应缓存，不写入固定响应缓存
+        if cache_key is not None:
+            if response["code"] == 200:
+                self.response_cache.put(entry, cache_key, *encoded)
+        elif entry.constant_response:
+            self.constant_response_cache[entry.route_key] = encoded
+        return encoded
+
+    @staticmethod
+    def make_coalesce_key(entry, path, data, ctx):
+        """
+        合并请求使用的请求标识：路由、请求路径、按名称排序的全部查询参数，以及 token 中的用户和角色信息
+        """
+        return (entry.route_key, path, repr(sorted(data.items(), key=lambda item: item[0])),
+                repr(ctx.get("user_token")), repr(ctx.get("role")))
+
+    async def call_coalesced(self, entry, api_func, path, data, ctx, cache_key):
+        """
+        执行 coalesce=True 的 api 函数：同一时间只有第一个请求执行 api 函数，之后到达的相同请求等待它编码后的响应
+            1. api 函数抛出异常时（包括进程池已满），等待的请求得到同一个异常
+            2. api 函数返回流式响应，或者执行的请求被取消（例如客户端断开连接）时，等待的请求各自执行 api 函数
+        :return: (api 函数的返回值, 编码后的响应)，等待其他请求时返回值为 None，返回值为流式响应时编码后的响应为 None
+        """
+        key = self.make_coalesce_key(entry, path, data, ctx)
+        inflight = self.inflight_requests.get(key)
+        if inflight is not None:
+            # shield：本请求被取消时不会取消其他请求也在等待的 Future
+            encoded = await asyncio.shield(inflight)
+            if encoded is not None:
+                self.coalesced_requests += 1
+                return None, encoded
+            return await self.call_api_func(api_func, entry.handler, entry.execution_mode, ctx, data), None
 
+        inflight = self.inflight_requests[key] = asyncio.get_running_loop().create_future()
+        encoded = None
+        try:
+            response = await self.call_api_func(api_func, entry.handler, entry.execution_mode, ctx, data)
+            if not is_streaming_body(response) and not is_streaming_body(response.get("body")):
+                encoded = self.encode_response(entry, cache_key, response)
+            return response, encoded
+        except Exception as e:
+            inflight.set_exception(e)
+            inflight.exception()  # 没有请求在等待时，避免 asyncio 报告 Future 的异常没有被获取
+            raise
         finally:
-            writer.close()  # 无论如何关闭客户端连接
+            del self.inflight_requests[key]
+            if not inflight.done():
+                inflight.set_result(encoded)
+
+    def get_handler_thread_pool(self):
+        """
+        获取执行同步 api 函数的线程池，第一次使用时创建
+        """
+        if self.handler_thread_pool is None:
+            self.handler_thread_pool = ThreadPoolExecutor(max_workers=self.handler_thread_pool_size,
+                                                          thread_name_prefix="api-func")
+        return self.handler_thread_pool
+
+    async def call_api_func(self, api_func, handler, execution_mode, ctx, data):
+        """
+        根据注册时确定的执行方式执行 api 函数
+        :param api_func: api 函数
+        :param handler: api 函数的模块限定名称，交给进程池执行时，进程池根据名称找到对应的函数
+        :param execution_mode: 执行方式，async / inline / thread / process
+        :param ctx: 鉴权后的上下文信息
+        :param data: 请求数据
+        :return: api 函数的返回值
+        """
+        if execution_mode == "async":
+            return await api_func(ctx=ctx, data=data)
+
+        if execution_mode == "process" and self.process_pool_client is not None:
+            return await self.process_pool_client.submit(handler, ctx, data)
+
+        # 没有可用的进程池时（例如单独启动 HTTPServer），executor="process" 的 api 函数退回到线程池中执行
+        if execution_mode in ("thread", "process"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.get_handler_thread_pool(), functools.partial(api_func, ctx=ctx, data=data))
+
+        return api_func(ctx=ctx, data=data)
 
-    async def start(self):
-        await self.serve_forever()  # 调用 serve_forever 协程
\ No newline at end of file
+    async def start(self, on_listening=None):
+        await self.serve_forever(on_listening)  # 调用 serve_forever 协程
\ No newline at end of file
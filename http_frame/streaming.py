@@ -0,0 +1,113 @@
+"""
+文件描述: 流式响应相关的工具
+            api 函数可以返回同步/异步生成器或可迭代的数据块（也可以放在返回值的 body 中），
+            服务端会使用 Transfer-Encoding: chunked 边生成边发送，不需要先把完整的响应体序列化到内存中
+
+创建者: 汐琳
+创建时间: 2025-01-13 16:08:52
+"""
+import asyncio
+import json
+import types
+
+NDJSON_BATCH_SIZE = 16 * 1024  # ndjson 每个数据块的目标大小（字节），多行合并为一个数据块发送，减少系统调用和分块开销
+
+
+class StreamingBody:
+    def __init__(self, chunks, content_type=None):
+        """
+        流式响应体
+        :param chunks: 同步/异步可迭代对象，每一项是一个数据块（bytes 或 str，其他类型会被序列化为 JSON）
+        :param content_type: 响应的 Content-Type，为 None 时使用路由的默认响应头
+        """
+        self.chunks = chunks
+        self.content_type = content_type
+
+
+def is_streaming_body(body):
+    """
+    判断返回值是否需要以流式响应发送：StreamingBody、同步生成器、异步生成器/异步可迭代对象
+    列表、字典等普通的返回值仍然作为 JSON 一次性发送
+    """
+    return isinstance(body, (StreamingBody, types.GeneratorType)) or hasattr(body, "__aiter__")
+
+
+def encode_chunk(chunk):
+    """
+    将数据块编码为 bytes
+    """
+    if isinstance(chunk, bytes):
+        return chunk
+    if isinstance(chunk, str):
+        return chunk.encode()
+    if isinstance(chunk, (bytearray, memoryview)):
+        return bytes(chunk)
+    return json.dumps(chunk, ensure_ascii=False).encode()
+
+
+async def iterate_chunks(body, executor=None):
+    """
+    将流式响应体统一转换为异步迭代器，逐个产出编码后的数据块
+    :param body: StreamingBody、同步/异步生成器或可迭代对象
+    :param executor: 同步生成器的执行线程池，为 None 时直接在事件循环中迭代（executor="thread" 的 api 函数会传入线程池，避免阻塞事件循环）
+    """
+    chunks = body.chunks if isinstance(body, StreamingBody) else body
+
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield encode_chunk(chunk)
+        return
+
+    if executor is None:
+        for chunk in chunks:
+            yield encode_chunk(chunk)
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = iter(chunks)
+    end = object()
+    while True:
+        chunk = await loop.run_in_executor(executor, next, iterator, end)
+        if chunk is end:
+            break
+        yield encode_chunk(chunk)
+
+
+def ndjson(rows, batch_size=NDJSON_BATCH_SIZE):
+    """
+    将多行数据以 NDJSON（每行一个 JSON 对象）的格式流式返回，适用于导出大量数据
+        用法：return ndjson(row for row in query_rows())
+    :param rows: 同步或异步可迭代对象，每一项是一行数据
+    :param batch_size: 每个数据块的目标大小（字节）
+    :return: StreamingBody
+    """
+
+    def encode_row(row):
+        return json.dumps(row, ensure_ascii=False).encode() + b"\n"
+
+    if hasattr(rows, "__aiter__"):
+        async def batches():
+            batch, size = [], 0
+            async for row in rows:
+                line = encode_row(row)
+                batch.append(line)
+                size += len(line)
+                if size >= batch_size:
+                    yield b"".join(batch)
+                    batch, size = [], 0
+            if batch:
+                yield b"".join(batch)
+    else:
+        def batches():
+            batch, size = [], 0
+            for row in rows:
+                line = encode_row(row)
+                batch.append(line)
+                size += len(line)
+                if size >= batch_size:
+                    yield b"".join(batch)
+                    batch, size = [], 0
+            if batch:
+                yield b"".join(batch)
+
+    return StreamingBody(batches(), content_type="application/x-ndjson")
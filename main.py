@@ -1,6 +1,43 @@
 from project_frame.multiprocess_server_main import ServerManager
+from config import ROUTE_MANIFEST_PATH, API_IMPORT_MODE
+from script.lazy_import import discover_functions_in_folder
 from script.traverse_folder import import_all_functions_in_folder
 
+
+def load_api_func_dict(reload=False):
+    """
+    按 API_IMPORT_MODE 引入 api 函数："eager" 在主进程中引入所有模块，"lazy" 只静态扫描路由，第一次请求时才引入模块
+    :param reload: 是否为滚动重启时的重新引入
+    """
+    if API_IMPORT_MODE == "lazy":
+        return discover_functions_in_folder("api_func_set", reload=reload, manifest_path=ROUTE_MANIFEST_PATH)
+    return import_all_functions_in_folder("api_func_set", reload=reload, manifest_path=ROUTE_MANIFEST_PATH)
+
+
+def reload_api_func():
+    """
+    滚动重启（SIGHUP）时在主进程中重新引入所有 api 函数，新的 HTTP 进程会继承重新引入后的路由和函数
+    :return: (route_handlers, import_api_func_dict)
+    """
+    from decoratorFunc.getFuncDict import route_handlers
+    from decoratorFunc.getJobDict import job_handlers
+    from decoratorFunc.getMiddlewareDict import middleware_handlers
+    previous_route_handlers = dict(route_handlers)
+    previous_job_handlers = dict(job_handlers)
+    previous_middleware_handlers = dict(middleware_handlers)
+    route_handlers.clear()  # 清空后重新注册，已删除的 api 函数不会残留
+    job_handlers.clear()
+    middleware_handlers.clear()
+    try:
+        import_api_func_dict = load_api_func_dict(reload=True)
+    except Exception:
+        route_handlers.update(previous_route_handlers)  # 新代码有错误时恢复原来的路由，继续使用旧进程
+        job_handlers.update(previous_job_handlers)
+        middleware_handlers.update(previous_middleware_handlers)
+        raise
+    return route_handlers, import_api_func_dict
+
+
 if __name__ == "__main__":
     """
     这里文件的动态引入和 route_dict 字典的传递有三种用法：
@@ -11,7 +48,10 @@ if __name__ == "__main__":
         本项目中，route_handlers 在应用运行期间不需要频繁更新且不需要跨进程共享和同步，第三种写法是最合适的。这种方式在进程数量较多的情况下，能有效减少系统的资源消耗
     """
     from decoratorFunc.getFuncDict import route_handlers # 在主进程中引入 route_handlers
-    import_api_func_dict = import_all_functions_in_folder("api_func_set") # 动态引入所有 api 函数
+    from decoratorFunc.getJobDict import job_handlers  # 后台任务函数的信息，在引入 api 函数时收集
+    from decoratorFunc.getMiddlewareDict import middleware_handlers  # 中间件的信息，在引入 api 函数时收集
+    import_api_func_dict = load_api_func_dict() # 动态引入所有 api 函数，路由清单有效时不再遍历文件夹
 
-    server_manager = ServerManager(8866, route_handlers, import_api_func_dict)  # 创建 ServerManager 实例
+    server_manager = ServerManager(8866, route_handlers, import_api_func_dict, reload_func=reload_api_func,
+                                   job_dict=job_handlers, middleware_dict=middleware_handlers)  # 创建 ServerManager 实例
     server_manager.start_server()  # 启动服务器
@@ -0,0 +1,114 @@
+"""
+文件描述: 主进程中的 HTTP 进程自动扩缩容
+            1. 负载信号：HTTP 进程通过心跳上报的连接数量和事件循环延迟，以及主进程用 psutil 采样的每个进程的 CPU 使用率
+            2. 任意一项信号超过扩容阈值时判定为过载，所有信号都低于缩容阈值时判定为空闲；两组阈值之间留有间隔（滞后），
+               并且需要连续多次采样得到相同的判定才会执行，执行后进入冷却时间，避免负载在阈值附近波动时反复扩缩容
+            3. 扩容时启用一个槽位并启动新的 HTTP 进程；缩容时停用编号最大的槽位，该槽位上的进程排空已有连接后退出
+            进程数量在 [min_workers, max_workers] 之间变化，空闲时少占用内存（每个 HTTP 进程都持有一份完整的 api 函数字典）
+
+创建者: 汐琳
+创建时间: 2025-01-26 10:12:35
+"""
+import time
+
+import psutil
+
+from config import (AUTOSCALE_INTERVAL, AUTOSCALE_UP_CONNECTIONS, AUTOSCALE_DOWN_CONNECTIONS, AUTOSCALE_UP_LOOP_LAG,
+                    AUTOSCALE_DOWN_LOOP_LAG, AUTOSCALE_UP_CPU, AUTOSCALE_DOWN_CPU, AUTOSCALE_UP_SAMPLES,
+                    AUTOSCALE_DOWN_SAMPLES, AUTOSCALE_COOLDOWN, SHUTDOWN_TIMEOUT)
+
+
+class Autoscaler:
+    def __init__(self, supervisor, min_workers, max_workers, interval=AUTOSCALE_INTERVAL,
+                 up_samples=AUTOSCALE_UP_SAMPLES, down_samples=AUTOSCALE_DOWN_SAMPLES, cooldown=AUTOSCALE_COOLDOWN,
+                 drain_timeout=SHUTDOWN_TIMEOUT):
+        """
+        :param supervisor: 管理 HTTP 进程的 WorkerSupervisor，槽位数量不小于 max_workers
+        :param min_workers: HTTP 进程数量下限
+        :param max_workers: HTTP 进程数量上限
+        :param interval: 采样间隔（秒）
+        :param up_samples: 连续多少次采样判定为过载后扩容
+        :param down_samples: 连续多少次采样判定为空闲后缩容
+        :param cooldown: 扩容或缩容之后，多长时间内（秒）不再扩缩容
+        :param drain_timeout: 缩容时等待进程排空的时限（秒）
+        """
+        self.supervisor = supervisor
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.up_samples = up_samples
+        self.down_samples = down_samples
+        self.cooldown = cooldown
+        self.drain_timeout = drain_timeout
+
+        self.next_sample_at = 0.0
+        self.cooldown_until = 0.0
+        self.overloaded_count = 0  # 连续判定为过载的采样次数
+        self.idle_count = 0  # 连续判定为空闲的采样次数
+        self.cpu_processes = {}  # pid -> psutil.Process，cpu_percent 需要同一个对象的两次调用之间的差值
+
+    def sample(self):
+        """
+        采样所有启用槽位上的进程的负载
+        :return: (平均连接数量, 最大事件循环延迟, 平均 CPU 使用率)，没有可用的进程时返回 None
+        """
+        connections, loop_lags, cpu_percents = [], [], []
+        live_pids = set()
+        for slot in self.supervisor.active_slots:
+            process = self.supervisor.workers[slot]
+            if process is None or not process.is_alive():
+                continue
+            live_pids.add(process.pid)
+            cpu_process = self.cpu_processes.get(process.pid)
+            if cpu_process is None:
+                # 第一次调用 cpu_percent 只记录起点，从下一次采样开始计入
+                cpu_process = self.cpu_processes[process.pid] = psutil.Process(process.pid)
+                cpu_process.cpu_percent(None)
+            else:
+                try:
+                    cpu_percents.append(cpu_process.cpu_percent(None))
+                except psutil.NoSuchProcess:
+                    pass
+            connections.append(self.supervisor.connection_counts[slot])
+            loop_lags.append(self.supervisor.loop_lags[slot])
+
+        for pid in set(self.cpu_processes) - live_pids:
+            del self.cpu_processes[pid]
+        if not connections:
+            return None
+        average_cpu = sum(cpu_percents) / len(cpu_percents) if cpu_percents else 0.0
+        return sum(connections) / len(connections), max(loop_lags), average_cpu
+
+    def check(self):
+        """
+        在主进程的监控循环中调用，到达采样间隔时采样并根据负载扩容或缩容
+        """
+        now = time.monotonic()
+        if now < self.next_sample_at:
+            return
+        self.next_sample_at = now + self.interval
+
+        load = self.sample()
+        if load is None:
+            return
+        connections, loop_lag, cpu = load
+        overloaded = connections >= AUTOSCALE_UP_CONNECTIONS or loop_lag >= AUTOSCALE_UP_LOOP_LAG or cpu >= AUTOSCALE_UP_CPU
+        idle = connections <= AUTOSCALE_DOWN_CONNECTIONS and loop_lag <= AUTOSCALE_DOWN_LOOP_LAG and cpu <= AUTOSCALE_DOWN_CPU
+        self.overloaded_count = self.overloaded_count + 1 if overloaded else 0
+        self.idle_count = self.idle_count + 1 if idle else 0
+        if now < self.cooldown_until:
+            return
+
+        workers = len(self.supervisor.active_slots)
+        load_text = f"平均连接数 {connections:.0f}，最大事件循环延迟 {loop_lag * 1000:.0f}ms，平均 CPU {cpu:.0f}%"
+        if self.overloaded_count >= self.up_samples and workers < self.max_workers:
+            slot = self.supervisor.scale_up()
+            print(f"HTTP 进程负载过高（{load_text}），扩容到 {workers + 1} 个进程，启用槽位 {slot}")
+        elif self.idle_count >= self.down_samples and workers > self.min_workers:
+            slot = self.supervisor.scale_down(self.drain_timeout)
+            print(f"HTTP 进程负载较低（{load_text}），缩容到 {workers - 1} 个进程，槽位 {slot} 上的进程排空后退出")
+        else:
+            return
+        self.overloaded_count = 0
+        self.idle_count = 0
+        self.cooldown_until = now + self.cooldown
@@ -0,0 +1,568 @@
+"""
+文件描述: 后台任务队列，HTTP 进程把耗时的后续工作（发送邮件、生成报表等）交给为后台任务保留的进程执行，不占用请求处理的时间
+            1. 主进程在启动 HTTP 进程之前为每个 HTTP 进程（槽位）创建一个任务管道和一个结果管道，HTTP 进程通过 fork 继承；
+               每个后台任务进程启动时创建一个与主进程之间的专用管道
+            2. HTTP 进程中 enqueue_job 只把任务放入本进程的缓冲区并立即返回 job_id，发送线程把缓冲区中同一优先级的任务
+               合并为一批，一次写入任务管道，减少系统调用和序列化次数
+            3. 主进程中的分发线程读取所有槽位的任务，按优先级排队，空闲的后台任务进程请求任务时，
+               总是先分配高优先级的任务；任务的结果由分发线程转发回提交任务的 HTTP 进程
+            4. 与共享进程池相同，每个管道只有一个写入方和一个读取方，不需要跨进程的锁：
+               任何一个进程被强制结束（心跳超时、排空超时）都不会让其他进程卡在锁上，写到一半的消息也只影响它自己的管道
+            5. 任务抛出异常时在后台任务进程中按指数退避重试，重试次数用完后返回错误信息；
+               后台任务进程收到 SIGTERM（滚动重启、缩容）时，把等待重试的任务连同剩余的等待时间交还给分发线程，
+               由其他后台任务进程继续执行；进程异常退出时还没有返回结果的任务以失败返回，调用方不会一直看到 queued
+            6. 任务结果可以通过 get_job_result / get_job_status 获取
+               （结果只保存在提交任务的 HTTP 进程中，数量有上限）
+
+            api 函数中的用法：
+                from project_frame.background_jobs import enqueue_job, get_job_result
+                job_id = enqueue_job("send_report", {"user_id": 1}, priority="low")
+                result = await get_job_result(job_id, timeout=10)  # 需要等待结果时
+
+创建者: 汐琳
+创建时间: 2025-01-24 14:32:08
+"""
+import asyncio
+import collections
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import selectors
+import signal
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from config import JOB_QUEUE_DEPTH, JOB_BATCH_SIZE, JOB_RESULT_CACHE_SIZE, WORKER_HEARTBEAT_INTERVAL
+from decoratorFunc.getJobDict import JOB_PRIORITIES
+from project_frame.process_pool import dumps_payload, loads_payload, FrameBuffer, encode_frame, READ_SIZE, RESET_TIMEOUT
+
+job_client = None  # 当前 HTTP 进程的任务队列客户端，由 ServerManager 在 HTTP 进程启动时设置
+
+WORKER_MESSAGE = struct.Struct("<Bqq")  # 后台任务进程发给分发线程的消息头：(类型, 提交任务的槽位, job_id)
+# 消息类型：请求下一批任务、任务结果（消息头之后是转发给 HTTP 进程的结果）、
+# 即将退出（分发线程不再分配任务，并回复一个空的批次）、交还任务（消息头之后是剩余的等待时间和任务）
+MESSAGE_READY, MESSAGE_RESULT, MESSAGE_STOPPING, MESSAGE_REQUEUE = 0, 1, 2, 3
+
+
+class JobQueueFull(Exception):
+    """
+    后台任务队列中排队的任务数量达到上限
+    """
+
+
+class JobFailed(Exception):
+    """
+    后台任务重试次数用完后仍然失败
+    """
+
+
+def encode_result(slot, job_id, success, result):
+    """
+    后台任务进程中编码任务结果，分发线程只读取消息头，结果部分原样转发给 HTTP 进程
+    """
+    try:
+        payload = dumps_payload((job_id, success, result))
+    except Exception as e:
+        payload = dumps_payload((job_id, False, f"任务结果无法序列化: {type(e).__name__}: {e}"))
+    return WORKER_MESSAGE.pack(MESSAGE_RESULT, slot, job_id) + payload
+
+
+class JobWorkerLink:
+    __slots__ = ("slot", "process", "conn", "messages", "output", "writing", "ready", "jobs")
+
+    def __init__(self, slot, process, conn):
+        """
+        分发线程中记录的后台任务进程
+        :param slot: 后台任务进程的槽位编号
+        :param process: 进程对象
+        :param conn: 与该进程通信的专用管道（主进程一端，非阻塞）
+        """
+        self.slot = slot
+        self.process = process
+        self.conn = conn
+        self.messages = FrameBuffer()  # 从该进程读取的消息
+        self.output = bytearray()  # 还没有写入管道的任务数据
+        self.writing = False  # 是否在等待管道可写
+        self.ready = False  # 是否在等待下一批任务
+        self.jobs = {}  # 分配给该进程、还没有返回结果的任务：job_id -> 提交任务的槽位
+
+
+class JobQueue:
+    def __init__(self, job_dict, api_func_dict, queue_depth=JOB_QUEUE_DEPTH, client_slots=1):
+        """
+        创建任务队列使用的管道，必须在启动 HTTP 进程和后台任务进程之前创建，子进程才能继承
+        :param job_dict: 后台任务装饰器收集的任务信息字典
+        :param api_func_dict: 动态引入生成的 API 函数字典，后台任务进程根据函数的模块限定名称找到对应的函数
+        :param queue_depth: 排队等待执行的任务数量上限
+        :param client_slots: HTTP 进程的槽位数量，每个槽位对应一个任务管道和一个结果管道
+        """
+        self.job_dict = job_dict
+        self.api_func_dict = api_func_dict
+        self.queue_slots = multiprocessing.BoundedSemaphore(queue_depth)  # 剩余可排队的任务数量
+
+        # 每个 HTTP 进程槽位一个任务管道（HTTP 进程写入，分发线程读取）和一个结果管道（分发线程写入，HTTP 进程读取）
+        self.task_pipes = [multiprocessing.Pipe(duplex=False) for _ in range(client_slots)]
+        self.result_pipes = [multiprocessing.Pipe(duplex=False) for _ in range(client_slots)]
+        # 每个槽位上的 HTTP 进程累计占用的排队名额，只由该 HTTP 进程写入；
+        # 与分发线程收到的任务数量之差是进程退出时还没有发出的任务，重置槽位时归还这些名额
+        self.submitted = multiprocessing.Array("q", client_slots, lock=False)
+
+        # 以下状态只在主进程的分发线程中使用
+        self.received = [0] * client_slots  # 每个槽位收到的任务数量
+        self.lanes = [collections.deque() for _ in JOB_PRIORITIES]  # 每个优先级排队中的任务
+        self.delayed = []  # 退出的后台任务进程交还的等待重试的任务：(重试时间, 序号, 任务)
+        self.retries = collections.deque()  # 已经到重试时间的任务，它们的排队名额在第一次分配时已经释放，优先分配
+        self.sequence = itertools.count()
+        self.links = {}  # 后台任务进程的 pid -> JobWorkerLink
+        self.task_buffers = [FrameBuffer() for _ in range(client_slots)]
+        self.result_buffers = [bytearray() for _ in range(client_slots)]
+        self.selector = None
+        self.running = False
+        self.thread = None
+        self.controls = queue.SimpleQueue()  # 主线程发给分发线程的指令
+        self.wakeup_reader, self.wakeup_writer = os.pipe()
+
+    def client(self, slot):
+        """
+        在 HTTP 进程中创建任务队列客户端
+        :param slot: HTTP 进程的槽位编号
+        """
+        return JobClient(self, slot)
+
+    def start(self):
+        """
+        在主进程中启动分发线程，必须在启动后台任务进程之前调用
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self.dispatch_loop, name="job-dispatch", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        停止分发线程，队列中尚未执行的任务被丢弃
+        """
+        if self.thread is not None:
+            self.send_control("stop")
+            self.thread.join()
+            self.thread = None
+
+    def attach_worker(self, slot, process, conn):
+        """
+        在主进程中登记新启动的后台任务进程
+        :param slot: 后台任务进程的槽位编号
+        :param process: 已启动的进程
+        :param conn: 与该进程通信的专用管道（主进程一端）
+        """
+        self.send_control("attach", JobWorkerLink(slot, process, conn))
+
+    def reset_slot(self, slot):
+        """
+        槽位上即将启动新的 HTTP 进程：丢弃之前使用该槽位的进程没有写完的任务，并归还它占用但没有发出的排队名额，
+        等待分发线程处理完毕后返回，避免新进程提交的任务被一起丢弃
+        """
+        if self.thread is None:
+            return  # 首次启动，槽位还没有被使用过
+        done = threading.Event()
+        self.send_control("reset", (slot, done))
+        done.wait(RESET_TIMEOUT)
+
+    def send_control(self, command, argument=None):
+        self.controls.put((command, argument))
+        os.write(self.wakeup_writer, b"\0")
+
+    def dispatch_loop(self):
+        """
+        分发线程：读取 HTTP 进程提交的任务、分配给请求任务的后台任务进程、转发结果，并处理后台任务进程的退出
+        """
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, ("wakeup", None))
+        for slot, (task_reader, _) in enumerate(self.task_pipes):
+            os.set_blocking(task_reader.fileno(), False)
+            self.selector.register(task_reader.fileno(), selectors.EVENT_READ, ("task", slot))
+        for _, result_writer in self.result_pipes:
+            os.set_blocking(result_writer.fileno(), False)
+
+        while self.running:
+            timeout = max(self.delayed[0][0] - time.monotonic(), 0) if self.delayed else None
+            for key, events in self.selector.select(timeout):
+                kind, target = key.data
+                if kind == "wakeup":
+                    os.read(self.wakeup_reader, READ_SIZE)
+                    self.handle_controls()
+                elif kind == "task":
+                    self.read_jobs(target)
+                elif kind == "result":
+                    self.flush_results(target)
+                elif self.links.get(target.process.pid) is not target:
+                    continue  # 本轮中已经退出的进程
+                elif kind == "exit":
+                    self.remove_worker(target)
+                else:
+                    if events & selectors.EVENT_WRITE:
+                        self.flush_worker(target)
+                    if events & selectors.EVENT_READ:
+                        self.read_messages(target)
+            if self.running:
+                self.dispatch()
+        self.selector.close()
+
+    def handle_controls(self):
+        while True:
+            try:
+                command, argument = self.controls.get_nowait()
+            except queue.Empty:
+                return
+            if command == "stop":
+                self.running = False
+            elif command == "attach":
+                os.set_blocking(argument.conn.fileno(), False)
+                self.links[argument.process.pid] = argument
+                self.selector.register(argument.conn.fileno(), selectors.EVENT_READ, ("worker", argument))
+                self.selector.register(argument.process.sentinel, selectors.EVENT_READ, ("exit", argument))
+            elif command == "reset":
+                slot, done = argument
+                self.read_jobs(slot)  # 先读完之前的进程已经完整写入的任务
+                self.task_buffers[slot].clear()
+                for _ in range(self.submitted[slot] - self.received[slot]):
+                    self.queue_slots.release()
+                self.submitted[slot] = 0
+                self.received[slot] = 0
+                done.set()
+
+    def read_jobs(self, slot):
+        fd = self.task_pipes[slot][0].fileno()
+        buffer = self.task_buffers[slot]
+        try:
+            while chunk := os.read(fd, READ_SIZE):
+                buffer.feed(chunk)
+        except BlockingIOError:
+            pass
+        for message in buffer.messages():
+            priority, jobs = loads_payload(message)
+            self.lanes[priority].extend(jobs)
+            self.received[slot] += len(jobs)
+
+    def dispatch(self):
+        """
+        把排队中的任务按优先级分配给请求任务的后台任务进程，每个进程一次最多分配 JOB_BATCH_SIZE 个任务，
+        到了重试时间的交还任务最先分配
+        """
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            self.retries.append(heapq.heappop(self.delayed)[2])
+        for link in self.links.values():
+            if not link.ready:
+                continue
+            if self.retries:
+                batch = [self.retries.popleft() for _ in range(min(len(self.retries), JOB_BATCH_SIZE))]
+            else:
+                lane = next((lane for lane in self.lanes if lane), None)
+                if lane is None:
+                    return
+                batch = [lane.popleft() for _ in range(min(len(lane), JOB_BATCH_SIZE))]
+                for _ in batch:
+                    self.queue_slots.release()  # 任务已经出队，释放排队名额
+            for job in batch:
+                link.jobs[job[0]] = job[1]
+            link.ready = False
+            link.output += encode_frame(dumps_payload(batch))
+            self.flush_worker(link)
+
+    def read_messages(self, link):
+        try:
+            while chunk := os.read(link.conn.fileno(), READ_SIZE):
+                link.messages.feed(chunk)
+        except BlockingIOError:
+            pass
+        except OSError:
+            return  # 进程已经退出，由退出事件处理
+        for message in link.messages.messages():
+            kind, slot, job_id = WORKER_MESSAGE.unpack_from(message)
+            if kind == MESSAGE_READY:
+                link.ready = True
+            elif kind == MESSAGE_STOPPING:
+                link.ready = False
+                link.output += encode_frame(dumps_payload([]))  # 在此之前分配的批次都已经写入管道
+                self.flush_worker(link)
+            elif link.jobs.pop(job_id, None) is None:
+                continue
+            elif kind == MESSAGE_RESULT:
+                self.send_result(slot, message[WORKER_MESSAGE.size:])
+            else:
+                remaining, job = loads_payload(message[WORKER_MESSAGE.size:])
+                heapq.heappush(self.delayed, (time.monotonic() + remaining, next(self.sequence), job))
+
+    def remove_worker(self, link):
+        """
+        后台任务进程退出：读取它退出前写入的结果后关闭管道，分配给它但还没有返回结果的任务以失败返回
+        """
+        self.read_messages(link)
+        link.process.join()
+        self.selector.unregister(link.conn.fileno())
+        self.selector.unregister(link.process.sentinel)
+        link.conn.close()
+        del self.links[link.process.pid]
+        for job_id, slot in link.jobs.items():
+            self.send_result(slot, dumps_payload((job_id, False, f"后台任务进程 (pid={link.process.pid}) 退出，任务没有执行完")))
+        if link.jobs:
+            print(f"后台任务进程 (pid={link.process.pid}) 退出，{len(link.jobs)} 个没有执行完的任务以失败返回")
+
+    def flush_worker(self, link):
+        try:
+            written = os.write(link.conn.fileno(), link.output)
+            del link.output[:written]
+        except BlockingIOError:
+            pass
+        except OSError:
+            return  # 进程已经退出，由退出事件处理
+        writing = bool(link.output)
+        if writing != link.writing:
+            link.writing = writing
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE if writing else selectors.EVENT_READ
+            self.selector.modify(link.conn.fileno(), events, ("worker", link))
+
+    def send_result(self, slot, payload):
+        self.result_buffers[slot] += encode_frame(payload)
+        self.flush_results(slot)
+
+    def flush_results(self, slot):
+        buffer = self.result_buffers[slot]
+        fd = self.result_pipes[slot][1].fileno()
+        registered = self.selector.get_map().get(fd) is not None
+        try:
+            written = os.write(fd, buffer)
+            del buffer[:written]
+        except BlockingIOError:
+            pass  # HTTP 进程暂时没有读取，等待管道可写
+        if buffer and not registered:
+            self.selector.register(fd, selectors.EVENT_WRITE, ("result", slot))
+        elif not buffer and registered:
+            self.selector.unregister(fd)
+
+    def worker_loop(self, conn, heartbeats=None, heartbeat_slot=0):
+        """
+        后台任务进程的工作函数：向分发线程请求一批任务并执行，失败的任务按指数退避重试；
+        收到 SIGTERM 后执行完当前这批任务，把等待重试和已经收到但没有开始执行的任务交还给分发线程后退出
+        :param conn: 与主进程分发线程通信的专用管道
+        :param heartbeats: WorkerSupervisor 的共享心跳数组
+        :param heartbeat_slot: 本进程的心跳槽位编号
+        """
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+        if heartbeats is not None:
+            # 后台任务可能运行很久，心跳放在单独的线程中发送，只用于发现整个进程卡死或退出
+            def send_heartbeats():
+                while not stopping.is_set():
+                    heartbeats[heartbeat_slot] = time.monotonic()
+                    stopping.wait(WORKER_HEARTBEAT_INTERVAL)
+            threading.Thread(target=send_heartbeats, name="job-heartbeat", daemon=True).start()
+
+        ready_message = WORKER_MESSAGE.pack(MESSAGE_READY, 0, 0)
+        conn.send_bytes(ready_message)
+        delayed = []  # 等待重试的任务：(重试时间, 序号, 任务)
+        sequence = itertools.count()
+        while not stopping.is_set():
+            now = time.monotonic()
+            received = False
+            if delayed and delayed[0][0] <= now:
+                batch = [heapq.heappop(delayed)[2]]
+            else:
+                timeout = min(delayed[0][0] - now, WORKER_HEARTBEAT_INTERVAL) if delayed else WORKER_HEARTBEAT_INTERVAL
+                try:
+                    received = conn.poll(timeout)
+                    batch = loads_payload(conn.recv_bytes()) if received else []
+                except EOFError:
+                    return  # 主进程已经退出
+
+            for job in batch:
+                job_id, slot, handler, data, attempt, max_retries, retry_delay = job
+                try:
+                    result = self.api_func_dict[handler](data)
+                except Exception as e:
+                    if attempt < max_retries:
+                        retry_at = time.monotonic() + retry_delay * 2 ** attempt
+                        retry_job = (job_id, slot, handler, data, attempt + 1, max_retries, retry_delay)
+                        heapq.heappush(delayed, (retry_at, next(sequence), retry_job))
+                        continue
+                    conn.send_bytes(encode_result(slot, job_id, False, f"{type(e).__name__}: {e}"))
+                    continue
+                conn.send_bytes(encode_result(slot, job_id, True, result))
+
+            if received and not stopping.is_set():
+                conn.send_bytes(ready_message)  # 这一批任务执行完毕，请求下一批
+
+        # 请求下一批任务后才收到 SIGTERM 时，分发线程可能已经发来新的任务，读取到分发线程回复的空批次为止
+        conn.send_bytes(WORKER_MESSAGE.pack(MESSAGE_STOPPING, 0, 0))
+        now = time.monotonic()
+        try:
+            while conn.poll(RESET_TIMEOUT) and (batch := loads_payload(conn.recv_bytes())):
+                delayed.extend((now, next(sequence), job) for job in batch)
+        except EOFError:
+            return  # 主进程已经退出
+        for retry_at, _, job in delayed:
+            payload = dumps_payload((max(retry_at - now, 0), job))
+            conn.send_bytes(WORKER_MESSAGE.pack(MESSAGE_REQUEUE, job[1], job[0]) + payload)
+        if delayed:
+            print(f"后台任务进程 (pid={os.getpid()}) 退出，{len(delayed)} 个没有执行完的任务交还给其他后台任务进程")
+
+
+class JobClient:
+    def __init__(self, job_queue: JobQueue, slot: int):
+        """
+        HTTP 进程中的任务队列客户端
+            enqueue 只把任务放入缓冲区，发送线程把缓冲区中的任务按优先级合并为批次写入本槽位的任务管道（写入可能因为管道已满而阻塞）
+            接收线程从本槽位的结果管道中读取结果，保存到结果缓存中，并通知事件循环中等待结果的请求
+        :param job_queue: ServerManager 创建的任务队列
+        :param slot: HTTP 进程的槽位编号
+        """
+        self.job_queue = job_queue
+        self.slot = slot
+        self.loop = None
+        self.lock = threading.Lock()
+        self.buffers = [[] for _ in JOB_PRIORITIES]  # 每个优先级等待发送的任务
+        self.wakeup = queue.SimpleQueue()  # 通知发送线程缓冲区中有新任务
+        self.results = OrderedDict()  # job_id -> (状态, 结果)，状态为 queued / done / failed
+        self.waiters = {}  # job_id -> 等待结果的 Future 列表
+        # 任务 ID 以进程 ID 为前缀，HTTP 进程重启后，旧进程遗留的结果不会被误认为是新任务的结果
+        self.task_ids = itertools.count(os.getpid() << 32)
+        self.started = False
+
+    def start(self):
+        self.started = True
+        threading.Thread(target=self.send_loop, name="job-send", daemon=True).start()
+        threading.Thread(target=self.receive_loop, name="job-receive", daemon=True).start()
+
+    def enqueue(self, func_name, data=None, priority=None, max_retries=None, retry_delay=None):
+        """
+        提交后台任务，立即返回，不等待任务执行
+        :param func_name: 后台任务函数名称（必须使用 background_job 装饰）
+        :param data: 传给任务函数的数据，只能包含可以序列化的类型
+        :param priority: 任务优先级 high / normal / low，默认使用装饰器中指定的优先级
+        :param max_retries: 最大重试次数，默认使用装饰器中指定的值
+        :param retry_delay: 第一次重试前的等待时间（秒），默认使用装饰器中指定的值
+        :return: job_id
+        """
+        job_info = self.job_queue.job_dict.get(func_name)
+        if job_info is None:
+            raise ValueError(f"'{func_name}' 不是后台任务函数，请使用 background_job 装饰")
+        priority = JOB_PRIORITIES.index(priority or job_info["priority"])
+        max_retries = job_info["max_retries"] if max_retries is None else max_retries
+        retry_delay = job_info["retry_delay"] if retry_delay is None else retry_delay
+
+        with self.lock:
+            if not self.job_queue.queue_slots.acquire(block=False):
+                raise JobQueueFull("后台任务排队数量已达上限")
+            self.job_queue.submitted[self.slot] += 1  # 本进程退出时没有发出的任务，由主进程归还名额
+
+        if not self.started:
+            with self.lock:
+                if not self.started:
+                    self.start()
+
+        job_id = next(self.task_ids)
+        with self.lock:
+            self.store_result(job_id, "queued", None)
+            # 任务中传递函数的模块限定名称，后台任务进程直接按名称取出函数
+            self.buffers[priority].append((job_id, self.slot, job_info["handler"], data, 0, max_retries, retry_delay))
+        self.wakeup.put(None)
+        return job_id
+
+    def send_loop(self):
+        while True:
+            self.wakeup.get()
+            with self.lock:
+                buffers, self.buffers = self.buffers, [[] for _ in JOB_PRIORITIES]
+            # 发送期间新提交的任务会留在缓冲区中，下一轮合并为一批发送
+            task_writer = self.job_queue.task_pipes[self.slot][1]
+            for priority, jobs in enumerate(buffers):
+                for start in range(0, len(jobs), JOB_BATCH_SIZE):
+                    task_writer.send_bytes(dumps_payload((priority, jobs[start:start + JOB_BATCH_SIZE])))
+
+    def receive_loop(self):
+        result_reader = self.job_queue.result_pipes[self.slot][0]
+        while True:
+            job_id, success, result = loads_payload(result_reader.recv_bytes())
+            with self.lock:
+                if job_id not in self.results:
+                    continue  # 槽位上之前的进程提交的任务
+                self.store_result(job_id, "done" if success else "failed", result)
+                waiters = self.waiters.pop(job_id, [])
+            for future in waiters:
+                future.get_loop().call_soon_threadsafe(self.set_waiter_result, future, success, result)
+
+    def store_result(self, job_id, status, result):
+        """
+        保存任务状态和结果，超过上限时淘汰最早的记录（需要持有 self.lock）
+        """
+        self.results[job_id] = (status, result)
+        self.results.move_to_end(job_id)
+        if len(self.results) > JOB_RESULT_CACHE_SIZE:
+            self.results.popitem(last=False)
+
+    @staticmethod
+    def set_waiter_result(future, success, result):
+        if future.done():
+            return
+        if success:
+            future.set_result(result)
+        else:
+            future.set_exception(JobFailed(result))
+
+    def status(self, job_id):
+        """
+        获取任务状态
+        :return: {"status": "queued" / "done" / "failed" / "unknown", "result": 任务返回值或错误信息}
+        """
+        with self.lock:
+            status, result = self.results.get(job_id, ("unknown", None))
+        return {"status": status, "result": result}
+
+    async def result(self, job_id, timeout=None):
+        """
+        等待任务执行完毕并返回结果，任务失败时抛出 JobFailed
+        :param job_id: enqueue 返回的 job_id
+        :param timeout: 最多等待的时间（秒），超时抛出 asyncio.TimeoutError
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self.lock:
+            status, result = self.results.get(job_id, ("unknown", None))
+            if status == "unknown":
+                raise KeyError(f"任务 {job_id} 不存在或结果已经被淘汰")
+            if status == "queued":
+                self.waiters.setdefault(job_id, []).append(future)
+        if status != "queued":
+            self.set_waiter_result(future, status == "done", result)
+        return await asyncio.wait_for(future, timeout)
+
+
+def get_job_client():
+    if job_client is None:
+        raise RuntimeError("后台任务队列没有启动，请确认存在 background_job 装饰的任务函数，并且在 HTTP 进程中调用")
+    return job_client
+
+
+def enqueue_job(func_name, data=None, priority=None, max_retries=None, retry_delay=None):
+    """
+    在 api 函数中提交后台任务，参数见 JobClient.enqueue
+    :return: job_id
+    """
+    return get_job_client().enqueue(func_name, data, priority, max_retries, retry_delay)
+
+
+def get_job_status(job_id):
+    """
+    获取任务状态，参数见 JobClient.status
+    """
+    return get_job_client().status(job_id)
+
+
+async def get_job_result(job_id, timeout=None):
+    """
+    等待任务结果，参数见 JobClient.result
+    """
+    return await get_job_client().result(job_id, timeout)
@@ -0,0 +1,237 @@
+"""
+文件描述: 根据容器的 CPU 限制和 CPU 拓扑规划进程数量和 CPU 绑定
+            1. 可用的 CPU：sched_getaffinity 得到允许使用的 CPU 集合（cpuset），再用 cgroup v2 的 cpu.max 或 cgroup v1 的
+               cpu.cfs_quota_us / cpu.cfs_period_us 限制可以同时使用的 CPU 数量，避免在有 CPU 配额的容器中创建过多进程
+            2. CPU 拓扑：从 /sys/devices/system/cpu 读取每个 CPU 所在的物理核心和 NUMA 节点，优先让每个进程独占一个物理核心
+               （不把两个进程放在同一个核心的两个超线程上），并把进程轮流分配到各个 NUMA 节点
+            3. 规划结果可以通过 config.py 或 ServerManager 的参数覆盖，规划时会打印每一项决策的原因
+
+创建者: 汐琳
+创建时间: 2025-01-22 15:17:40
+"""
+import math
+import os
+from pathlib import Path
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+SYSFS_CPU_ROOT = Path("/sys/devices/system/cpu")
+SYSFS_NODE_ROOT = Path("/sys/devices/system/node")
+
+SYSTEM_RESERVE_THRESHOLD = 8  # 可用 CPU 超过该数量时，留出 SYSTEM_RESERVE_CPUS 个 CPU 给系统和其他程序
+SYSTEM_RESERVE_CPUS = 2
+DEFAULT_BACKGROUND_WORKERS = 2  # 默认为后台任务保留的进程数量，最多占用约一半的可用 CPU
+
+
+def read_text(path):
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def parse_cpu_list(text):
+    """
+    解析 sysfs 中的 CPU 列表，例如 "0-3,8-11" -> [0, 1, 2, 3, 8, 9, 10, 11]
+    """
+    cpus = []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def read_cgroup_cpu_limit():
+    """
+    读取当前进程所在 cgroup 的 CPU 配额
+    :return: 可以同时使用的 CPU 数量（可能是小数），没有限制时返回 None
+    """
+    # cgroup v2：/proc/self/cgroup 中为 "0::/路径"，配额在 <路径>/cpu.max 中，格式为 "<配额> <周期>" 或 "max <周期>"
+    cgroup_path = "/"
+    for line in (read_text("/proc/self/cgroup") or "").splitlines():
+        if line.startswith("0::"):
+            cgroup_path = line[3:] or "/"
+    for directory in (CGROUP_ROOT / cgroup_path.lstrip("/"), CGROUP_ROOT):
+        cpu_max = read_text(directory / "cpu.max")
+        if cpu_max:
+            quota, _, period = cpu_max.partition(" ")
+            if quota == "max":
+                return None
+            return int(quota) / int(period or 100000)
+
+    # cgroup v1：配额为 -1 表示没有限制
+    for directory in (CGROUP_ROOT / "cpu", CGROUP_ROOT / "cpu,cpuacct"):
+        quota = read_text(directory / "cpu.cfs_quota_us")
+        period = read_text(directory / "cpu.cfs_period_us")
+        if quota and period:
+            if int(quota) <= 0:
+                return None
+            return int(quota) / int(period)
+    return None
+
+
+def get_allowed_cpus():
+    """
+    当前进程允许使用的 CPU 编号（受 cpuset / taskset 限制），不支持 sched_getaffinity 的系统上返回所有 CPU
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def read_cpu_topology(cpus):
+    """
+    读取每个 CPU 所在的物理核心和 NUMA 节点，读取不到时每个 CPU 视为一个独立的物理核心、都在节点 0 上
+    :param cpus: CPU 编号列表
+    :return: {CPU 编号: ((物理 CPU 编号, 核心编号), NUMA 节点编号)}
+    """
+    cpu_nodes = {}
+    for node_dir in SYSFS_NODE_ROOT.glob("node[0-9]*"):
+        for cpu in parse_cpu_list(read_text(node_dir / "cpulist")):
+            cpu_nodes[cpu] = int(node_dir.name[4:])
+
+    topology = {}
+    for cpu in cpus:
+        topology_dir = SYSFS_CPU_ROOT / f"cpu{cpu}" / "topology"
+        package_id = read_text(topology_dir / "physical_package_id")
+        core_id = read_text(topology_dir / "core_id")
+        if package_id is None or core_id is None:
+            core = ("cpu", cpu)
+        else:
+            core = (int(package_id), int(core_id))
+        topology[cpu] = (core, cpu_nodes.get(cpu, 0))
+    return topology
+
+
+def order_cpus(topology):
+    """
+    给 CPU 排序：先取每个物理核心的第一个超线程，再取其余的超线程；同一轮中轮流从各个 NUMA 节点中取核心
+    按顺序分配时，前面的进程各自独占一个物理核心，并均匀分布在各个 NUMA 节点上
+    :param topology: read_cpu_topology 的返回值
+    :return: 排序后的 CPU 编号列表
+    """
+    # NUMA 节点 -> 物理核心 -> 该核心上的 CPU
+    nodes = {}
+    for cpu in sorted(topology):
+        core, node = topology[cpu]
+        nodes.setdefault(node, {}).setdefault(core, []).append(cpu)
+
+    ordered = []
+    sibling_index = 0
+    while len(ordered) < len(topology):
+        node_queues = [
+            [siblings[sibling_index] for siblings in cores.values() if len(siblings) > sibling_index]
+            for _, cores in sorted(nodes.items())
+        ]
+        ordered.extend(zip_longest_flat(node_queues))
+        sibling_index += 1
+    return ordered
+
+
+def zip_longest_flat(queues):
+    """
+    轮流从每个列表中取一个元素，例如 [[0, 1, 2], [8, 9]] -> 0, 8, 1, 9, 2
+    """
+    for index in range(max((len(queue) for queue in queues), default=0)):
+        for queue in queues:
+            if index < len(queue):
+                yield queue[index]
+
+
+class CpuPlan:
+    def __init__(self, http_workers, background_workers, http_cpus, background_cpus, decisions):
+        """
+        CPU 规划结果
+        :param http_workers: HTTP 进程数量
+        :param background_workers: 为后台任务保留的进程数量
+        :param http_cpus: 每个 HTTP 进程绑定的 CPU 编号，不绑定时为 None
+        :param background_cpus: 每个后台任务进程绑定的 CPU 编号，不绑定时为 None
+        :param decisions: 每一项决策的说明
+        """
+        self.http_workers = http_workers
+        self.background_workers = background_workers
+        self.http_cpus = http_cpus
+        self.background_cpus = background_cpus
+        self.decisions = decisions
+
+    def log(self):
+        print("CPU 规划:")
+        for decision in self.decisions:
+            print(f"    {decision}")
+
+
+def plan_cpus(http_workers=None, background_workers=None, cpus=None, pin=True):
+    """
+    规划 HTTP 进程、后台任务进程的数量和 CPU 绑定，参数不为 None 时覆盖自动规划的结果
+    :param http_workers: HTTP 进程数量
+    :param background_workers: 为后台任务保留的进程数量
+    :param cpus: 可以使用的 CPU 编号列表，默认为 sched_getaffinity 的结果
+    :param pin: 是否把进程绑定到 CPU
+    :return: CpuPlan
+    """
+    decisions = []
+
+    allowed_cpus = sorted(cpus) if cpus is not None else get_allowed_cpus()
+    decisions.append(f"允许使用的 CPU: {format_cpu_list(allowed_cpus)}（{len(allowed_cpus)} 个）"
+                     + ("，由配置指定" if cpus is not None else ""))
+
+    budget = len(allowed_cpus)
+    cpu_limit = read_cgroup_cpu_limit()
+    if cpu_limit is not None:
+        budget = max(1, min(budget, math.ceil(cpu_limit)))
+        decisions.append(f"cgroup CPU 配额: {cpu_limit:g} 个 CPU，最多同时使用 {budget} 个 CPU")
+    else:
+        decisions.append("cgroup 没有 CPU 配额限制")
+
+    topology = read_cpu_topology(allowed_cpus)
+    ordered_cpus = order_cpus(topology)
+    physical_cores = len({core for core, _ in topology.values()})
+    numa_nodes = len({node for _, node in topology.values()})
+    decisions.append(f"CPU 拓扑: {physical_cores} 个物理核心，{numa_nodes} 个 NUMA 节点，分配顺序: {format_cpu_list(ordered_cpus, sort=False)}")
+
+    # 进程数量：可用 CPU 较多时给系统和其他程序留出一部分，再为后台任务保留进程，其余用于处理 HTTP 请求
+    usable = budget - SYSTEM_RESERVE_CPUS if budget > SYSTEM_RESERVE_THRESHOLD else budget
+    if background_workers is None:
+        background_workers = min(DEFAULT_BACKGROUND_WORKERS, (usable - 1) // 2)  # CPU 较少时优先保证 HTTP 进程
+        decisions.append(f"后台任务进程: {background_workers} 个")
+    else:
+        decisions.append(f"后台任务进程: {background_workers} 个，由配置指定")
+    if http_workers is None:
+        http_workers = max(usable - background_workers, 1)
+        decisions.append(f"HTTP 进程: {http_workers} 个" + (f"（留出 {budget - usable} 个 CPU 给系统）" if usable < budget else ""))
+    else:
+        decisions.append(f"HTTP 进程: {http_workers} 个，由配置指定")
+
+    if not pin:
+        decisions.append("不绑定 CPU，由操作系统调度")
+        return CpuPlan(http_workers, background_workers, [None] * http_workers, [None] * background_workers, decisions)
+
+    # 按排序后的顺序分配 CPU，进程数量超过 CPU 数量时从头循环使用
+    assigned = [ordered_cpus[index % len(ordered_cpus)] for index in range(http_workers + background_workers)]
+    http_cpus = assigned[:http_workers]
+    background_cpus = assigned[http_workers:]
+    decisions.append(f"HTTP 进程绑定的 CPU: {http_cpus}")
+    if background_cpus:
+        decisions.append(f"后台任务进程绑定的 CPU: {background_cpus}")
+    if http_workers + background_workers > physical_cores:
+        decisions.append("进程数量超过物理核心数量，部分进程会共享同一个物理核心")
+    return CpuPlan(http_workers, background_workers, http_cpus, background_cpus, decisions)
+
+
+def format_cpu_list(cpus, sort=True):
+    """
+    把 CPU 编号列表格式化为便于阅读的形式，例如 [0, 1, 2, 3, 8] -> "0-3,8"
+    """
+    cpus = sorted(cpus) if sort else list(cpus)
+    if not sort:
+        return ",".join(str(cpu) for cpu in cpus)
+
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
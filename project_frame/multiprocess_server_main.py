@@ -9,153 +9,420 @@ import multiprocessing  # 导入多进程模块
 import os  # 导入操作系统模块，用于获取CPU核心数
 import signal  # 导入信号模块，用于捕获进程信号
 import time
-import platform  # 用于判断操作系统类型
 from typing import Literal
 import psutil
 
-from hot_reload2.check_file_change import FolderWatcher
+from config import (PROCESS_POOL_SIZE, PROCESS_POOL_QUEUE_DEPTH, LISTENER_MODE, LISTEN_BACKLOG, WORKER_HEARTBEAT_INTERVAL,
+                    SHUTDOWN_TIMEOUT, HTTP_WORKERS, BACKGROUND_WORKERS, WORKER_CPUS, PIN_WORKERS, AUTOSCALE_MIN_WORKERS,
+                    AUTOSCALE_MAX_WORKERS)
 from http_frame.server import HTTPServer  # 导入 HTTPServer 类，用于处理 HTTP 请求
+from http_frame.dispatch_table import build_dispatch_table
+from http_frame import response_cache
+from http_frame.response_cache import SharedResponseCache
+from http_frame.rate_limiter import SharedRateLimiter
+from http_frame.router import Router
+from http_frame.listener import resolve_listener_mode, create_listen_socket
+from project_frame import background_jobs
+from project_frame.autoscaler import Autoscaler
+from project_frame.background_jobs import JobQueue
+from project_frame.cpu_planner import plan_cpus
+from project_frame.process_pool import SharedProcessPool
+from project_frame.supervisor import WorkerSupervisor, send_heartbeats
 
 
 class ServerManager:
-    def __init__(self, port, route_dict, api_func_dict):
+    def __init__(self, port, route_dict, api_func_dict,
+                 process_pool_size=PROCESS_POOL_SIZE, process_pool_queue_depth=PROCESS_POOL_QUEUE_DEPTH,
+                 listener_mode=LISTENER_MODE, listen_backlog=LISTEN_BACKLOG, reload_func=None,
+                 shutdown_timeout=SHUTDOWN_TIMEOUT, http_workers=HTTP_WORKERS, background_workers=BACKGROUND_WORKERS,
+                 worker_cpus=WORKER_CPUS, pin_workers=PIN_WORKERS, job_dict=None,
+                 autoscale_min_workers=AUTOSCALE_MIN_WORKERS, autoscale_max_workers=AUTOSCALE_MAX_WORKERS,
+                 middleware_dict=None):
         """
         初始化服务器管理器
         :param port: 监听的端口号
         :param route_dict: 路由和 API 函数之间关系的字典
-        :param api_func_dict: 动态引入生成的 API 函数字典
+        :param api_func_dict: 动态引入生成的 API 函数字典，key 为函数的模块限定名称
+        :param process_pool_size: 共享进程池的进程数量，None 表示使用为特殊任务保留的 CPU 核心数量
+        :param process_pool_queue_depth: 共享进程池中排队等待执行的任务数量上限
+        :param listener_mode: 多进程监听策略，"reuseport" 每个 HTTP 进程各自绑定端口，"inherit" 主进程绑定一次、HTTP 进程继承
+        :param listen_backlog: 监听队列长度
+        :param reload_func: 滚动重启前在主进程中重新引入 api 函数的函数，返回新的 (route_dict, api_func_dict)，
+                            为 None 时新的 HTTP 进程继续使用当前的 api 函数
+        :param shutdown_timeout: 退出或滚动重启时等待 HTTP 进程排空的时限（秒），超时后使用 SIGKILL 强制结束
+        :param http_workers: HTTP 进程数量，None 表示根据 cgroup 配额和 CPU 拓扑自动规划
+        :param background_workers: 为后台任务保留的进程数量，None 表示自动规划
+        :param worker_cpus: 可以使用的 CPU 编号列表，None 表示 sched_getaffinity 允许的所有 CPU
+        :param pin_workers: 是否把每个进程绑定到规划的 CPU
+        :param job_dict: 后台任务装饰器收集的任务信息字典，不为空时在为后台任务保留的 CPU 上启动后台任务进程
+        :param autoscale_min_workers: 自动扩缩容时 HTTP 进程数量的下限，None 表示不自动扩缩容
+        :param autoscale_max_workers: 自动扩缩容时 HTTP 进程数量的上限，None 表示 CPU 规划的 HTTP 进程数量
+        :param middleware_dict: 中间件装饰器收集的中间件信息字典，滚动重启时 reload_func 会在原字典中重新注册中间件
         """
         self.port = port
         self.route_dict = route_dict
         self.api_func_dict = api_func_dict
+        # 分发表、路由表和每个路由的中间件调用链只在主进程中生成一次，HTTP 进程通过 fork 继承
+        self.middleware_dict = middleware_dict or {}
+        self.router = Router(build_dispatch_table(route_dict, api_func_dict, self.middleware_dict))
         self.processes = []  # 存储所有子进程对象
-        self.os_type = platform.system()  # 获取操作系统类型
-        self.cpu_cores_number = self.get_cpu_cores_count()  # 根据操作系统获取 CPU 核心数量
+        self.process_pool_size = process_pool_size
+        self.process_pool_queue_depth = process_pool_queue_depth
+        self.process_pool = None  # 执行 executor="process" 的 api 函数的共享进程池，只有存在这类路由时才会创建
+        self.shared_response_cache = None  # cache_ttl 路由的跨进程响应缓存，只有存在这类路由时才会创建
+        self.rate_limiter = None  # 所有 HTTP 进程共用的限流令牌桶，只有存在限流的路由时才会创建
+        self.listener_mode = resolve_listener_mode(listener_mode)
+        self.listen_backlog = listen_backlog
+        self.listen_socket = None  # inherit 模式下主进程创建的监听套接字，HTTP 进程通过 fork 继承
+        self.supervisor = None  # 监控 HTTP 进程的心跳，并重启退出或卡死的进程
+        self.http_workers = 0  # HTTP 进程的槽位数量
+        self.reload_func = reload_func
+        self.reload_requested = False  # 收到 SIGHUP 后由监控循环执行滚动重启
+        # 每个槽位有两个进程池结果管道，滚动重启时新旧进程交替使用，旧进程排空期间仍然可以收到自己的任务结果
+        self.pool_slot_generations = []
+        self.shutdown_timeout = shutdown_timeout
+        self.shutting_down = False  # 是否正在退出
+        # 覆盖 CPU 规划结果的参数，None 表示自动规划
+        self.cpu_plan_overrides = {"http_workers": http_workers, "background_workers": background_workers,
+                                   "cpus": worker_cpus, "pin": pin_workers}
+        self.worker_cpus = []  # 每个 HTTP 进程槽位绑定的 CPU 编号，None 表示不绑定
+        self.job_dict = job_dict or {}
+        self.job_queue = None  # HTTP 进程向后台任务进程提交任务的队列，只有存在后台任务函数时才会创建
+        self.job_supervisor = None  # 监控后台任务进程
+        self.job_cpus = []  # 后台任务进程绑定的 CPU 编号
+        self.autoscale_min_workers = autoscale_min_workers
+        self.autoscale_max_workers = autoscale_max_workers
+        self.autoscaler = None  # 根据负载增减 HTTP 进程，只有配置了 autoscale_min_workers 时才会创建
 
 
-    def get_cpu_cores_count(self):
+    def has_process_routes(self):
         """
-        根据操作系统类型获取 CPU 核心数量，并防止 os.cpu_count() 返回 None
+        判断是否存在需要交给进程池执行的 api 函数
         """
-        if self.os_type == "Windows":
-            return os.cpu_count() or 1
-        elif self.os_type == "Linux":
+        return any(
+            api_func_info.get("execution_mode") == "process"
+            for methods in self.route_dict.values()
+            for api_func_info in methods.values()
+        )
+
+    def has_cached_routes(self):
+        """
+        判断是否存在指定了 cache_ttl 的 api 函数
+        """
+        return any(
+            api_func_info.get("cache_ttl") is not None
+            for methods in self.route_dict.values()
+            for api_func_info in methods.values()
+        )
+
+    def has_rate_limited_routes(self):
+        """
+        判断是否存在指定了 rate_limit 或 route_rate_limit 的 api 函数
+        """
+        return any(
+            api_func_info.get("rate_limit") is not None or api_func_info.get("route_rate_limit") is not None
+            for methods in self.route_dict.values()
+            for api_func_info in methods.values()
+        )
+
+    async def start_server_worker(self, worker_slot=0, pool_slot=None):
+        """
+        启动单个异步 HTTP 服务器实例，收到 SIGTERM 后停止接受新连接，已有连接处理完毕后返回
+        :param worker_slot: HTTP 进程的槽位编号
+        :param pool_slot: 本进程在共享进程池中使用的结果管道编号，默认与槽位编号相同
+        """
+        pool_slot = worker_slot if pool_slot is None else pool_slot
+        process_pool_client = self.process_pool.client(pool_slot) if self.process_pool else None
+        if self.job_queue:
+            background_jobs.job_client = self.job_queue.client(pool_slot)  # api 函数通过 enqueue_job 提交后台任务
+        server = HTTPServer(self.port, self.route_dict, self.api_func_dict, router=self.router,
+                            shared_response_cache=self.shared_response_cache, worker_slot=worker_slot,
+                            rate_limiter=self.rate_limiter,
+                            process_pool_client=process_pool_client, listen_backlog=self.listen_backlog,
+                            listen_socket=self.listen_socket,
+                            reuse_port=self.listener_mode == "reuseport")  # 使用自定义 HTTPServer 类
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.stop_accepting)  # 收到 SIGTERM 后排空连接再退出
+        heartbeat_task = asyncio.create_task(send_heartbeats(self.supervisor, worker_slot, server))  # 向主进程发送心跳和负载
+        try:
+            # 启动 HTTPServer（异步操作），开始接受连接后通知主进程本进程已经就绪
+            await server.start(on_listening=lambda: self.supervisor.mark_ready(worker_slot, os.getpid()))
+        finally:
+            heartbeat_task.cancel()
+
+    def worker_process(self, task_type: Literal['http_server', 'background_job'], worker_slot=0, pool_slot=None, job_conn=None):
+        """
+        单个进程的工作函数；进程崩溃后直接退出，由主进程中的 WorkerSupervisor 负责重启
+        :param task_type: 进程的任务类型，"http_server" 运行 asyncio 事件循环处理 HTTP 请求，"background_job" 执行后台任务
+        :param worker_slot: 进程的槽位编号
+        :param pool_slot: 本进程在共享进程池中使用的结果管道编号
+        :param job_conn: 后台任务进程与主进程分发线程通信的管道
+        """
+        # 重启的进程是在主进程设置了信号处理函数之后创建的，需要恢复默认的信号处理，否则会执行主进程的 graceful_exit
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # 终端中按 Ctrl+C 时整个进程组都会收到 SIGINT，由主进程统一通过 SIGTERM 通知 HTTP 进程排空
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)  # 滚动重启由主进程负责
+
+        if task_type == 'background_job':
             try:
-                with open("/proc/cpuinfo") as f:
-                    return sum(1 for line in f if line.startswith("processor")) or 1
-            except FileNotFoundError:
-                return os.cpu_count() or 1
-        elif self.os_type == "Darwin":  # macOS
-            return os.cpu_count() or 1
-        else:
-            print(f"未知操作系统: {self.os_type}，默认使用单核。")
-            return 1
+                self.job_supervisor.mark_ready(worker_slot, os.getpid())
+                self.job_queue.worker_loop(job_conn, self.job_supervisor.heartbeats, worker_slot)
+            except Exception as e:
+                print(f"Background job process crashed: {e}")
+                raise SystemExit(1)
+            return
+        if task_type != 'http_server':
+            raise ValueError(f"未知的任务类型: {task_type}")
 
-    async def start_server_worker(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)  # 将新的事件循环设置为当前线程的默认事件循环
+        try:
+            # 在事件循环中启动异步 HTTP 服务器
+            loop.run_until_complete(self.start_server_worker(worker_slot, pool_slot))
+        except Exception as e:
+            print(f"Worker process crashed: {e}")
+            raise SystemExit(1)  # 以非 0 退出码退出，主进程会按退避策略重启
+        finally:
+            loop.close()
+
+    def start_http_worker(self, worker_slot):
         """
-        启动单个异步 HTTP 服务器实例
+        在指定槽位上创建并启动 HTTP 进程，并绑定到该槽位对应的 CPU 核心，首次启动和重启都使用该方法
+        :param worker_slot: HTTP 进程的槽位编号
+        :return: 已启动的进程
         """
-        server = HTTPServer(self.port, self.route_dict, self.api_func_dict)  # 使用自定义 HTTPServer 类
-        await server.start()  # 启动 HTTPServer（异步操作）
-        await asyncio.Future()  # 防止退出（保持运行状态）
+        # 与该槽位上一个进程使用不同的进程池结果管道
+        generation = self.pool_slot_generations[worker_slot]
+        self.pool_slot_generations[worker_slot] = 1 - generation
+        pool_slot = worker_slot + self.http_workers * generation
+        # 丢弃之前使用管道的进程没有写完的任务，并归还它占用但没有发出的排队名额；
+        # 槽位上没有运行中的进程时（首次启动、崩溃后重启、扩容）两个管道都不再被使用，一起重置，
+        # 滚动重启时旧进程还在使用另一个管道，只重置新进程使用的管道
+        if self.supervisor.workers[worker_slot] is None:
+            reset_slots = (worker_slot, worker_slot + self.http_workers)
+        else:
+            reset_slots = (pool_slot,)
+        for slot in reset_slots:
+            if self.process_pool:
+                self.process_pool.reset_slot(slot)
+            if self.job_queue:
+                self.job_queue.reset_slot(slot)
+
+        process = multiprocessing.Process(target=self.worker_process, args=('http_server', worker_slot, pool_slot))  # 创建新进程，并传递槽位编号
+        process.start()  # 启动进程
+
+        # 使用 psutil 绑定进程到 CPU 规划中该槽位对应的 CPU，自动扩容超过规划数量的槽位循环使用规划的 CPU
+        cpu_core = self.worker_cpus[worker_slot % len(self.worker_cpus)]
+        if cpu_core is not None:
+            try:
+                psutil.Process(process.pid).cpu_affinity([cpu_core])  # 绑定到指定核心
+            except psutil.NoSuchProcess:
+                pass  # 进程启动后立即崩溃，由 WorkerSupervisor 处理
+        return process
 
-    async def listen_file_change(self):
+    def start_job_worker(self, worker_slot):
         """
-        监听文件变化的协程，包含多个特定任务
+        在指定槽位上创建并启动后台任务进程，并绑定到为后台任务保留的 CPU
+        :param worker_slot: 后台任务进程的槽位编号
+        :return: 已启动的进程
         """
-        # 特定任务 1：每隔一分钟打印一次当前时间
-        async def print_time_periodically(os_type):
-            while True:
-                await asyncio.sleep(60)  # 每隔60秒执行一次
-                print(f"当前时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
+        conn, job_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=self.worker_process, args=('background_job', worker_slot, None, job_conn))
+        process.start()
+        job_conn.close()
+        self.job_queue.attach_worker(worker_slot, process, conn)  # 由分发线程给该进程分配任务
 
-        # 这里可以增加其他任务来处理文件变化等
-        async def other_task():
-            while True:
+        cpu_core = self.job_cpus[worker_slot % len(self.job_cpus)]
+        if cpu_core is not None:
+            try:
+                psutil.Process(process.pid).cpu_affinity([cpu_core])
+            except psutil.NoSuchProcess:
                 pass
+        return process
 
-        # 启动并行执行多个任务
-        await asyncio.gather(print_time_periodically(self.os_type), other_task())
-
-    def worker_process(self, task_type: Literal['http_server', 'listen_file_change']):
+    def reload_workers(self):
         """
-        单个进程的工作函数，运行 asyncio 事件循环，且处理进程中的异常，确保进程崩溃时会重启
+        滚动重启所有 HTTP 进程（管理接口），可以在主进程中直接调用，SIGHUP 也会触发
+            1. 如果指定了 reload_func，先在主进程中重新引入 api 函数，新的 HTTP 进程通过 fork 继承新的代码；
+               进程池中的进程同样替换为新进程，正在执行任务的进程返回结果后再替换
+            2. 逐个槽位启动新进程，新进程开始接受连接后，旧进程停止接受连接并排空后退出
+            3. 逐个替换后台任务进程，旧进程执行完当前这批任务后退出，排队中的任务由新进程继续执行
+        :return: 是否所有槽位都已经替换为新进程
         """
-        loop = None  # 确保 loop 变量在 try 块外部就已经声明
-        while True:
+        if self.reload_func:
+            # reload_func 会清空并重新填充路由、中间件和后台任务的注册表（与装饰器共用的字典），
+            # 任何一步失败（包括新代码的路由表或中间件调用链无法生成）都恢复为原来的内容，旧进程继续使用旧代码
+            registries = (self.route_dict, self.middleware_dict, self.job_dict)
+            snapshots = [dict(registry) for registry in registries]
             try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)  # 将新的事件循环设置为当前线程的默认事件循环
-                task = self.start_server_worker
-                # 根据 task_type 选择对应的函数并调用，返回协程对象
-                # if task_type == 'http_server':
-                #     task = self.start_server_worker
-                # elif task_type == 'listen_file_change':
-                #     watcher = FolderWatcher(folder_name="api_func_set")  # 创建监听器实例
-                #     task = watcher.start_watch  # 选择文件变化监听任务
-                # else:
-                #     raise ValueError(f"未知的任务类型: {task_type}")
-                # 在事件循环中启动异步 HTTP 服务器
-                loop.run_until_complete(task())
+                route_dict, api_func_dict = self.reload_func()
+                router = Router(build_dispatch_table(route_dict, api_func_dict, self.middleware_dict))
             except Exception as e:
-                print(f"Worker process crashed: {e}. Restarting...")
-                time.sleep(3)  # 等待 3 秒后重启进程，避免立即重启
-            finally:
-                if loop:
-                    loop.close()  # 确保事件循环存在时关闭它
+                for registry, snapshot in zip(registries, snapshots):
+                    registry.clear()
+                    registry.update(snapshot)
+                print(f"重新引入 api 函数失败，取消本次滚动重启: {e}")
+                return False
+            self.route_dict, self.api_func_dict, self.router = route_dict, api_func_dict, router
+            if self.shared_response_cache:
+                # 共享内存中的响应由旧代码生成，使所有路由的缓存失效
+                self.shared_response_cache.invalidate()
+            if self.job_queue:
+                self.job_queue.api_func_dict = self.api_func_dict
+            if self.process_pool:
+                # 进程池中的进程仍在执行旧代码，逐个替换为继承了新代码的进程
+                self.process_pool.restart(self.api_func_dict)
+
+        print("开始滚动重启 HTTP 进程...")
+        success = self.supervisor.rolling_restart(drain_timeout=self.shutdown_timeout)
+        if success and self.job_supervisor:
+            success = self.job_supervisor.rolling_restart(drain_timeout=self.shutdown_timeout)
+        self.processes = self.supervisor.processes
+        print("滚动重启完成" if success else "滚动重启未完成")
+        return success
+
+    def request_reload(self, signum, frame):
+        """
+        SIGHUP 信号处理函数，只做标记，由监控循环执行滚动重启，避免在信号处理函数中启动、等待进程
+        """
+        self.reload_requested = True
+
+    def supervise(self):
+        """
+        主进程的监控循环：重启退出或卡死的 HTTP 进程和后台任务进程，并执行 SIGHUP 触发的滚动重启
+        """
+        while True:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload_workers()
+            self.supervisor.check()
+            if self.autoscaler:
+                self.autoscaler.check()
+            if self.job_supervisor:
+                self.job_supervisor.check()
+            time.sleep(WORKER_HEARTBEAT_INTERVAL)
 
     def graceful_exit(self, signum, frame):
         """
-        捕获退出信号并优雅退出
+        捕获退出信号并优雅退出：
+            1. 向所有 HTTP 进程发送 SIGTERM，HTTP 进程停止接受新连接，关闭空闲连接，处理完正在执行的请求后退出
+            2. 超过 shutdown_timeout 仍未退出的 HTTP 进程使用 SIGKILL 强制结束
+            3. HTTP 进程退出后，通知后台任务进程执行完当前这批任务后退出（排空期间的请求仍然可以提交后台任务），
+               队列中尚未执行的任务会被丢弃
+            4. 最后终止共享进程池（排空期间 executor="process" 的请求仍然需要进程池）
         """
-        print("正在终止服务...")
-        for process_item in self.processes:
-            process_item.terminate()  # 终止子进程
-        for process_item in self.processes:
-            process_item.join()  # 等待子进程退出
+        if self.shutting_down:
+            return  # 已经在退出过程中，忽略重复的信号
+        self.shutting_down = True
+        print("正在终止服务，等待 HTTP 进程处理完已有的请求...")
+
+        if self.supervisor:
+            self.processes = self.supervisor.processes  # 监控器重启过的进程
+        deadline = time.monotonic() + self.shutdown_timeout
+        self.stop_processes(self.processes, deadline, "HTTP 进程")
+        if self.job_supervisor:
+            self.stop_processes(self.job_supervisor.processes, deadline, "后台任务进程")
+            self.job_queue.stop()
+
+        if self.process_pool:
+            self.process_pool.stop()  # 终止共享进程池
+        if self.shared_response_cache:
+            print(f"响应缓存: {self.shared_response_cache.stats()}")
+            self.shared_response_cache.close()
+        if self.listen_socket:
+            self.listen_socket.close()
         exit(0)
 
+    def stop_processes(self, processes, deadline, name):
+        """
+        向进程发送 SIGTERM 并等待退出，超过 deadline 仍未退出的进程使用 SIGKILL 强制结束
+        """
+        for process_item in processes:
+            process_item.terminate()  # 发送 SIGTERM，通知子进程排空后退出
+        for process_item in processes:
+            process_item.join(max(deadline - time.monotonic(), 0))  # 等待子进程排空后退出
+        for process_item in processes:
+            if process_item.is_alive():
+                print(f"{name} (pid={process_item.pid}) 超过 {self.shutdown_timeout} 秒没有退出，强制结束")
+                process_item.kill()
+                process_item.join()
+
     def start_server(self):
         """
         启动服务器并管理子进程，并将每个进程绑定到特定核心
         """
-        num_workers = os.cpu_count() or 1  # 获取操作系统中 CPU 核心数量 防止 os.cpu_count() 返回 None
-        special_project_tasks_cpu = 1 * 2 # 用于处理项目特殊任务的进程
-        other_task_cpu = 1 * 2
+        # 根据 cgroup 配额、允许使用的 CPU 和 CPU 拓扑规划进程数量和 CPU 绑定
+        plan = plan_cpus(**self.cpu_plan_overrides)
+        plan.log()
+
+        # inherit 模式：主进程在启动 HTTP 进程之前绑定端口，所有 HTTP 进程共用同一个监听队列
+        if self.listener_mode == "inherit":
+            self.listen_socket = create_listen_socket(self.port, self.listen_backlog)
 
-        # 如果 CPU 超过 4 个，则保留两个 CPU 用于启动独立的进程
-        if num_workers > 4 * 2:
-            start_workers = num_workers - other_task_cpu  # 保留 2 个 CPU 用来启动独立的进程
+        # 如果存在 executor="process" 的 api 函数或后台任务函数，为后台任务保留的 CPU 用来运行共享进程池和后台任务进程，
+        # 否则仍作为普通的 HTTP 进程
+        if self.has_process_routes() or self.job_dict:
+            http_workers = plan.http_workers
+            self.worker_cpus = plan.http_cpus
+            # 没有为后台任务保留 CPU 时，进程池、后台任务进程和最后一个 HTTP 进程共用一个 CPU
+            reserved_cores = plan.background_cpus or plan.http_cpus[-1:]
         else:
-            start_workers = num_workers
+            http_workers = plan.http_workers + plan.background_workers
+            self.worker_cpus = plan.http_cpus + plan.background_cpus
+            reserved_cores = []
 
-        http_server_cpu = start_workers - special_project_tasks_cpu or 1 # 用于处理 http 请求的 cpu = 启动进程的 cpu - 执行特殊任务的 cpu
+        # 自动扩缩容：槽位数量按进程数量上限创建，启动时只启用下限数量的槽位
+        active_workers = None
+        if self.autoscale_min_workers is not None:
+            max_workers = self.autoscale_max_workers or http_workers
+            active_workers = min(max(self.autoscale_min_workers, 1), max_workers)
+            http_workers = max_workers
+            print(f"自动扩缩容: HTTP 进程数量 {active_workers}-{max_workers}")
 
-        processes = [] # 用于存放所有子进程
+        # 进程池和任务队列必须在 HTTP 进程启动之前创建，HTTP 进程才能继承它们的管道
+        # 每个 HTTP 进程槽位两个结果管道，滚动重启时新旧进程各用一个
+        if self.has_process_routes():
+            pool_size = self.process_pool_size or max(plan.background_workers, 1)
+            self.process_pool = SharedProcessPool(self.api_func_dict, pool_size, self.process_pool_queue_depth, http_workers * 2)
+        if self.has_cached_routes():
+            self.shared_response_cache = SharedResponseCache(http_workers)
+            # 进程池进程和后台任务进程中没有 ResponseCache，invalidate_response_cache 直接修改共享的路由版本号
+            response_cache.shared_response_cache = self.shared_response_cache
+        # 滚动重启后新增的限流路由也需要共享的令牌桶，因此只要配置了重新引入函数就创建
+        if self.has_rate_limited_routes() or self.reload_func:
+            self.rate_limiter = SharedRateLimiter()
+        if self.job_dict:
+            self.job_queue = JobQueue(self.job_dict, self.api_func_dict, client_slots=http_workers * 2)
+            self.job_cpus = reserved_cores
+            self.job_supervisor = WorkerSupervisor(max(plan.background_workers, 1), self.start_job_worker, name="后台任务进程",
+                                                   max_requests=None, max_rss=None)  # 回收限制只用于 HTTP 进程
 
-        # 启动多个子进程，并绑定进程到指定核心
-        for i in range(start_workers):
-            if i <= http_server_cpu:
-                process = multiprocessing.Process(target=self.worker_process, args=('http_server',))  # 创建新进程，并传递核心索引
-            else:
-                process = multiprocessing.Process(target=self.worker_process, args=('listen_file_change',))  # 创建新进程，并传递核心索引
-            processes.append(process)  # 将进程添加到进程列表中
-            process.start()  # 启动进程
+        self.http_workers = http_workers
+        self.pool_slot_generations = [0] * http_workers
 
-            # 获取当前进程的进程 ID (PID)
-            pid = process.pid
+        # 心跳使用的共享内存必须在启动 HTTP 进程之前创建
+        self.supervisor = WorkerSupervisor(http_workers, self.start_http_worker, active_slots=active_workers)
+        if active_workers is not None and active_workers < http_workers:
+            self.autoscaler = Autoscaler(self.supervisor, active_workers, http_workers, drain_timeout=self.shutdown_timeout)
+
+        # 启动多个子进程，并绑定进程到指定核心
+        self.supervisor.start_all()
+        if self.job_supervisor:
+            self.job_queue.start()  # 分发线程必须先于后台任务进程启动
+            self.job_supervisor.start_all()
 
-            # 使用 psutil 绑定进程到指定核心
-            cpu_core = i % num_workers  # 将进程分配到不同的核心
-            p = psutil.Process(pid)
-            p.cpu_affinity([cpu_core])  # 绑定到指定核心
+        # 启动共享进程池，由进程池的分发线程启动并监控池中的进程，进程绑定到为特殊任务保留的核心
+        if self.process_pool:
+            self.process_pool.start(reserved_cores)
 
-        self.processes = processes
+        self.processes = self.supervisor.processes
 
         # 捕获终止信号并优雅退出
         signal.signal(signal.SIGTERM, self.graceful_exit)
         signal.signal(signal.SIGINT, self.graceful_exit)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.request_reload)  # kill -HUP <主进程 PID> 触发滚动重启
 
-        # 等待所有进程结束
-        for process_item in self.processes:
-            process_item.join()  # 等待子进程退出
\ No newline at end of file
+        # 监控所有 HTTP 进程：退出或卡死的进程按退避策略重启，直到收到退出信号
+        self.supervise()
@@ -0,0 +1,535 @@
+"""
+文件描述: 由 ServerManager 持有、所有 HTTP 进程共享的进程池，用于执行 executor="process" 的 CPU 密集型 api 函数
+            1. 主进程在启动 HTTP 进程之前为每个 HTTP 进程（槽位）创建一个任务管道和一个结果管道，HTTP 进程通过 fork 继承
+            2. 主进程中的分发线程读取所有槽位的任务，交给空闲的进程池进程执行，再把结果转发回对应槽位的结果管道；
+               每个管道只有一个写入方和一个读取方，不需要跨进程的锁，任何一个进程崩溃都不会让其他进程卡在锁上
+            3. 分发线程监控进程池中的进程：进程退出（OOM、段错误、os._exit 等）或者任务执行超时被强制结束后，
+               它正在执行的任务立即以失败返回，并启动新进程补充，进程池不会越用越少
+            4. 分发线程对所有管道使用非阻塞读写，某个 HTTP 进程不再读取结果时，不会影响其他进程的任务
+            5. 任务和结果优先使用 marshal 序列化（只支持内置类型，比 pickle 快且不会执行任意代码），不支持的类型才回退到 pickle；
+               分发线程只读取任务 ID，不反序列化任务内容
+            6. 使用信号量限制排队任务的数量，队列已满时 HTTP 进程直接拒绝请求，不会无限堆积；
+               HTTP 进程等待结果的时间不超过 task_timeout，排队和执行的时间都计算在内
+
+创建者: 汐琳
+创建时间: 2025-01-10 14:21:36
+"""
+import asyncio
+import collections
+import itertools
+import marshal
+import multiprocessing
+import os
+import pickle
+import queue
+import selectors
+import signal
+import struct
+import threading
+import time
+
+from config import PROCESS_POOL_TASK_TIMEOUT
+
+MARSHAL_FLAG = b"M"  # 使用 marshal 序列化的数据
+PICKLE_FLAG = b"P"  # 使用 pickle 序列化的数据
+
+
+def dumps_payload(obj):
+    """
+    序列化任务或结果：请求数据和返回值通常只包含 dict/list/str/int 等内置类型，优先使用 marshal，失败时回退到 pickle
+    """
+    try:
+        return MARSHAL_FLAG + marshal.dumps(obj)
+    except ValueError:
+        return PICKLE_FLAG + pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads_payload(payload):
+    """
+    反序列化 dumps_payload 生成的数据
+    """
+    body = memoryview(payload)[1:]
+    if payload[:1] == MARSHAL_FLAG:
+        return marshal.loads(body)
+    return pickle.loads(body)
+
+
+class ProcessPoolFull(Exception):
+    """
+    进程池排队任务数量达到上限
+    """
+
+
+class ProcessPoolTaskError(Exception):
+    """
+    api 函数在进程池中执行时抛出了异常
+    """
+
+
+class ProcessPoolTimeout(ProcessPoolTaskError):
+    """
+    api 函数在进程池中超过 task_timeout 没有返回结果（包括排队的时间）
+    """
+
+
+TASK_ID = struct.Struct("<q")  # 任务和结果消息的前缀：任务 ID，分发线程只读取这部分
+FRAME_SIZE = struct.Struct("!i")  # multiprocessing.Connection 的消息格式：长度前缀 + 内容，超过 2GB 时长度为 -1，后接 8 字节长度
+FRAME_LARGE_SIZE = struct.Struct("!Q")
+READ_SIZE = 64 * 1024  # 分发线程每次从管道中读取的字节数
+RESET_TIMEOUT = 1  # 等待分发线程重置槽位的最长时间（秒）
+DISPATCH_INTERVAL = 0.5  # 分发线程检查任务超时的间隔（秒）
+RESULT_OK, RESULT_ERROR, RESULT_TIMEOUT = 0, 1, 2  # 结果的状态
+
+
+def encode_frame(message):
+    """
+    按 multiprocessing.Connection 的格式编码消息，对端可以直接使用 recv_bytes 读取
+    """
+    if len(message) > 0x7fffffff:
+        return FRAME_SIZE.pack(-1) + FRAME_LARGE_SIZE.pack(len(message)) + message
+    return FRAME_SIZE.pack(len(message)) + message
+
+
+def encode_result(task_id, status, result):
+    return TASK_ID.pack(task_id) + dumps_payload((status, result))
+
+
+class FrameBuffer:
+    def __init__(self):
+        """
+        从非阻塞的管道中读取 multiprocessing.Connection 格式的消息，不完整的消息留在缓冲区中，等待后续数据
+        """
+        self.data = bytearray()
+
+    def feed(self, chunk):
+        self.data += chunk
+
+    def messages(self):
+        """
+        取出缓冲区中所有完整的消息
+        """
+        messages = []
+        while len(self.data) >= FRAME_SIZE.size:
+            size, header = FRAME_SIZE.unpack_from(self.data)[0], FRAME_SIZE.size
+            if size == -1:
+                if len(self.data) < FRAME_SIZE.size + FRAME_LARGE_SIZE.size:
+                    break
+                size, header = FRAME_LARGE_SIZE.unpack_from(self.data, FRAME_SIZE.size)[0], FRAME_SIZE.size + FRAME_LARGE_SIZE.size
+            if len(self.data) < header + size:
+                break
+            messages.append(bytes(self.data[header:header + size]))
+            del self.data[:header + size]
+        return messages
+
+    def clear(self):
+        self.data.clear()
+
+
+class PoolWorker:
+    __slots__ = ("index", "process", "conn", "results", "output", "writing", "task", "retiring")
+
+    def __init__(self, index, process, conn):
+        """
+        分发线程中记录的进程池进程
+        :param index: 进程在进程池中的编号
+        :param process: 进程对象
+        :param conn: 与该进程通信的管道（主进程一端，非阻塞）
+        """
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.results = FrameBuffer()  # 从该进程读取的结果
+        self.output = bytearray()  # 还没有写入管道的任务数据
+        self.writing = False  # 是否在等待管道可写
+        self.task = None  # 正在执行的任务：(槽位, 任务 ID, 提交时间)，空闲时为 None
+        self.retiring = False  # 执行完当前任务后退出（滚动重启时替换为引入了新代码的进程）
+
+
+class SharedProcessPool:
+    def __init__(self, api_func_dict, pool_size, queue_depth, client_slots, task_timeout=PROCESS_POOL_TASK_TIMEOUT):
+        """
+        创建进程池使用的管道，必须在启动 HTTP 进程之前创建，子进程才能继承
+        :param api_func_dict: 动态引入生成的 API 函数字典，进程池中的进程根据函数的模块限定名称找到对应的函数
+        :param pool_size: 进程池的进程数量
+        :param queue_depth: 排队等待执行的任务数量上限
+        :param client_slots: HTTP 进程的槽位数量，每个槽位对应一个任务管道和一个结果管道
+        :param task_timeout: 任务从提交到返回结果的时限（秒）
+        """
+        self.api_func_dict = api_func_dict
+        self.pool_size = max(pool_size, 1)
+        self.queue_depth = queue_depth
+        self.task_timeout = task_timeout
+        self.queue_slots = multiprocessing.BoundedSemaphore(queue_depth)  # 剩余可排队的任务数量
+
+        # 每个 HTTP 进程槽位一个任务管道（HTTP 进程写入，分发线程读取）和一个结果管道（分发线程写入，HTTP 进程读取）
+        self.task_pipes = [multiprocessing.Pipe(duplex=False) for _ in range(client_slots)]
+        self.result_pipes = [multiprocessing.Pipe(duplex=False) for _ in range(client_slots)]
+        # 每个槽位上的 HTTP 进程累计占用的排队名额，只由该 HTTP 进程写入；与分发线程收到的任务数量之差是
+        # 进程在占用名额之后、任务写入管道之前退出而遗留的名额，重置槽位时归还
+        self.submitted = multiprocessing.Array("q", client_slots, lock=False)
+
+        # 以下状态只在主进程的分发线程中使用
+        self.received = [0] * client_slots  # 每个槽位收到的任务数量
+        self.cpus = []  # 进程池进程绑定的 CPU 编号
+        self.workers = [None] * self.pool_size
+        self.restart_counts = [0] * self.pool_size  # 每个位置上的进程被替换的次数（崩溃、超时、滚动重启）
+        self.backlog = collections.deque()  # 等待空闲进程的任务：(槽位, 任务消息, 提交时间)
+        self.task_buffers = [FrameBuffer() for _ in range(client_slots)]
+        self.result_buffers = [bytearray() for _ in range(client_slots)]
+        self.selector = None
+        self.running = False
+        self.thread = None
+        self.controls = queue.SimpleQueue()  # 主线程发给分发线程的指令
+        self.wakeup_reader, self.wakeup_writer = os.pipe()
+
+    def start(self, cpus=()):
+        """
+        在主进程中启动分发线程，由分发线程启动并监控进程池中的所有进程
+        :param cpus: 进程池进程绑定的 CPU 编号，按进程编号循环使用，为空或包含 None 时不绑定
+        """
+        self.cpus = [] if not cpus or None in cpus else list(cpus)
+        self.running = True
+        self.thread = threading.Thread(target=self.dispatch_loop, name="process-pool-dispatch", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        停止分发线程，并终止进程池中的所有进程
+        """
+        if self.thread is not None:
+            self.send_control("stop")
+            self.thread.join()
+            self.thread = None
+
+    def restart(self, api_func_dict):
+        """
+        滚动重启时替换进程池中的所有进程，新进程通过 fork 继承重新引入的 api 函数；
+        空闲的进程立即替换，正在执行任务的进程在返回结果后替换
+        """
+        self.send_control("restart", api_func_dict)
+
+    def reset_slot(self, slot):
+        """
+        槽位上即将启动新的 HTTP 进程：丢弃之前使用该槽位的进程没有写完的任务，并归还它占用但没有发出的排队名额，
+        等待分发线程处理完毕后返回，避免新进程提交的任务被一起丢弃
+        """
+        if self.thread is None:
+            return  # 首次启动，槽位还没有被使用过
+        done = threading.Event()
+        self.send_control("reset", (slot, done))
+        done.wait(RESET_TIMEOUT)
+
+    def send_control(self, command, argument=None):
+        self.controls.put((command, argument))
+        os.write(self.wakeup_writer, b"\0")
+
+    def worker_main(self, conn, cpu):
+        """
+        进程池中每个进程的工作函数：不断读取任务、执行 api 函数，并把结果写回分发线程；分发线程关闭管道后退出
+        """
+        # 进程由主进程的分发线程启动，需要恢复默认的信号处理，否则会执行主进程的 graceful_exit
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        if cpu is not None:
+            os.sched_setaffinity(0, [cpu])
+
+        while True:
+            try:
+                message = conn.recv_bytes()
+            except EOFError:
+                return
+            task_id = TASK_ID.unpack_from(message)[0]
+            handler, ctx, data = loads_payload(message[TASK_ID.size:])
+            try:
+                result = encode_result(task_id, RESULT_OK, self.api_func_dict[handler](ctx=ctx, data=data))
+            except Exception as e:
+                # api 函数抛出异常，或者返回值无法序列化（例如生成器，进程池不支持流式响应）
+                result = encode_result(task_id, RESULT_ERROR, f"{type(e).__name__}: {e}")
+            conn.send_bytes(result)
+
+    def spawn(self, index):
+        """
+        在分发线程中启动编号为 index 的进程池进程
+        """
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=True)
+        cpu = self.cpus[index % len(self.cpus)] if self.cpus else None
+        process = multiprocessing.Process(target=self.worker_main, args=(child_conn, cpu), daemon=True)
+        process.start()
+        child_conn.close()
+        os.set_blocking(parent_conn.fileno(), False)
+        worker = self.workers[index] = PoolWorker(index, process, parent_conn)
+        self.selector.register(parent_conn.fileno(), selectors.EVENT_READ, ("worker", worker))
+        self.selector.register(process.sentinel, selectors.EVENT_READ, ("exit", worker))
+
+    def remove(self, worker, kill=False):
+        """
+        在分发线程中移除进程池进程：关闭管道，结束并回收进程，它正在执行的任务以失败返回
+        :param kill: 是否使用 SIGKILL 强制结束（执行超时的进程）；否则使用 SIGTERM
+        """
+        self.selector.unregister(worker.conn.fileno())
+        self.selector.unregister(worker.process.sentinel)
+        worker.conn.close()
+        if worker.process.is_alive():
+            worker.process.kill() if kill else worker.process.terminate()
+        worker.process.join()
+        self.workers[worker.index] = None
+
+    def replace(self, worker, reason, status=RESULT_ERROR):
+        """
+        在分发线程中替换进程池进程，并启动新进程补充
+        """
+        task = worker.task
+        self.remove(worker, kill=status == RESULT_TIMEOUT)
+        if task is not None:
+            slot, task_id, _ = task
+            self.send_result(slot, encode_result(task_id, status, reason))
+        self.restart_counts[worker.index] += 1
+        if self.running:
+            self.spawn(worker.index)
+
+    def dispatch_loop(self):
+        """
+        分发线程：读取任务、分配给空闲进程、转发结果，并监控进程池进程的退出和任务超时
+        """
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, ("wakeup", None))
+        for slot, (task_reader, _) in enumerate(self.task_pipes):
+            os.set_blocking(task_reader.fileno(), False)
+            self.selector.register(task_reader.fileno(), selectors.EVENT_READ, ("task", slot))
+        for _, result_writer in self.result_pipes:
+            os.set_blocking(result_writer.fileno(), False)
+        for index in range(self.pool_size):
+            self.spawn(index)
+
+        while self.running:
+            for key, events in self.selector.select(DISPATCH_INTERVAL):
+                kind, target = key.data
+                if kind == "wakeup":
+                    os.read(self.wakeup_reader, READ_SIZE)
+                    self.handle_controls()
+                elif kind == "task":
+                    self.read_tasks(target)
+                elif kind == "result":
+                    self.flush_results(target)
+                elif self.workers[target.index] is not target:
+                    continue  # 本轮中已经被替换的进程
+                elif kind == "exit":
+                    target.process.join()
+                    print(f"进程池进程 {target.index} (pid={target.process.pid}) 已退出，退出码: {target.process.exitcode}")
+                    self.replace(target, "进程池进程意外退出")
+                else:
+                    if events & selectors.EVENT_WRITE:
+                        self.flush_worker(target)
+                    if events & selectors.EVENT_READ:
+                        self.read_results(target)
+            if self.running:
+                self.expire(time.monotonic())
+                self.dispatch()
+
+        for worker in self.workers:
+            if worker is not None:
+                self.remove(worker)
+        self.selector.close()
+
+    def handle_controls(self):
+        while True:
+            try:
+                command, argument = self.controls.get_nowait()
+            except queue.Empty:
+                return
+            if command == "stop":
+                self.running = False
+            elif command == "reset":
+                slot, done = argument
+                self.read_tasks(slot)  # 先读完之前的进程已经完整写入的任务
+                self.task_buffers[slot].clear()
+                for _ in range(self.submitted[slot] - self.received[slot]):
+                    self.queue_slots.release()
+                self.submitted[slot] = 0
+                self.received[slot] = 0
+                done.set()
+            elif command == "restart":
+                self.api_func_dict = argument
+                for worker in list(self.workers):
+                    if worker is None:
+                        continue
+                    if worker.task is None:
+                        self.replace(worker, "")
+                    else:
+                        worker.retiring = True
+
+    def read_tasks(self, slot):
+        fd = self.task_pipes[slot][0].fileno()
+        buffer = self.task_buffers[slot]
+        try:
+            while chunk := os.read(fd, READ_SIZE):
+                buffer.feed(chunk)
+        except BlockingIOError:
+            pass
+        now = time.monotonic()
+        for message in buffer.messages():
+            self.backlog.append((slot, message, now))
+            self.received[slot] += 1
+
+    def dispatch(self):
+        """
+        把排队中的任务分配给空闲的进程
+        """
+        for worker in self.workers:
+            if not self.backlog:
+                return
+            if worker is None or worker.task is not None or worker.retiring:
+                continue
+            slot, message, submitted_at = self.backlog.popleft()
+            self.queue_slots.release()  # 任务已经出队，释放一个排队名额
+            worker.task = (slot, TASK_ID.unpack_from(message)[0], submitted_at)
+            worker.output += encode_frame(message)
+            self.flush_worker(worker)
+
+    def expire(self, now):
+        """
+        处理超时的任务：排队超时的任务直接以超时返回，执行超时的进程被强制结束并替换
+        """
+        while self.backlog and now - self.backlog[0][2] > self.task_timeout:
+            slot, message, _ = self.backlog.popleft()
+            self.queue_slots.release()
+            self.send_result(slot, encode_result(TASK_ID.unpack_from(message)[0], RESULT_TIMEOUT, "排队超时"))
+        for worker in list(self.workers):
+            if worker is not None and worker.task is not None and now - worker.task[2] > self.task_timeout:
+                print(f"进程池进程 {worker.index} (pid={worker.process.pid}) 执行任务超过 {self.task_timeout} 秒，强制结束")
+                self.replace(worker, "执行超时", RESULT_TIMEOUT)
+
+    def flush_worker(self, worker):
+        try:
+            written = os.write(worker.conn.fileno(), worker.output)
+            del worker.output[:written]
+        except BlockingIOError:
+            pass
+        except OSError:
+            return  # 进程已经退出，由退出事件处理
+        writing = bool(worker.output)
+        if writing != worker.writing:
+            worker.writing = writing
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE if writing else selectors.EVENT_READ
+            self.selector.modify(worker.conn.fileno(), events, ("worker", worker))
+
+    def read_results(self, worker):
+        try:
+            while chunk := os.read(worker.conn.fileno(), READ_SIZE):
+                worker.results.feed(chunk)
+        except BlockingIOError:
+            pass
+        except OSError:
+            return
+        for message in worker.results.messages():
+            if worker.task is not None and TASK_ID.unpack_from(message)[0] == worker.task[1]:
+                self.send_result(worker.task[0], message)
+                worker.task = None
+        if worker.task is None and worker.retiring:
+            self.replace(worker, "")
+
+    def send_result(self, slot, message):
+        self.result_buffers[slot] += encode_frame(message)
+        self.flush_results(slot)
+
+    def flush_results(self, slot):
+        buffer = self.result_buffers[slot]
+        fd = self.result_pipes[slot][1].fileno()
+        registered = self.selector.get_map().get(fd) is not None
+        try:
+            written = os.write(fd, buffer)
+            del buffer[:written]
+        except BlockingIOError:
+            pass  # HTTP 进程暂时没有读取，等待管道可写
+        if buffer and not registered:
+            self.selector.register(fd, selectors.EVENT_WRITE, ("result", slot))
+        elif not buffer and registered:
+            self.selector.unregister(fd)
+
+    def client(self, slot):
+        """
+        在 HTTP 进程中创建进程池客户端
+        :param slot: HTTP 进程的槽位编号
+        """
+        return ProcessPoolClient(self, slot)
+
+
+class ProcessPoolClient:
+    def __init__(self, pool: SharedProcessPool, slot: int):
+        """
+        HTTP 进程中的进程池客户端，负责提交任务并等待结果
+            发送线程：把任务写入本槽位的任务管道（写入可能因为管道已满而阻塞，因此不能在事件循环中直接写）
+            接收线程：从本槽位的结果管道中读取结果，并通知事件循环中等待的请求
+        :param pool: ServerManager 创建的共享进程池
+        :param slot: HTTP 进程的槽位编号
+        """
+        self.pool = pool
+        self.slot = slot
+        self.loop = None
+        self.pending = {}  # 任务 ID -> 等待结果的 Future
+        self.send_queue = queue.SimpleQueue()
+        # 任务 ID 以进程 ID 为前缀，槽位上的 HTTP 进程重启后，旧进程遗留的结果不会被误认为是新任务的结果
+        self.task_ids = itertools.count(os.getpid() << 32)
+
+    def start(self, loop):
+        """
+        启动发送线程和接收线程
+        """
+        self.loop = loop
+        threading.Thread(target=self.send_loop, name="process-pool-send", daemon=True).start()
+        threading.Thread(target=self.receive_loop, name="process-pool-receive", daemon=True).start()
+
+    async def submit(self, handler, ctx, data):
+        """
+        把 api 函数交给进程池执行，并等待执行结果
+        :param handler: api 函数的模块限定名称
+        :param ctx: 鉴权后的上下文信息
+        :param data: 请求数据
+        :return: api 函数的返回值
+        :raise ProcessPoolFull: 排队任务数量达到上限
+        :raise ProcessPoolTimeout: 超过 task_timeout 没有返回结果
+        :raise ProcessPoolTaskError: api 函数抛出异常，或者执行它的进程池进程意外退出
+        """
+        if self.loop is None:
+            self.start(asyncio.get_running_loop())
+
+        if not self.pool.queue_slots.acquire(block=False):
+            raise ProcessPoolFull("进程池排队任务数量已达上限")
+        self.pool.submitted[self.slot] += 1  # 本进程退出时没有发出的任务，由主进程归还名额
+
+        task_id = next(self.task_ids)
+        future = self.loop.create_future()
+        self.pending[task_id] = future
+        try:
+            self.send_queue.put(TASK_ID.pack(task_id) + dumps_payload((handler, ctx, data)))
+            # 分发线程会在 task_timeout 后返回超时结果，这里多等一秒，只在主进程的分发线程出现问题时生效
+            status, result = await asyncio.wait_for(future, self.pool.task_timeout + 1)
+        except asyncio.TimeoutError:
+            raise ProcessPoolTimeout(f"超过 {self.pool.task_timeout} 秒没有返回结果")
+        finally:
+            self.pending.pop(task_id, None)
+
+        if status == RESULT_TIMEOUT:
+            raise ProcessPoolTimeout(result)
+        if status != RESULT_OK:
+            raise ProcessPoolTaskError(result)
+        return result
+
+    def send_loop(self):
+        task_writer = self.pool.task_pipes[self.slot][1]
+        while True:
+            task_writer.send_bytes(self.send_queue.get())
+
+    def receive_loop(self):
+        result_reader = self.pool.result_pipes[self.slot][0]
+        while True:
+            message = result_reader.recv_bytes()
+            self.loop.call_soon_threadsafe(self.set_result, TASK_ID.unpack_from(message)[0],
+                                           loads_payload(message[TASK_ID.size:]))
+
+    def set_result(self, task_id, result):
+        future = self.pending.get(task_id)
+        if future is not None and not future.done():
+            future.set_result(result)
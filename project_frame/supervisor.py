@@ -0,0 +1,387 @@
+"""
+文件描述: 主进程中的 HTTP 进程监控器（后台任务进程使用同一个监控器，后台任务进程在单独的线程中发送心跳）
+            1. 每个 HTTP 进程在事件循环中定期把当前时间写入共享内存中自己槽位的心跳时间
+            2. 主进程定期检查：进程已经退出（异常、段错误、被 OOM 杀死）或者长时间没有心跳（事件循环被阻塞、死锁）时，
+               结束该进程并在同一个槽位上重新启动
+            3. 重启间隔按指数退避增长；一段时间内连续崩溃次数过多时判定为崩溃循环，按最大间隔重启并打印告警
+            4. 记录每个槽位的重启次数，可以通过 stats() 查看
+            5. 滚动重启：逐个槽位先启动新进程，等新进程开始接受连接后，再通知旧进程停止接受连接并排空，
+               任何时刻至少有 N-1 个 HTTP 进程在接受连接
+            6. 回收：进程累计处理的请求数量超过 max_requests（加上随机抖动，避免所有进程同时回收）或者常驻内存超过 max_rss 时，
+               先在同一个槽位上启动新进程，新进程开始接受连接后，旧进程排空再退出，内存占用不会无限增长
+            7. 自动扩缩容：槽位数量按上限创建，只启动其中一部分，scale_up / scale_down 启用或停用槽位，
+               停用的槽位上的进程收到 SIGTERM 后排空再退出
+
+创建者: 汐琳
+创建时间: 2025-01-20 10:41:52
+"""
+import asyncio
+import collections
+import multiprocessing
+import os
+import random
+import time
+
+import psutil
+
+from config import (WORKER_HEARTBEAT_INTERVAL, WORKER_HEARTBEAT_TIMEOUT, WORKER_RESTART_BACKOFF_BASE,
+                    WORKER_RESTART_BACKOFF_MAX, WORKER_CRASH_LOOP_WINDOW, WORKER_CRASH_LOOP_THRESHOLD,
+                    WORKER_READY_TIMEOUT, SHUTDOWN_TIMEOUT, WORKER_MAX_REQUESTS, WORKER_MAX_REQUESTS_JITTER,
+                    WORKER_MAX_RSS)
+
+READY_POLL_INTERVAL = 0.05  # 滚动重启时检查新进程是否就绪的间隔（秒）
+
+
+async def send_heartbeats(supervisor, slot, server=None, interval=WORKER_HEARTBEAT_INTERVAL):
+    """
+    HTTP 进程中的心跳协程，事件循环被阻塞时心跳也会停止，主进程据此判断进程是否卡死
+    同时上报负载：当前连接数量、累计处理的请求数量、合并的请求数量、因限流拒绝的请求数量，以及事件循环延迟（sleep 实际醒来的时间比预期晚了多久）
+    开始排空后停止上报，此时槽位上可能已经是新进程，排空中的旧进程由主进程按排空时限处理；
+    槽位上的新进程开始接受连接后（ready_pids 中不再是本进程）同样停止上报，避免旧进程的累计请求数量覆盖新进程的计数
+    :param supervisor: 主进程创建的 WorkerSupervisor，心跳和负载写入其中的共享数组
+    :param slot: HTTP 进程的槽位编号
+    :param server: 本进程的 HTTPServer，用于读取连接数量和请求数量
+    :param interval: 心跳间隔（秒）
+    """
+    pid = os.getpid()
+    while server is None or not server.draining:
+        now = time.monotonic()  # CLOCK_MONOTONIC 在所有进程之间是同一个时钟
+        owner = supervisor.ready_pids[slot] in (0, pid)  # 0 表示槽位上还没有进程开始接受连接（启动中或替换中）
+        if owner:
+            supervisor.heartbeats[slot] = now
+        if owner and server is not None:
+            supervisor.connection_counts[slot] = server.active_connections
+            supervisor.request_counts[slot] = server.handled_requests
+            supervisor.coalesced_counts[slot] = server.coalesced_requests
+            supervisor.rate_limited_counts[slot] = server.rate_limited_requests
+        await asyncio.sleep(interval)
+        if (server is None or not server.draining) and supervisor.ready_pids[slot] in (0, pid):
+            supervisor.loop_lags[slot] = max(time.monotonic() - now - interval, 0.0)
+
+
+class WorkerSupervisor:
+    def __init__(self, slots, start_worker, heartbeat_timeout=WORKER_HEARTBEAT_TIMEOUT,
+                 backoff_base=WORKER_RESTART_BACKOFF_BASE, backoff_max=WORKER_RESTART_BACKOFF_MAX,
+                 crash_loop_window=WORKER_CRASH_LOOP_WINDOW, crash_loop_threshold=WORKER_CRASH_LOOP_THRESHOLD,
+                 name="HTTP 进程", active_slots=None, max_requests=WORKER_MAX_REQUESTS,
+                 max_requests_jitter=WORKER_MAX_REQUESTS_JITTER, max_rss=WORKER_MAX_RSS):
+        """
+        创建心跳使用的共享内存，必须在启动 HTTP 进程之前创建，子进程才能继承
+        :param slots: HTTP 进程的槽位数量（自动扩缩容时为进程数量上限）
+        :param start_worker: 在指定槽位上创建并启动 HTTP 进程的函数，参数为槽位编号，返回已启动的进程
+        :param heartbeat_timeout: 超过该时间（秒）没有心跳的进程判定为卡死，强制结束后重启
+        :param backoff_base: 第一次重启前的等待时间（秒），之后每次连续崩溃翻倍
+        :param backoff_max: 重启前的最长等待时间（秒）
+        :param crash_loop_window: 统计连续崩溃次数的时间窗口（秒），进程稳定运行超过该时间后清零
+        :param crash_loop_threshold: 时间窗口内崩溃次数达到该值时判定为崩溃循环
+        :param name: 日志中的进程名称，例如 "HTTP 进程"、"后台任务进程"
+        :param active_slots: 启动时启用的槽位数量，None 表示全部启用
+        :param max_requests: 进程累计处理的请求数量超过该值后回收，None 表示不限制
+        :param max_requests_jitter: 每个进程的 max_requests 额外加上 0 到该值之间的随机数
+        :param max_rss: 进程的常驻内存超过该值（MB）后回收，None 表示不限制
+        """
+        self.slots = slots
+        self.start_worker = start_worker
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.crash_loop_window = crash_loop_window
+        self.crash_loop_threshold = crash_loop_threshold
+        self.name = name
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss
+
+        self.heartbeats = multiprocessing.Array("d", slots, lock=False)  # 每个槽位最近一次心跳的时间，单个 double 的读写不需要加锁
+        self.ready_pids = multiprocessing.Array("i", slots, lock=False)  # 每个槽位上已经开始接受连接的进程 ID
+        self.connection_counts = multiprocessing.Array("i", slots, lock=False)  # 每个槽位上的进程当前的连接数量
+        self.loop_lags = multiprocessing.Array("d", slots, lock=False)  # 每个槽位上的进程最近一次测量的事件循环延迟（秒）
+        self.request_counts = multiprocessing.Array("q", slots, lock=False)  # 每个槽位上的进程累计处理的请求数量
+        self.coalesced_counts = multiprocessing.Array("q", slots, lock=False)  # 每个槽位上的进程累计合并的请求数量（coalesce=True 的路由）
+        self.rate_limited_counts = multiprocessing.Array("q", slots, lock=False)  # 每个槽位上的进程累计因限流返回 429 的请求数量
+        self.request_limits = [None] * slots  # 每个槽位上的进程的请求数量上限（加上随机抖动之后）
+        self.rss_processes = {}  # pid -> psutil.Process，用于读取常驻内存
+        self.next_recycle_at = [0.0] * slots  # 回收失败后，下一次允许尝试回收的时间
+        self.recycle_counts = [0] * slots  # 每个槽位累计的回收次数
+        self.enabled = [slot < (slots if active_slots is None else active_slots) for slot in range(slots)]  # 每个槽位是否启用
+        self.retiring = []  # 已被替换或停用、正在排空的进程：(槽位, 进程, 强制结束的时间)
+        self.workers = [None] * slots  # 每个槽位当前的 HTTP 进程，等待重启时为 None
+        self.started_at = [0.0] * slots  # 每个槽位当前进程的启动时间
+        self.next_start_at = [0.0] * slots  # 每个槽位下一次允许重启的时间
+        self.restart_counts = [0] * slots  # 每个槽位累计的重启次数
+        self.recent_failures = [collections.deque() for _ in range(slots)]  # 每个槽位在时间窗口内的崩溃时间
+        self.crash_looping = [False] * slots  # 每个槽位是否处于崩溃循环中
+
+    @property
+    def processes(self):
+        """
+        当前所有存活的 HTTP 进程，包括已停用、正在排空的进程
+        """
+        return [process for process in self.workers if process is not None] + [process for _, process, _ in self.retiring]
+
+    @property
+    def active_slots(self):
+        """
+        当前启用的槽位编号
+        """
+        return [slot for slot in range(self.slots) if self.enabled[slot]]
+
+    def spawn(self, slot):
+        """
+        在指定槽位上启动 HTTP 进程，启动时间作为第一次心跳，进程启动阶段同样受心跳超时限制
+        """
+        now = time.monotonic()
+        self.reap_retiring(now, slot)
+        self.ready_pids[slot] = 0  # 新进程开始接受连接之前也需要上报心跳
+        self.heartbeats[slot] = now
+        self.started_at[slot] = now
+        self.reset_limits(slot)
+        self.workers[slot] = self.start_worker(slot)
+
+    def reset_limits(self, slot):
+        """
+        槽位上即将启动新进程，或者新进程已经替换旧进程：清零请求计数，并重新抽取该进程的请求数量上限
+        """
+        self.request_counts[slot] = 0
+        self.coalesced_counts[slot] = 0
+        self.rate_limited_counts[slot] = 0
+        if self.max_requests is not None:
+            self.request_limits[slot] = self.max_requests + random.randint(0, self.max_requests_jitter or 0)
+
+    def start_all(self):
+        for slot in self.active_slots:
+            self.spawn(slot)
+
+    def check(self):
+        """
+        检查一遍所有槽位：重启到期的槽位，结束卡死的进程，回收已经退出的进程并安排重启
+        """
+        now = time.monotonic()
+        self.reap_retiring(now)
+        recycled = False
+        for slot, process in enumerate(self.workers):
+            if process is None:
+                if self.enabled[slot] and now >= self.next_start_at[slot]:
+                    self.spawn(slot)
+                continue
+
+            if process.is_alive():
+                if now - self.heartbeats[slot] <= self.heartbeat_timeout:
+                    # 进程稳定运行超过时间窗口后，清除之前的崩溃记录
+                    if self.recent_failures[slot] and now - self.started_at[slot] > self.crash_loop_window:
+                        self.recent_failures[slot].clear()
+                        self.crash_looping[slot] = False
+                    # 每次检查最多回收一个进程，避免多个进程同时排空
+                    if not recycled and now >= self.next_recycle_at[slot]:
+                        reason = self.recycle_reason(slot, process)
+                        if reason:
+                            recycled = True
+                            self.recycle(slot, reason)
+                    continue
+                print(f"{self.name} {slot} (pid={process.pid}) 超过 {self.heartbeat_timeout} 秒没有心跳，强制结束")
+                process.kill()
+
+            process.join()  # 回收已经退出的进程，避免产生僵尸进程
+            print(f"{self.name} {slot} (pid={process.pid}) 已退出，退出码: {process.exitcode}")
+            self.workers[slot] = None
+            self.schedule_restart(slot, now)
+
+    def schedule_restart(self, slot, now):
+        """
+        按指数退避计算重启时间，时间窗口内崩溃次数过多时判定为崩溃循环
+        """
+        failures = self.recent_failures[slot]
+        while failures and now - failures[0] > self.crash_loop_window:
+            failures.popleft()
+        failures.append(now)
+        self.restart_counts[slot] += 1
+
+        delay = min(self.backoff_base * 2 ** (len(failures) - 1), self.backoff_max)
+        if len(failures) >= self.crash_loop_threshold:
+            delay = self.backoff_max
+            if not self.crash_looping[slot]:
+                self.crash_looping[slot] = True
+                print(f"{self.name} {slot} 在 {self.crash_loop_window} 秒内崩溃了 {len(failures)} 次，"
+                      f"判定为崩溃循环，之后每 {delay} 秒重启一次")
+        else:
+            self.crash_looping[slot] = False
+
+        self.next_start_at[slot] = now + delay
+        print(f"{self.name} {slot} 将在 {delay:.1f} 秒后重启（累计重启 {self.restart_counts[slot]} 次）")
+
+    def recycle_reason(self, slot, process):
+        """
+        判断进程是否需要回收
+        :return: 回收原因，不需要回收时返回 None
+        """
+        request_limit = self.request_limits[slot]
+        if request_limit is not None and self.request_counts[slot] >= request_limit:
+            return f"累计处理 {self.request_counts[slot]} 个请求，超过上限 {request_limit}"
+        if self.max_rss is not None:
+            rss_process = self.rss_processes.get(process.pid)
+            if rss_process is None:
+                # 只保留当前进程的记录，已经退出的进程不再需要
+                live_pids = {worker.pid for worker in self.workers if worker is not None}
+                self.rss_processes = {pid: item for pid, item in self.rss_processes.items() if pid in live_pids}
+                rss_process = self.rss_processes[process.pid] = psutil.Process(process.pid)
+            try:
+                rss = rss_process.memory_info().rss / (1024 * 1024)
+            except psutil.NoSuchProcess:
+                return None
+            if rss > self.max_rss:
+                return f"常驻内存 {rss:.0f}MB，超过上限 {self.max_rss}MB"
+        return None
+
+    def recycle(self, slot, reason, ready_timeout=WORKER_READY_TIMEOUT, drain_timeout=SHUTDOWN_TIMEOUT):
+        """
+        回收槽位上的进程：先启动新进程，新进程开始接受连接后，旧进程停止接受连接并在后台排空，由 check 回收
+        新进程启动失败时继续使用旧进程，等待最长重启间隔后再尝试
+        """
+        print(f"{self.name} {slot} (pid={self.workers[slot].pid}) {reason}，开始回收")
+        old_process = self.replace_worker(slot, ready_timeout)
+        if old_process is None:
+            self.next_recycle_at[slot] = time.monotonic() + self.backoff_max
+            return
+        self.recycle_counts[slot] += 1
+        self.retire(slot, old_process, drain_timeout)
+        print(f"{self.name} {slot} 已替换为新进程 (pid={self.workers[slot].pid})，旧进程 (pid={old_process.pid}) 排空后退出")
+
+    def replace_worker(self, slot, ready_timeout=WORKER_READY_TIMEOUT):
+        """
+        在槽位上启动新进程，等待新进程开始接受连接后替换槽位上的进程，旧进程仍在运行，由调用方负责结束
+        :param ready_timeout: 等待新进程开始接受连接的时限（秒）
+        :return: 被替换的旧进程；新进程没有正常启动时返回 None，槽位上仍然是旧进程
+        """
+        old_process = self.workers[slot]
+        # 新进程会使用槽位上上一个旧进程的资源（例如进程池管道），该进程仍在排空时强制结束
+        self.reap_retiring(time.monotonic(), slot)
+        old_ready_pid = self.ready_pids[slot]
+        self.ready_pids[slot] = 0
+        new_process = self.start_worker(slot)
+
+        deadline = time.monotonic() + ready_timeout
+        while self.ready_pids[slot] != new_process.pid:
+            if not new_process.is_alive() or time.monotonic() > deadline:
+                print(f"{self.name} {slot} 的新进程 (pid={new_process.pid}) 没有正常启动，继续使用旧进程")
+                new_process.kill()
+                new_process.join()
+                self.ready_pids[slot] = old_ready_pid  # 旧进程继续上报心跳和计数
+                return None
+            time.sleep(READY_POLL_INTERVAL)
+
+        # 新进程已经开始接受连接，旧进程不再上报计数，此时才清零，否则旧进程的累计请求数量会让新进程立即被回收
+        self.reset_limits(slot)
+        now = time.monotonic()
+        self.heartbeats[slot] = now
+        self.started_at[slot] = now
+        self.workers[slot] = new_process
+        return old_process
+
+    def scale_up(self):
+        """
+        启用编号最小的停用槽位，并在该槽位上启动进程
+        :return: 启用的槽位编号，所有槽位都已启用时返回 None
+        """
+        for slot in range(self.slots):
+            if not self.enabled[slot]:
+                self.enabled[slot] = True
+                self.recent_failures[slot].clear()
+                self.crash_looping[slot] = False
+                self.spawn(slot)
+                return slot
+        return None
+
+    def scale_down(self, drain_timeout=SHUTDOWN_TIMEOUT):
+        """
+        停用编号最大的启用槽位，通过 SIGTERM 通知该槽位上的进程停止接受新连接，排空后退出
+        :param drain_timeout: 等待进程排空的时限（秒），超时后在 check 中强制结束
+        :return: 停用的槽位编号，只剩一个启用的槽位时返回 None
+        """
+        active_slots = self.active_slots
+        if len(active_slots) <= 1:
+            return None
+        slot = active_slots[-1]
+        self.enabled[slot] = False
+        process = self.workers[slot]
+        self.workers[slot] = None
+        self.ready_pids[slot] = 0
+        self.connection_counts[slot] = 0
+        self.loop_lags[slot] = 0.0
+        if process is not None:
+            self.retire(slot, process, drain_timeout)
+        return slot
+
+    def retire(self, slot, process, drain_timeout=SHUTDOWN_TIMEOUT):
+        """
+        通过 SIGTERM 通知进程停止接受新连接，在后台排空后退出，由 check 回收，不阻塞主进程
+        :param drain_timeout: 等待进程排空的时限（秒），超时后在 check 中强制结束
+        """
+        process.terminate()
+        self.retiring.append((slot, process, time.monotonic() + drain_timeout))
+
+    def reap_retiring(self, now, slot=None):
+        """
+        回收已经排空退出的停用进程，超过排空时限的进程强制结束
+        :param slot: 只处理该槽位上的进程，并且不等待排空时限，直接强制结束仍在排空的进程
+        """
+        still_retiring = []
+        for retiring_slot, process, kill_at in self.retiring:
+            if slot is not None and retiring_slot != slot:
+                still_retiring.append((retiring_slot, process, kill_at))
+                continue
+            if process.is_alive() and (now > kill_at or slot is not None):
+                reason = "超过排空时限没有退出" if now > kill_at else "还没有排空，槽位上要启动新进程"
+                print(f"{self.name} {retiring_slot} 的旧进程 (pid={process.pid}) {reason}，强制结束")
+                process.kill()
+                process.join()
+            elif process.is_alive():
+                still_retiring.append((retiring_slot, process, kill_at))
+            else:
+                process.join()
+        self.retiring = still_retiring
+
+    def mark_ready(self, slot, pid):
+        """
+        在 HTTP 进程中调用，通知主进程本进程已经开始接受连接
+        """
+        self.ready_pids[slot] = pid
+
+    def rolling_restart(self, ready_timeout=WORKER_READY_TIMEOUT, drain_timeout=SHUTDOWN_TIMEOUT):
+        """
+        逐个槽位滚动重启所有 HTTP 进程，某个槽位的新进程启动失败时停止滚动重启，其余槽位继续使用旧进程
+        :param ready_timeout: 等待新进程开始接受连接的时限（秒）
+        :param drain_timeout: 等待旧进程排空后退出的时限（秒），超时后强制结束
+        :return: 是否所有槽位都已经替换为新进程
+        """
+        for slot in self.active_slots:
+            old_process = self.workers[slot]
+            if old_process is None:
+                continue  # 等待重启的槽位，由 check 按计划启动新进程
+            if self.replace_worker(slot, ready_timeout) is None:  # 新进程没有正常启动
+                print(f"停止滚动重启，{self.name} {slot} 继续使用旧进程")
+                return False
+
+            # 与回收相同，旧进程在后台排空，超过排空时限后由 check 强制结束，主进程不等待
+            self.retire(slot, old_process, drain_timeout)
+            print(f"{self.name} {slot} 已替换为新进程 (pid={self.workers[slot].pid})，旧进程 (pid={old_process.pid}) 排空后退出")
+        return True
+
+    def stats(self):
+        """
+        每个槽位的运行状态和重启次数
+        """
+        return [
+            {
+                "slot": slot,
+                "enabled": self.enabled[slot],
+                "pid": process.pid if process is not None else None,
+                "alive": process is not None and process.is_alive(),
+                "restarts": self.restart_counts[slot],
+                "recycles": self.recycle_counts[slot],
+                "requests": self.request_counts[slot],
+                "coalesced": self.coalesced_counts[slot],
+                "rate_limited": self.rate_limited_counts[slot],
+                "crash_looping": self.crash_looping[slot],
+            }
+            for slot, process in enumerate(self.workers)
+        ]
@@ -0,0 +1,113 @@
+"""
+文件描述: 请求分发的微基准测试，测量每个请求找到 api 函数及其处理信息的开销，对比：
+                旧版：按路由、请求方法两层查找 route_handlers，再按函数名称查找 api 函数字典、按 (路由, 请求方法) 查找预编码的响应头，
+                      最后从路由信息字典中逐个读取鉴权标记、执行方式等
+                分发表：Router.match 一次查找得到 DispatchEntry，直接读取属性
+            运行方式（项目根目录下）: python -m script.benchmark_dispatch [路由数量] [查找次数]
+
+创建者: 汐琳
+创建时间: 2025-01-30 14:36:20
+"""
+import sys
+import time
+
+from decoratorFunc.getFuncDict import handler_name
+from http_frame.dispatch_table import build_dispatch_table
+from http_frame.router import Router
+from http_frame.send_http_response import encode_header_block, DEFAULT_HEADERS
+
+ROUTES = 1000  # 生成的路由数量
+ROUNDS = 200000  # 每种方式的查找次数
+MODULES = 50  # 路由分布在多少个模块中
+REPEAT = 5  # 重复测量的次数，取最快的一次，减少其他进程的干扰
+
+
+def api_func(ctx, data):
+    return {"code": 200, "message": "OK", "body": {}}
+
+
+def build_routes(routes):
+    """
+    生成路由信息和 api 函数字典，旧版按函数名称、分发表按模块限定名称存储 api 函数
+    :return: (route_handlers, 旧版 api 函数字典, 旧版响应头字典, 按模块限定名称存储的 api 函数字典)
+    """
+    route_handlers, legacy_funcs, legacy_header_blocks, funcs = {}, {}, {}, {}
+    for index in range(routes):
+        path, method = f"/module_{index % MODULES}/route_{index}", "GET" if index % 2 else "POST"
+        func_name, module_path = f"handle_{index}", f"api_func_set.module_{index % MODULES}"
+        route_handlers[path] = {method: {
+            "token_required": index % 3 == 0,
+            "role_required": False,
+            "response_headers": None,
+            "constant_response": False,
+            "execution_mode": "inline",
+            "compress": True,
+            "compression_cache": False,
+            "module_path": module_path,
+            "func_name": func_name,
+            "handler": handler_name(module_path, func_name),
+        }}
+        legacy_funcs[func_name] = api_func
+        legacy_header_blocks[(path, method)] = encode_header_block(DEFAULT_HEADERS)
+        funcs[handler_name(module_path, func_name)] = api_func
+    return route_handlers, legacy_funcs, legacy_header_blocks, funcs
+
+
+def legacy_dispatch(route_handlers, api_func_dict, header_blocks, path, method):
+    """
+    旧版 handle_request 中找到 api 函数及其处理信息的逻辑（仅用于对比）
+    """
+    api_func_info = route_handlers.get(path, {}).get(method, {})
+    api_func = api_func_dict[api_func_info.get("func_name")]
+    header_block = header_blocks[(path, method)]
+    return (api_func, header_block, api_func_info.get("token_required"), api_func_info.get("role_required"),
+            api_func_info.get("execution_mode", "inline"), api_func_info.get("constant_response"),
+            api_func_info.get("compress", True))
+
+
+def table_dispatch(router, path, method):
+    """
+    使用分发表的 handle_request 中对应的逻辑
+    """
+    status, entry, route_result = router.match(path, method)
+    return (entry.func, entry.header_block, entry.token_required, entry.role_required,
+            entry.execution_mode, entry.constant_response, entry.compress)
+
+
+def measure(func, requests, rounds):
+    """
+    :return: 每次查找的平均耗时（纳秒），REPEAT 次测量中最快的一次
+    """
+    count = len(requests)
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter_ns()
+        for index in range(rounds):
+            path, method = requests[index % count]
+            func(path, method)
+        timings.append((time.perf_counter_ns() - start) / rounds)
+    return min(timings)
+
+
+def main():
+    routes = int(sys.argv[1]) if len(sys.argv) > 1 else ROUTES
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else ROUNDS
+
+    route_handlers, legacy_funcs, legacy_header_blocks, funcs = build_routes(routes)
+    start = time.perf_counter()
+    router = Router(build_dispatch_table(route_handlers, funcs))
+    build_ms = (time.perf_counter() - start) * 1000
+
+    requests = [(path, method) for path, methods in route_handlers.items() for method in methods]
+    legacy = lambda path, method: legacy_dispatch(route_handlers, legacy_funcs, legacy_header_blocks, path, method)
+    table = lambda path, method: table_dispatch(router, path, method)
+    assert all(legacy(path, method) == table(path, method) for path, method in requests)
+
+    print(f"路由: {routes} 个（{MODULES} 个模块）  分发表生成耗时 {build_ms:.1f}ms  查找 {rounds} 次")
+    print(f"{'方式':<10}{'每次查找 (ns)':>14}")
+    print(f"{'旧版':<10}{measure(legacy, requests, rounds):>14.0f}")
+    print(f"{'分发表':<10}{measure(table, requests, rounds):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+文件描述: 多进程监听策略的基准测试，分别以 reuseport 和 inherit 模式启动多个 HTTP 进程，
+            客户端每个请求都建立新连接，统计每个 HTTP 进程 accept 的连接数量（分配是否均匀）和整体吞吐量
+            运行方式（项目根目录下）: python -m script.benchmark_listener [HTTP 进程数量] [请求数量] [并发数]
+
+创建者: 汐琳
+创建时间: 2025-01-17 16:22:10
+"""
+import asyncio
+import collections
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+from http_frame.listener import create_listen_socket, resolve_listener_mode
+from http_frame.server import HTTPServer
+
+WORKERS = 4  # HTTP 进程数量
+REQUESTS = 20000  # 每种模式发送的请求数量
+CONCURRENCY = 64  # 客户端并发连接数量
+
+REQUEST = b"GET /pid HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n"
+
+
+def handle_pid(ctx, data):
+    """
+    返回处理本次请求的 HTTP 进程 ID
+    """
+    return {"code": 200, "message": "OK", "body": {"pid": os.getpid()}}
+
+
+ROUTE_HANDLERS = {"/pid": {"GET": {"token_required": False, "execution_mode": "inline", "func_name": "handle_pid"}}}
+API_FUNC_DICT = {"handle_pid": handle_pid}
+
+
+def get_free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def run_worker(port, listen_socket, reuse_port):
+    server = HTTPServer(port, ROUTE_HANDLERS, API_FUNC_DICT, listen_socket=listen_socket, reuse_port=reuse_port)
+    asyncio.run(server.start())
+
+
+async def send_requests(port, total, concurrency):
+    """
+    并发发送请求，每个请求使用一个新连接
+    :return: (每个 HTTP 进程处理的请求数量, 耗时秒数)
+    """
+    counts = collections.Counter()
+    remaining = iter(range(total))
+
+    async def client():
+        for _ in remaining:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(REQUEST)
+            response = await reader.read()
+            writer.close()
+            pid = response.rpartition(b'"pid": ')[2].rstrip(b"}")
+            counts[int(pid)] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return counts, time.perf_counter() - start
+
+
+def wait_until_listening(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"端口 {port} 没有开始监听")
+
+
+def benchmark(listener_mode, workers, total, concurrency):
+    port = get_free_port()
+    listen_socket = create_listen_socket(port, 1024) if listener_mode == "inherit" else None
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(port, listen_socket, listener_mode == "reuseport"), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        wait_until_listening(port)
+        time.sleep(0.5)  # 等待所有 HTTP 进程都开始监听
+        counts, elapsed = asyncio.run(send_requests(port, total, concurrency))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        if listen_socket:
+            listen_socket.close()
+
+    per_worker = [counts.get(process.pid, 0) for process in processes]
+    mean = statistics.mean(per_worker)
+    spread = statistics.pstdev(per_worker) / mean * 100 if mean else 0.0
+    print(f"{listener_mode:<10}{total / elapsed:>12.0f}{spread:>14.1f}%   {per_worker}")
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else REQUESTS
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else CONCURRENCY
+
+    print(f"HTTP 进程: {workers}  请求: {total}  并发: {concurrency}")
+    print(f"{'模式':<10}{'吞吐 (req/s)':>12}{'分配偏差 (CV)':>15}   每个进程处理的连接数")
+    modes = ["inherit"]
+    if resolve_listener_mode("reuseport") == "reuseport":
+        modes.insert(0, "reuseport")
+    for listener_mode in modes:
+        benchmark(listener_mode, workers, total, concurrency)
+
+
+if __name__ == "__main__":
+    main()
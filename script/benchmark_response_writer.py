@@ -0,0 +1,120 @@
+"""
+文件描述: 响应发送路径的微基准测试，对比旧版 send_http_response（每次拼接字符串 + 两次 write）
+            和新版预编码响应头 + 单次 writelines 的发送方式，统计每个请求的耗时和内存分配
+            运行方式（项目根目录下）: python -m script.benchmark_response_writer
+
+创建者: 汐琳
+创建时间: 2025-01-08 11:02:45
+"""
+import asyncio
+import json
+import time
+import tracemalloc
+
+from http_frame.send_http_response import (write_response, encode_status_line, encode_header_block,
+                                           encode_connection_block, encode_body, DEFAULT_HEADERS)
+
+ROUNDS = 50000  # 每个用例的发送次数
+BODY = {"ctx": {}, "data": {"a": ["1"]}, "message": "Hello, world!"}
+
+
+class FakeWriter:
+    """
+    模拟 asyncio.StreamWriter，只统计写入的字节数，不做真正的网络发送
+    """
+
+    def __init__(self):
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+
+    def writelines(self, data):
+        for item in data:
+            self.bytes_written += len(item)
+
+    async def drain(self):
+        pass
+
+
+def create_header(content_type="application/json", **other_info):
+    header_info = {"Content-Type": content_type}
+    if other_info:
+        header_info.update(other_info)
+    return header_info
+
+
+async def legacy_send(writer, body, constant_body=None):
+    """
+    旧版发送逻辑（仅用于对比）：每次请求创建响应头字典、拼接字符串、编码，并调用两次 write
+    """
+    headers = create_header()
+    headers["Connection"] = "keep-alive"
+    headers["Keep-Alive"] = ", ".join([f"timeout={5}", f"max={99}"])
+    status_line = f"HTTP/1.1 {200} {'this is a message'}\r\n"
+    body_bytes = json.dumps(body, ensure_ascii=False).encode()
+    headers["Content-Length"] = str(len(body_bytes))
+    header_lines = ""
+    for header_name, header_value in headers.items():
+        header_lines += f"{header_name}: {header_value}\r\n"
+    response = status_line + header_lines + "\r\n"
+    writer.write(response.encode())
+    writer.write(body_bytes)
+    await writer.drain()
+
+
+HEADER_BLOCK = encode_header_block(DEFAULT_HEADERS)  # 启动时为路由预编码的响应头
+
+
+async def new_send(writer, body, constant_body=None):
+    """
+    新版发送逻辑：状态行、响应头均来自缓存，只序列化响应体，一次 writelines 发送
+    """
+    body_bytes = constant_body if constant_body is not None else encode_body(body)
+    write_response(writer, encode_status_line(200, "this is a message"), HEADER_BLOCK,
+                   encode_connection_block(True, 5, 99), body_bytes)
+    await writer.drain()
+
+
+async def measure(send, constant_body=None):
+    """
+    返回 (每个请求耗时微秒, 每个请求分配的内存峰值字节数)
+    """
+    writer = FakeWriter()
+    for _ in range(100):  # 预热缓存
+        await send(writer, BODY, constant_body)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await send(writer, BODY, constant_body)
+    elapsed_us = (time.perf_counter() - start) / ROUNDS * 1e6
+
+    # 统计单次请求中分配的内存峰值
+    rounds = 1000
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(rounds):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        await send(writer, BODY, constant_body)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - before
+    tracemalloc.stop()
+    return elapsed_us, peak_total / rounds
+
+
+async def main():
+    constant_body = encode_body(BODY)
+    cases = {
+        "旧版 send_http_response": (legacy_send, None),
+        "新版预编码 + writelines": (new_send, None),
+        "新版 + 固定响应体缓存": (new_send, constant_body),
+    }
+    print(f"{'用例':<26}{'耗时 (us)':>12}{'峰值分配 (B)':>14}")
+    for name, (send, body_cache) in cases.items():
+        elapsed_us, peak_bytes = await measure(send, body_cache)
+        print(f"{name:<26}{elapsed_us:>12.2f}{peak_bytes:>14.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
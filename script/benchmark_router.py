@@ -0,0 +1,98 @@
+"""
+文件描述: 路由匹配的微基准测试，生成大量静态路由和带参数的路由，对比旧版的字典精确查找（不支持路径参数）和 Router.match
+            测量静态路由命中、参数路由命中、404、405 四种情况下每次匹配的耗时
+            运行方式（项目根目录下）: python -m script.benchmark_router [资源数量] [每种情况的匹配次数]
+
+创建者: 汐琳
+创建时间: 2025-01-29 14:18:06
+"""
+import sys
+import time
+import uuid
+
+from http_frame.dispatch_table import build_dispatch_table
+from http_frame.router import Router, ROUTE_FOUND
+
+RESOURCES = 300  # 生成的资源数量，每个资源 4 个路由
+ROUNDS = 200000  # 每种情况的匹配次数
+
+
+def build_route_handlers(resources):
+    """
+    每个资源生成 /resource_i、/resource_i/{item_id:int}、/resource_i/{item_id:int}/tags/{tag}、/resource_i/files/{file_path:path}
+    """
+    route_handlers = {}
+
+    def add(path, *methods):
+        route_handlers[path] = {
+            method: {"func_name": f"{method.lower()}_{path}", "handler": f"api_func_set.bench.{method.lower()}_{path}"}
+            for method in methods
+        }
+
+    for index in range(resources):
+        add(f"/resource_{index}", "GET", "POST")
+        add(f"/resource_{index}/{{item_id:int}}", "GET", "PUT", "DELETE")
+        add(f"/resource_{index}/{{item_id:int}}/tags/{{tag}}", "GET")
+        add(f"/resource_{index}/files/{{file_path:path}}", "GET")
+    add("/objects/{object_id:uuid}", "GET")
+    return route_handlers
+
+
+def legacy_match(route_handlers, path, method):
+    """
+    旧版的路由查找逻辑（仅用于对比）：只能精确匹配路由，404 和 405 都表现为找不到 api 函数
+    """
+    return route_handlers.get(path, {}).get(method, {})
+
+
+def measure(func, requests, rounds):
+    """
+    :return: 每次匹配的平均耗时（纳秒）
+    """
+    count = len(requests)
+    start = time.perf_counter_ns()
+    for index in range(rounds):
+        path, method = requests[index % count]
+        func(path, method)
+    return (time.perf_counter_ns() - start) / rounds
+
+
+def main():
+    resources = int(sys.argv[1]) if len(sys.argv) > 1 else RESOURCES
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else ROUNDS
+
+    route_handlers = build_route_handlers(resources)
+    start = time.perf_counter()
+    router = Router(build_dispatch_table(route_handlers, {}))
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    step = max(resources // 50, 1)
+    cases = {
+        "静态路由": [(f"/resource_{i}", "GET") for i in range(0, resources, step)],
+        "参数路由 int": [(f"/resource_{i}/{i * 7}", "PUT") for i in range(0, resources, step)],
+        "参数路由 int+str": [(f"/resource_{i}/{i}/tags/tag_{i}", "GET") for i in range(0, resources, step)],
+        "参数路由 path": [(f"/resource_{i}/files/a/b/{i}.txt", "GET") for i in range(0, resources, step)],
+        "参数路由 uuid": [(f"/objects/{uuid.uuid4()}", "GET") for _ in range(50)],
+        "404": [(f"/resource_{i}/not_an_int", "GET") for i in range(0, resources, step)],
+        "405": [(f"/resource_{i}", "DELETE") for i in range(0, resources, step)],
+    }
+
+    # 检查匹配结果是否正确
+    for name, requests in cases.items():
+        for path, method in requests:
+            status = router.match(path, method)[0]
+            expected = int(name) if name.isdigit() else ROUTE_FOUND
+            assert status == expected, (name, path, method, status)
+
+    print(f"路由: {sum(len(methods) for methods in route_handlers.values())} 个（{len(route_handlers)} 个路径），"
+          f"编译耗时 {compile_ms:.1f}ms  每种情况匹配 {rounds} 次")
+    print(f"{'情况':<18}{'字典查找 (ns)':>14}{'Router (ns)':>14}")
+    for name, requests in cases.items():
+        legacy_ns = measure(lambda path, method: legacy_match(route_handlers, path, method), requests, rounds)
+        router_ns = measure(router.match, requests, rounds)
+        # 旧版只支持静态路由，其他情况下的字典查找只是找不到结果的耗时，仅作参考
+        print(f"{name:<18}{legacy_ns:>14.0f}{router_ns:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+文件描述: 启动时间的基准测试，在临时目录中生成一个包含大量 api 模块的 api_func_set，分别测量以下几种情况下
+            import_all_functions_in_folder 的耗时（每次都在新的 Python 进程中运行，模块没有被引入过）：
+                完整扫描：没有路由清单，遍历文件夹、引入所有模块并写入清单
+                清单有效：按清单引入模块
+                修改时间变化：所有文件被 touch 过但内容没有变化，需要比较内容哈希
+                懒加载：用 ast 静态扫描路由，不引入模块（没有清单 / 清单有效）
+            运行方式（项目根目录下）: python -m script.benchmark_startup [模块数量] [每个模块的路由数量] [重复次数]
+
+创建者: 汐琳
+创建时间: 2025-01-27 16:40:02
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MODULES = 300  # 生成的 api 模块数量
+ROUTES_PER_MODULE = 5  # 每个模块中的路由数量
+REPEAT = 5  # 每种情况重复运行的次数，取中位数
+PACKAGES = 10  # 模块分布在多少个子包中
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+MODULE_TEMPLATE = '''import json
+from decoratorFunc.getFuncDict import get_func_dict
+
+DEFAULT_BODY = {{"module": "{module}"}}
+'''
+
+ROUTE_TEMPLATE = '''
+
+@get_func_dict("/{module}/route_{index}", method="{method}", token_required={token_required})
+def handle_{module}_{index}(ctx, data):
+    body = dict(DEFAULT_BODY)
+    body["data"] = json.dumps(data)
+    return {{"code": 200, "message": "OK", "body": body}}
+'''
+
+# 在新的 Python 进程中测量引入所有 api 函数的耗时
+MEASURE_CODE = '''
+import sys, time
+start = time.perf_counter()
+from decoratorFunc.getFuncDict import route_handlers
+if sys.argv[2] == "lazy":
+    from script.lazy_import import discover_functions_in_folder
+    functions = discover_functions_in_folder("api_func_set", manifest_path=sys.argv[1] or None).function_modules
+else:
+    from script.traverse_folder import import_all_functions_in_folder
+    functions = import_all_functions_in_folder("api_func_set", manifest_path=sys.argv[1] or None)
+elapsed = time.perf_counter() - start
+print(elapsed, len(functions), sum(len(methods) for methods in route_handlers.values()))
+'''
+
+
+def generate_tree(root, modules, routes_per_module):
+    """
+    在 root 下生成 api_func_set 包，模块平均分布在 PACKAGES 个子包中
+    """
+    api_folder = root / "api_func_set"
+    api_folder.mkdir()
+    (api_folder / "__init__.py").write_text("")
+    for package_index in range(PACKAGES):
+        package = api_folder / f"package_{package_index}"
+        package.mkdir()
+        (package / "__init__.py").write_text("")
+
+    for module_index in range(modules):
+        module = f"module_{module_index}"
+        source = MODULE_TEMPLATE.format(module=module)
+        for route_index in range(routes_per_module):
+            source += ROUTE_TEMPLATE.format(module=module, index=route_index,
+                                            method="POST" if route_index % 2 else "GET",
+                                            token_required=route_index % 3 == 0)
+        (api_folder / f"package_{module_index % PACKAGES}" / f"{module}.py").write_text(source)
+
+
+def measure(root, manifest_path, mode="eager"):
+    """
+    在新的 Python 进程中运行一次，工作目录为 root，临时目录中的 api_func_set 优先于项目中的 api_func_set
+    :return: (耗时秒数, 函数数量, 路由数量)
+    """
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT))
+    output = subprocess.run([sys.executable, "-c", MEASURE_CODE, manifest_path or "", mode], cwd=root, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    elapsed, functions, routes = output.split()
+    return float(elapsed), int(functions), int(routes)
+
+
+def touch_all(root):
+    now = time.time()
+    for path in (root / "api_func_set").rglob("*.py"):
+        os.utime(path, (now, now))
+
+
+def run_case(name, root, manifest_path, repeat, prepare=None, mode="eager"):
+    timings = []
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        elapsed, functions, routes = measure(root, manifest_path, mode)
+        timings.append(elapsed)
+    print(f"{name:<14}{statistics.median(timings) * 1000:>12.1f}{min(timings) * 1000:>12.1f}{functions:>10}{routes:>10}")
+
+
+def main():
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else MODULES
+    routes_per_module = int(sys.argv[2]) if len(sys.argv) > 2 else ROUTES_PER_MODULE
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else REPEAT
+
+    root = Path(tempfile.mkdtemp(prefix="api_startup_"))
+    manifest_path = str(root / ".route_manifest.json")
+    try:
+        generate_tree(root, modules, routes_per_module)
+        measure(root, None)  # 预热：生成 __pycache__，各种情况都使用已编译的字节码
+
+        print(f"模块: {modules}  每个模块的路由: {routes_per_module}  重复: {repeat}")
+        print(f"{'情况':<14}{'中位数 (ms)':>12}{'最快 (ms)':>12}{'函数':>10}{'路由':>10}")
+
+        def remove_manifest():
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+
+        run_case("不使用清单", root, None, repeat)
+        run_case("完整扫描", root, manifest_path, repeat, prepare=remove_manifest)
+        run_case("清单有效", root, manifest_path, repeat)
+        run_case("修改时间变化", root, manifest_path, repeat, prepare=lambda: touch_all(root))
+        remove_manifest()
+        run_case("懒加载", root, None, repeat, mode="lazy")
+        run_case("懒加载+清单", root, manifest_path, repeat, mode="lazy")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+文件描述: api 模块的引入耗时报告，用于找出引入很慢的模块
+            在新的 Python 进程中以 -X importtime 引入所有 api 模块，解析解释器输出的每个模块的引入耗时：
+                api 模块：按累计耗时（包括该模块引入的所有依赖）排序
+                所有模块：按自身耗时（不包括依赖）排序，可以找到被 api 模块引入的、很慢的第三方库
+            运行方式（项目根目录下）: python -m script.import_profile [显示的模块数量]
+
+创建者: 汐琳
+创建时间: 2025-01-28 15:02:33
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+TOP = 20  # 每个列表显示的模块数量
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 按 import_all_functions_in_folder 的顺序引入所有 api 模块
+# 使用 __import__ 而不是 importlib.import_module，-X importtime 只记录经过 __import__ 的引入
+IMPORT_CODE = '''
+import os
+from pathlib import Path
+folder = Path("api_func_set")
+for py_file in folder.rglob("*.py"):
+    if py_file.name != "__init__.py":
+        __import__(f"api_func_set.{py_file.relative_to(folder).with_suffix('')}".replace(os.sep, "."))
+'''
+
+
+def collect_import_times():
+    """
+    引入一次所有 api 模块并解析 -X importtime 的输出
+    :return: [(模块名称, 自身耗时 ms, 累计耗时 ms)]
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_CODE], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"引入 api 模块失败:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        # 格式: "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表头
+        self_us, cumulative_us, module_name = int(fields[0]), int(fields[1]), fields[2].strip()
+        timings.append((module_name, self_us / 1000, cumulative_us / 1000))
+    return timings
+
+
+def print_table(title, rows):
+    print(title)
+    print(f"    {'自身 (ms)':>10}{'累计 (ms)':>12}   模块")
+    for module_name, self_ms, cumulative_ms in rows:
+        print(f"    {self_ms:>10.1f}{cumulative_ms:>12.1f}   {module_name}")
+    print()
+
+
+def main():
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else TOP
+    timings = collect_import_times()
+
+    api_modules = [row for row in timings if row[0].startswith("api_func_set.")]
+    api_self_total = sum(self_ms for _, self_ms, _ in api_modules)
+    print(f"api 模块: {len(api_modules)} 个，自身耗时合计 {api_self_total:.1f}ms；引入的所有模块: {len(timings)} 个，"
+          f"自身耗时合计 {sum(self_ms for _, self_ms, _ in timings):.1f}ms\n")
+
+    print_table(f"api 模块（按累计耗时排序，前 {top} 个）", sorted(api_modules, key=lambda row: row[2], reverse=True)[:top])
+    print_table(f"所有模块（按自身耗时排序，前 {top} 个）", sorted(timings, key=lambda row: row[1], reverse=True)[:top])
+
+
+if __name__ == "__main__":
+    main()
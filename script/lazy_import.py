@@ -0,0 +1,216 @@
+"""
+文件描述: api 函数的懒加载模式，启动时不执行 api_func_set 下的模块，只用 ast 解析源码中的装饰器得到路由信息，
+            某个 api 函数第一次被调用时（第一个请求到达时）才在当前进程中引入它所在的模块，
+            HTTP 进程在处理同步 api 函数的线程池中引入，事件循环可以继续处理其他请求
+            1. 静态扫描：解析每个模块顶层函数上的 @get_func_dict(...) / @background_job(...)，参数都是字面量时，
+               按与装饰器相同的方式（register_route / register_job）注册路由和后台任务
+            2. 无法静态解析的模块（装饰器参数使用了变量或表达式，或者以其他方式使用了装饰器）仍然在启动时引入，由装饰器正常注册；
+               定义了中间件（@middleware）的模块也在启动时引入，中间件调用链在主进程生成分发表时就需要组合
+            3. 模块在引入时执行的代码（例如 sub_test.py 中的 HandleFuncFromClient()）和占用的内存，只有部署中真正被请求的路由才会产生
+            4. 每个进程第一次引入模块时打印耗时；python -m script.import_profile 可以查看所有模块的引入耗时
+
+创建者: 汐琳
+创建时间: 2025-01-28 10:21:47
+"""
+import ast
+import importlib
+import inspect
+import os
+import sys
+import time
+from pathlib import Path
+
+from decoratorFunc.getFuncDict import get_func_dict, register_route, route_handlers, handler_name
+from decoratorFunc.getJobDict import background_job, register_job, job_handlers
+from script.route_manifest import load_manifest, build_manifest, save_manifest
+
+ROUTE_DECORATOR = "get_func_dict"
+JOB_DECORATOR = "background_job"
+MIDDLEWARE_MODULE = "decoratorFunc.getMiddlewareDict"  # 引入了中间件装饰器的模块在启动时引入
+DECORATOR_SIGNATURES = {
+    ROUTE_DECORATOR: inspect.signature(get_func_dict),
+    JOB_DECORATOR: inspect.signature(background_job),
+}
+
+
+class StaticParseError(Exception):
+    """
+    模块中的装饰器无法静态解析，需要在启动时引入该模块
+    """
+
+
+class LazyApiFuncDict(dict):
+    def __init__(self, function_modules, functions=None):
+        """
+        api 函数字典，与 import_all_functions_in_folder 返回的字典用法相同（按模块限定名称取函数），
+        取一个尚未引入的函数时才引入它所在的模块，同一个模块中的其他函数一并放入字典
+        :param function_modules: {函数的模块限定名称: 模块名称}
+        :param functions: 启动时已经引入的函数
+        """
+        super().__init__(functions or {})
+        self.function_modules = function_modules
+
+    def __missing__(self, handler):
+        module_name = self.function_modules[handler]  # 不存在的函数与普通字典一样抛出 KeyError
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        print(f"懒加载模块 {module_name}，用时 {(time.perf_counter() - start) * 1000:.1f}ms (pid={os.getpid()})")
+        for name, owner_module in self.function_modules.items():
+            if owner_module == module_name:
+                self[name] = getattr(module, name[len(module_name) + 1:])
+        return self[handler]
+
+
+def literal_call_arguments(call, decorator_name):
+    """
+    把装饰器调用的参数解析为字面量，并按装饰器的函数签名补全默认值
+    :return: {参数名: 值}
+    """
+    try:
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = {}
+        for keyword in call.keywords:
+            if keyword.arg is None:
+                raise StaticParseError(f"{decorator_name} 使用了 **kwargs")
+            kwargs[keyword.arg] = ast.literal_eval(keyword.value)
+    except ValueError as e:
+        raise StaticParseError(f"{decorator_name} 的参数不是字面量: {e}")
+    try:
+        bound = DECORATOR_SIGNATURES[decorator_name].bind(*args, **kwargs)
+    except TypeError as e:
+        raise StaticParseError(f"{decorator_name} 的参数不正确: {e}")
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def decorator_name(node):
+    """
+    装饰器表达式使用的名称，支持 @get_func_dict(...) 和 @getFuncDict.get_func_dict(...) 两种写法
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def parse_module(file_path, module_name):
+    """
+    解析单个模块中的路由和后台任务装饰器
+    :return: (路由列表, 后台任务列表)，每一项都是 register_route / register_job 的关键字参数
+    :raise StaticParseError: 模块无法静态解析
+    """
+    try:
+        tree = ast.parse(Path(file_path).read_bytes(), filename=str(file_path))
+    except SyntaxError as e:
+        raise StaticParseError(f"语法错误: {e}")
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(
+                alias.name in DECORATOR_SIGNATURES and alias.asname not in (None, alias.name) for alias in node.names):
+            raise StaticParseError("装饰器被重命名后引入")
+        if ((isinstance(node, ast.ImportFrom) and node.module == MIDDLEWARE_MODULE)
+                or (isinstance(node, ast.Import) and any(alias.name == MIDDLEWARE_MODULE for alias in node.names))):
+            raise StaticParseError("定义了中间件")
+
+    routes, jobs = [], []
+    recognized = 0  # 能够静态解析的装饰器数量
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not isinstance(decorator, ast.Call) or decorator_name(decorator.func) not in DECORATOR_SIGNATURES:
+                continue
+            name = decorator_name(decorator.func)
+            arguments = literal_call_arguments(decorator, name)
+            if name == ROUTE_DECORATOR:
+                routes.append(dict(arguments, func_name=node.name, module_path=module_name,
+                                   is_coroutine=isinstance(node, ast.AsyncFunctionDef)))
+            else:
+                jobs.append(dict(arguments, func_name=node.name, module_path=module_name,
+                                 is_coroutine=isinstance(node, ast.AsyncFunctionDef)))
+            recognized += 1
+
+    # 装饰器名称出现在顶层函数装饰器以外的地方（嵌套函数、手动调用等），静态扫描可能遗漏路由
+    references = sum(
+        1 for node in ast.walk(tree)
+        if (isinstance(node, ast.Name) and node.id in DECORATOR_SIGNATURES)
+        or (isinstance(node, ast.Attribute) and node.attr in DECORATOR_SIGNATURES)
+    )
+    if references != recognized:
+        raise StaticParseError("装饰器的使用方式无法静态解析")
+    return routes, jobs
+
+
+def discover_functions_in_folder(folder_path, reload=False, manifest_path=None):
+    """
+    懒加载模式下代替 import_all_functions_in_folder：静态扫描 api 函数文件夹，注册路由和后台任务，返回懒加载的 api 函数字典
+    :param folder_path: api 函数所在的文件夹
+    :param reload: 是否为滚动重启时的重新扫描，主进程中已经引入的模块会被移除，之后按修改后的代码重新引入
+    :param manifest_path: 路由清单文件路径，清单有效时直接使用清单中的路由信息，不再解析源码。None 表示不使用清单
+    :return: LazyApiFuncDict
+    """
+    if reload:
+        for module_name in [name for name in sys.modules if name.startswith("api_func_set.")]:
+            del sys.modules[module_name]
+    elif manifest_path:
+        manifest = load_manifest(manifest_path, folder_path, mode="lazy")
+        if manifest is not None:
+            for path, methods in manifest["route_handlers"].items():
+                route_handlers.setdefault(path, {}).update(methods)
+            job_handlers.update(manifest["job_handlers"])
+            return import_eager_modules(manifest["modules"], manifest["functions"])
+
+    folder = Path(folder_path)
+    function_modules = {}  # 函数的模块限定名称 -> 模块名称
+    eager_modules = []  # 无法静态解析、需要在启动时引入的模块
+    for py_file in folder.rglob("*.py"):  # 与 import_all_functions_in_folder 的顺序相同，同一路由重复注册时结果一致
+        if py_file.name == "__init__.py":
+            continue
+        module_name = f"api_func_set.{py_file.relative_to(folder).with_suffix('')}".replace(os.sep, ".")
+        try:
+            routes, jobs = parse_module(py_file, module_name)
+        except StaticParseError as e:
+            print(f"{module_name} 无法静态解析（{e}），启动时引入")
+            eager_modules.append(module_name)
+            continue
+
+        for func_info in routes + jobs:
+            function_modules[handler_name(module_name, func_info["func_name"])] = module_name
+        for route_info in routes:
+            register_route(**route_info)
+        for job_info in jobs:
+            register_job(**job_info)
+
+    api_func_dict = import_eager_modules(eager_modules, function_modules)
+    if manifest_path:
+        save_manifest(manifest_path, build_manifest(folder_path, eager_modules, api_func_dict.function_modules,
+                                                    route_handlers, job_handlers, mode="lazy"))
+    return api_func_dict
+
+
+def import_eager_modules(eager_modules, function_modules):
+    """
+    引入无法静态解析的模块（模块中的装饰器正常注册路由和后台任务），并创建懒加载的 api 函数字典
+    """
+    functions = {}
+    function_modules = dict(function_modules)
+    for module_name in eager_modules:
+        module = importlib.import_module(module_name)
+        for func_info in list(registered_functions(module_name)):
+            function_modules[func_info["handler"]] = module_name
+            functions[func_info["handler"]] = getattr(module, func_info["func_name"])
+    return LazyApiFuncDict(function_modules, functions)
+
+
+def registered_functions(module_name):
+    """
+    模块中由装饰器注册的路由函数和后台任务函数的信息
+    """
+    for methods in route_handlers.values():
+        for route_info in methods.values():
+            if route_info["module_path"] == module_name:
+                yield route_info
+    for job_info in job_handlers.values():
+        if job_info["module_path"] == module_name:
+            yield job_info
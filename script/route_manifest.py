@@ -0,0 +1,113 @@
+"""
+文件描述: api 函数的路由清单（manifest），缓存在磁盘上，加快项目启动
+            清单中记录 api_func_set 下每个文件的修改时间、大小和内容哈希，以及扫描得到的路由信息、后台任务信息和每个函数所在的模块
+            启动时只需要 stat 一遍文件：修改时间和大小都没有变化的文件直接认为没有修改；修改时间变化的文件再比较内容哈希
+            （例如 git checkout、touch 之后内容并没有变化）。所有文件都没有修改时清单有效，
+            import_all_functions_in_folder 按清单引入模块并取出函数，不再遍历文件夹和模块中的所有属性；
+            懒加载模式（script/lazy_import.py）直接使用清单中的路由信息，不再解析源码
+
+创建者: 汐琳
+创建时间: 2025-01-27 14:05:19
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 3  # 清单格式的版本，格式变化后旧的清单自动失效
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def stat_files(folder_path):
+    """
+    获取文件夹下所有 Python 文件（包括 __init__.py）的修改时间和大小
+    :return: {相对路径: [修改时间（纳秒）, 大小]}，相对路径使用 / 分隔
+    """
+    files = {}
+    for directory, dir_names, file_names in os.walk(folder_path):
+        dir_names[:] = [name for name in dir_names if name != "__pycache__"]
+        for file_name in file_names:
+            if file_name.endswith(".py"):
+                path = os.path.join(directory, file_name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, folder_path).replace(os.sep, "/")] = [stat.st_mtime_ns, stat.st_size]
+    return files
+
+
+def load_manifest(manifest_path, folder_path, mode="eager"):
+    """
+    读取清单并检查是否仍然有效
+    :param manifest_path: 清单文件路径
+    :param folder_path: api 函数所在的文件夹
+    :param mode: 生成清单的引入模式，"eager" 或 "lazy"，与当前模式不同的清单无效
+    :return: 有效的清单；清单不存在、格式不对或者有文件新增、删除、修改时返回 None
+    """
+    try:
+        with open(manifest_path, encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get("version") != MANIFEST_VERSION or manifest.get("folder") != str(folder_path)
+            or manifest.get("mode") != mode):
+        return None
+
+    current_files = stat_files(folder_path)
+    cached_files = manifest["files"]
+    if current_files.keys() != cached_files.keys():
+        return None
+
+    touched = False
+    for relative_path, (mtime_ns, size) in current_files.items():
+        cached_mtime_ns, cached_size, cached_hash = cached_files[relative_path]
+        if (mtime_ns, size) == (cached_mtime_ns, cached_size):
+            continue
+        if size != cached_size or file_hash(os.path.join(folder_path, relative_path)) != cached_hash:
+            return None
+        cached_files[relative_path] = [mtime_ns, size, cached_hash]  # 只有修改时间变化，内容没有变化
+        touched = True
+
+    if touched:
+        save_manifest(manifest_path, manifest)  # 记录新的修改时间，下次启动不需要再计算哈希
+    return manifest
+
+
+def build_manifest(folder_path, modules, functions, route_handlers, job_handlers, mode="eager"):
+    """
+    根据一次完整扫描的结果生成清单
+    :param folder_path: api 函数所在的文件夹
+    :param modules: 按引入顺序排列的、启动时需要引入的模块名称
+    :param functions: {函数的模块限定名称: 模块名称}
+    :param route_handlers: 路由装饰器收集的路由信息
+    :param job_handlers: 后台任务装饰器收集的任务信息
+    :param mode: 引入模式，"eager" 启动时引入所有模块，"lazy" 只引入无法静态解析的模块
+    """
+    files = {
+        relative_path: [mtime_ns, size, file_hash(os.path.join(folder_path, relative_path))]
+        for relative_path, (mtime_ns, size) in stat_files(folder_path).items()
+    }
+    return {
+        "version": MANIFEST_VERSION,
+        "folder": str(folder_path),
+        "mode": mode,
+        "files": files,
+        "modules": modules,
+        "functions": functions,
+        "route_handlers": route_handlers,
+        "job_handlers": job_handlers,
+    }
+
+
+def save_manifest(manifest_path, manifest):
+    """
+    先写入临时文件再替换，多个进程同时启动时不会读到写了一半的清单
+    """
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(temp_path, manifest_path)
+    except OSError as e:
+        print(f"写入路由清单 {manifest_path} 失败: {e}")
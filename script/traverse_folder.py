@@ -5,17 +5,32 @@
 创建时间: 2024-12-06 16:23:22
 """
 import os
+import sys
 import importlib
 import types
 from pathlib import Path
 
+from decoratorFunc.getFuncDict import handler_name
+from script.route_manifest import load_manifest, build_manifest, save_manifest
 
-def import_all_functions_in_folder(folder_path):
+
+def import_all_functions_in_folder(folder_path, reload=False, manifest_path=None):
     """
     动态导入指定文件夹及其子文件夹下的所有 Python 文件，排除 '__init__.py'。
+    :param folder_path: api 函数所在的文件夹
+    :param reload: 是否重新加载已经导入过的模块（滚动重启时在主进程中使用，读取修改后的代码）
+    :param manifest_path: 路由清单文件路径，清单有效时按清单引入模块，不再遍历文件夹；完整扫描后写入新的清单。None 表示不使用清单
+    :return: api 函数字典，key 为函数的模块限定名称（模块名称.函数名称），不同模块中可以定义同名函数
     """
+    if manifest_path and not reload:
+        manifest = load_manifest(manifest_path, folder_path)
+        if manifest is not None:
+            return import_functions_from_manifest(manifest)
+
     folder = Path(folder_path)
-    import_api_func_dict = {}  # 用于存储所有函数，按函数名称作为键
+    import_api_func_dict = {}  # 用于存储所有函数，按模块限定名称作为键
+    functions = {}  # 模块限定名称 -> 模块名称，写入清单
+    imported_modules = []  # 按引入顺序记录成功引入的模块，写入清单
 
     for py_file in folder.rglob('*.py'):
         # 排除 __init__.py 文件
@@ -28,7 +43,11 @@ def import_all_functions_in_folder(folder_path):
 
             try:
                 # 动态导入模块
-                module = importlib.import_module(module_name)
+                if reload and module_name in sys.modules:
+                    module = importlib.reload(sys.modules[module_name])
+                else:
+                    module = importlib.import_module(module_name)
+                imported_modules.append(module_name)
 
                 # 遍历模块中的所有函数，并对其进行相应的处理
                 for func_item_name in dir(module):
@@ -41,20 +60,31 @@ def import_all_functions_in_folder(folder_path):
                         func_is_decorator = getattr(func_item, "__is_decorator__", False)
 
                         if not func_is_decorator:
-                            # 由于是在全局中引入所有 api 函数，因此 api 函数的名字不能重复
-                            if func_item_name in import_api_func_dict:
-                                raise ValueError(f"{module_name} 文件中的 '{func_item_name} 函数' 已经存在，请修改函数名称")
-                            else:
-                                import_api_func_dict[func_item_name] = func_item
-
-                                # # 动态引入函数（如果未重复）
-                                # try:
-                                #     # 动态加载函数
-                                #     getattr(module, func_item_name)
-                                # except Exception as e:
-                                #     raise ImportError(f"无法导入从'{module_path}'模块中导入函数 '{func_item_name}': {e}")
+                            # 按模块限定名称存储，与装饰器注册的 handler 一致
+                            handler = handler_name(module_name, func_item_name)
+                            import_api_func_dict[handler] = func_item
+                            functions[handler] = module_name
 
             except ModuleNotFoundError as e:
                 print(f"Error importing {module_name}: {e}")
 
-    return import_api_func_dict
\ No newline at end of file
+    if manifest_path:
+        from decoratorFunc.getFuncDict import route_handlers
+        from decoratorFunc.getJobDict import job_handlers
+        save_manifest(manifest_path, build_manifest(folder_path, imported_modules, functions, route_handlers, job_handlers))
+
+    return import_api_func_dict
+
+
+def import_functions_from_manifest(manifest):
+    """
+    按清单引入模块（模块中的装饰器照常注册路由和后台任务），直接按名称取出清单中记录的函数
+    :param manifest: load_manifest 返回的有效清单
+    :return: 与 import_all_functions_in_folder 相同的函数字典
+    """
+    for module_name in manifest["modules"]:
+        importlib.import_module(module_name)
+    return {
+        handler: getattr(sys.modules[module_name], handler[len(module_name) + 1:])
+        for handler, module_name in manifest["functions"].items()
+    }
\ No newline at end of file
@@ -57,4 +57,15 @@ class Authority:
         if self.user_info:
             return_info["role"] = self.user_info
 
-        return return_info
\ No newline at end of file
+        return return_info
+
+
+def token_subject(ctx):
+    """
+    鉴权后的上下文信息中 token 对应的用户，解析后的 token 为字典时使用 sub 字段
+    :param ctx: get_decoded_info 返回的上下文信息
+    """
+    decoded_token = ctx.get("user_token")
+    if isinstance(decoded_token, dict):
+        return decoded_token.get("sub")
+    return decoded_token